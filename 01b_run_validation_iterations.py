@@ -53,6 +53,15 @@ def run_model_iteration(args):
     # Copy entire base directory to create new iteration directory
     shutil.copytree(base_dir, output_dir, dirs_exist_ok=True)
     
+    # Iterations measure the variance of the AI groupings, so never reuse memoized assignments
+    ai_config_file = os.path.join(output_dir, 'ai_config.json')
+    if os.path.exists(ai_config_file):
+        with open(ai_config_file, 'r') as f:
+            ai_config = json.load(f)
+        ai_config['assignmentMemo'] = 'never'
+        with open(ai_config_file, 'w') as f:
+            json.dump(ai_config, f, indent=2)
+    
     # Run main.py with resume flag to continue from step 3
     cmd_args = [
         sys.executable,
@@ -8,24 +8,12 @@ import seaborn as sns
 from datetime import datetime
 from scripts.validation_visualizations import generate_validation_figures
 from scripts.analyze_timing import generate_timing_summary
+from scripts.group_index import GroupIndex, load_group_index
 from collections import Counter, defaultdict
 
 def extract_species_assignments(group_dict):
     """Extract species to group assignments from nested dictionary structure"""
-    species_to_group = {}
-    
-    def recurse_dict(d, group):
-        for k, v in d.items():
-            if isinstance(v, dict):
-                if 'specCode' in v:  # This is a leaf node (species)
-                    species_to_group[k] = group
-                else:  # This is an internal node
-                    recurse_dict(v, group)
-            
-    for group, species_data in group_dict.items():
-        recurse_dict(species_data, group)
-    
-    return species_to_group
+    return GroupIndex.from_assignments(group_dict).species_to_group()
 
 def analyze_group_consistency(iteration_dirs):
     """Analyze consistency of species groupings across iterations"""
@@ -39,11 +27,8 @@ def analyze_group_consistency(iteration_dirs):
         assignments_path = os.path.join(dir_path, '03_grouped_species_assignments.json')
         if os.path.exists(assignments_path):
             try:
-                with open(assignments_path, 'r') as f:
-                    group_dict = json.load(f)
-                
-                # Extract species to group assignments
-                species_to_group = extract_species_assignments(group_dict)
+                # Extract species to group assignments (from the step 3 group index when present)
+                species_to_group = load_group_index(dir_path).species_to_group()
                 
                 if not species_to_group:
                     print(f"    Warning: No species assignments found in {assignments_path}")
@@ -1,7 +1,6 @@
 import os
 import subprocess
 import sys
-import re
 import json
 import webbrowser
 import time
@@ -21,66 +20,6 @@ def print_green(text):
 def print_red(text):
     print(f"{RED}{text}{RESET}")
 
-def check_r_packages():
-    required_packages = ['robis', 'sf', 'dplyr', 'R.utils']
-    r_script = ';'.join([f"if (!require('{pkg}')) {{ quit(status=1) }}" for pkg in required_packages])
-    result = subprocess.run(['Rscript', '-e', r_script], capture_output=True, text=True)
-    if result.returncode != 0:
-        print_red("Error: One or more required R packages are missing.")
-        print_red(f"Please install the following R packages: {', '.join(required_packages)}")
-        return False
-    return True
-
-def parse_r_error(error_message):
-    error_match = re.search(r'Error.*', error_message, re.DOTALL)
-    if error_match:
-        return error_match.group(0)
-    return error_message
-def run_r_script(script_path, shapefile_path, output_file):
-    if not check_r_packages():
-        return False
-
-    try:
-        abs_shapefile_path = os.path.abspath(shapefile_path)
-        abs_output_file = os.path.abspath(output_file)
-        print(f"Running R script with shapefile: {abs_shapefile_path}")
-        print(f"Output file: {abs_output_file}")
-        
-        if not os.path.exists(abs_shapefile_path):
-            print_red(f"Error: Shapefile not found at {abs_shapefile_path}")
-            print("Checking EwE directory contents:")
-            list_directory_contents('EwE')
-            return False
-
-        cmd = ['Rscript', '--vanilla', script_path, abs_shapefile_path, abs_output_file]
-
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        print(result.stdout)
-        
-        # Check for OBIS API errors in the output
-        if "Failed to connect to the OBIS API" in result.stdout or "Failed to connect to the OBIS API" in result.stderr:
-            print_red("OBIS API connection error detected")
-            raise RuntimeError("OBIS API connection failed")
-            
-        if result.stderr:
-            print_red("Warnings or messages:")
-            print(result.stderr)
-            
-        # Check if the output file was created and has content
-        if not os.path.exists(abs_output_file) or os.path.getsize(abs_output_file) == 0:
-            print_red("Error: Output file was not created or is empty")
-            return False
-            
-        return True
-    except subprocess.CalledProcessError as e:
-        print_red(f"Error running R script: {e}")
-        print_red("Standard output:")
-        print(e.stdout)
-        print_red("Standard error:")
-        print(parse_r_error(e.stderr))
-        return False
-
-
 def run_python_script(script_path, *args):
     if not os.path.exists(script_path):
         print_red(f"Error: {script_path} not found.")
@@ -147,22 +86,18 @@ def run_python_script(script_path, *args):
 
 
 def identify_species(geojson_path, output_file):
-    script_path = os.path.join('scripts', '01_identify_species.R')
-    if not os.path.exists(script_path):
-        print_red(f"Error: {script_path} not found.")
-        print_red(f"Current working directory: {os.getcwd()}")
-        print_red(f"Full path of script: {os.path.abspath(script_path)}")
-        return False
-    
-    return run_r_script(script_path, geojson_path, output_file)
+    script_path = os.path.join('scripts', '01_identify_species.py')
+    success = run_python_script(script_path, geojson_path, output_file)
+    # Check if the output file was created and has content
+    return success and os.path.exists(output_file) and os.path.getsize(output_file) > 0
 
 def generate_ai_groups(output_dir):
     script_path = os.path.join('scripts', '00_generate_ai_groups.py')
     return run_python_script(script_path, '--output_dir', output_dir)
 
-def harvest_sealifebase_data(species_file, output_dir):
+def harvest_sealifebase_data(species_file, output_dir, verbose=False):
     script_path = os.path.join('scripts', '02_download_data.py')
-    return run_python_script(script_path, species_file, output_dir)
+    return run_python_script(script_path, species_file, output_dir, *(['--verbose'] if verbose else []))
 
 def group_species(excel_file, output_dir, force_grouping):
     script_path = os.path.join('scripts', '03_group_species.py')
@@ -174,9 +109,9 @@ def group_species(excel_file, output_dir, force_grouping):
     ]
     return success and all(os.path.exists(f) for f in output_files)
 
-def gather_diet_data(output_dir):
+def gather_diet_data(output_dir, verbose=False):
     script_path = os.path.join('scripts', '04_gather_diet_data.py')
-    success = run_python_script(script_path, output_dir)
+    success = run_python_script(script_path, output_dir, *(['--verbose'] if verbose else []))
     # Check if output file was created to determine success
     output_file = os.path.join(output_dir, "04d_diet_summaries.json")
     return success and os.path.exists(output_file)
@@ -261,8 +196,9 @@ def update_progress(output_dir, step, success, timing=None):
         with open(progress_file, 'r') as f:
             progress = json.load(f)
     
-    # Update step status
+    # Update step status, keeping details the step itself recorded (e.g. per-source timing)
     progress[step] = {
+        **progress.get(step, {}),
         'success': success,
         'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
@@ -297,6 +233,8 @@ def parse_arguments():
     parser.add_argument('--resume', action='store_true', help='Resume processing from last successful step')
     parser.add_argument('--early_stop', default=5, type=int, help='Stop after specified step number (0-7)')
     parser.add_argument('--force_grouping', action='store_true', help='Force grouping without adding new groups to reference groups')
+    parser.add_argument('--weight_by_occurrence', action='store_true', help='Pick the representative species of each group in step 4 by OBIS occurrence counts')
+    parser.add_argument('--verbose', action='store_true', help='Log per-species detail in steps 2 and 4 (raw GLOBI responses, diet records)')
     return parser.parse_args()
 
 def process_input_file(input_path, output_dir):
@@ -348,6 +286,7 @@ def main():
             'eweParamsAI': args.ewe_params_ai,
             'ragSearchAI': args.rag_search_ai,
             'forceGrouping': args.force_grouping,
+            'weightByOccurrence': args.weight_by_occurrence,
             'researchFocus': args.research_focus
         }
         
@@ -388,6 +327,7 @@ def main():
     print(f"EwE Parameters AI: {ai_config['eweParamsAI']}")
     print(f"RAG Search AI: {ai_config['ragSearchAI']}")
     print(f"Force Grouping: {ai_config.get('forceGrouping', False)}")
+    print(f"Weight By Occurrence: {ai_config.get('weightByOccurrence', False)}")
     print(f"Research Focus: {ai_config.get('researchFocus', '')}")
 
     species_output = os.path.join(output_dir, '01_species_list.csv')
@@ -397,9 +337,9 @@ def main():
 
 
 
-    # Step 1: Identify Species (R version)
+    # Step 1: Identify Species
     if not progress.get('identify_species', {}).get('success'):
-        print_green("\nStep 1: Identifying Species (R version)")
+        print_green("\nStep 1: Identifying Species")
         start_time = time.time()
 
         success = identify_species(geojson_path, species_output)
@@ -419,7 +359,7 @@ def main():
     if not progress.get('harvest_sealifebase_data', {}).get('success'):
         print_green("Step 2: Harvesting Databases")
         start_time = time.time()
-        success = harvest_sealifebase_data(species_output, output_dir)
+        success = harvest_sealifebase_data(species_output, output_dir, args.verbose)
         timing = time.time() - start_time
         update_progress(output_dir, 'harvest_sealifebase_data', success, timing)
         if not success:
@@ -484,7 +424,7 @@ def main():
     if not progress.get('gather_diet_data', {}).get('success'):
         print_green("Step 4: Gathering Diet Data")
         start_time = time.time()
-        success = gather_diet_data(output_dir)
+        success = gather_diet_data(output_dir, args.verbose)
         timing = time.time() - start_time
         update_progress(output_dir, 'gather_diet_data', success, timing)
         if not success:
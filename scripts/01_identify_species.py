@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import math
+import time
+import logging
+import requests
+import pandas as pd
+import geopandas as gpd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from shapely import wkt
+from shapely.geometry import box, Polygon, MultiPolygon
+from shapely.geometry.polygon import orient
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from cache_utils import get_cache_path, make_cache_key
+from geometry_utils import get_simplified_geojson_path
+from taxon_ranks import species_level_mask
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+OBIS_CHECKLIST_URL = 'https://api.obis.org/v3/checklist'
+OBIS_PAGE_SIZE = 5000
+OBIS_TIMEOUT = 60  # Seconds per request
+OBIS_MAX_WORKERS = 6
+
+# Regions are split on a global grid so that overlapping regions share whole tiles
+TILE_SIZE_DEGREES = 5
+WKT_PRECISION = 4  # Decimal places sent to OBIS (~10 m)
+MAX_WKT_LENGTH = 4000  # Simplify clipped tiles beyond this to keep request URLs short
+
+OBIS_TILE_CACHE_DIR = get_cache_path('obis_tiles')
+OBIS_TILE_CACHE_DAYS = 30
+
+TAXONOMY_COLUMNS = ['kingdom', 'phylum', 'class', 'order', 'family', 'genus']
+OUTPUT_COLUMNS = ['scientificName', 'occurrence_count'] + TAXONOMY_COLUMNS
+
+def load_region(geojson_path):
+    """Read the GeoJSON region as a single (multi)polygon in WGS84"""
+    print(f"Reading GeoJSON from: {geojson_path}")
+    # The simplified copy is within WKT_PRECISION of the source and much faster to read
+    gdf = gpd.read_file(get_simplified_geojson_path(geojson_path))
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    region = gdf.geometry.union_all()
+    if not region.is_valid:
+        region = region.buffer(0)
+    if region.is_empty:
+        raise ValueError(f"No geometry found in {geojson_path}")
+    return region
+
+def to_obis_wkt(geometry):
+    """WKT for the OBIS geometry parameter: polygons only, counter-clockwise, rounded"""
+    polygons = list(geometry.geoms) if isinstance(geometry, MultiPolygon) else [geometry]
+    polygons = [orient(p) for p in polygons if isinstance(p, Polygon) and not p.is_empty]
+    geometry = polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+
+    geometry_wkt = wkt.dumps(geometry, rounding_precision=WKT_PRECISION)
+    tolerance = 10 ** -WKT_PRECISION
+    while len(geometry_wkt) > MAX_WKT_LENGTH:
+        tolerance *= 4
+        # Buffer by the tolerance first so simplification never drops area at the region's edge
+        simplified = geometry.buffer(tolerance).simplify(tolerance, preserve_topology=True)
+        geometry_wkt = wkt.dumps(simplified, rounding_precision=WKT_PRECISION)
+    return geometry_wkt
+
+def make_tiles(region, tile_size=TILE_SIZE_DEGREES):
+    """Split the region into grid-aligned tiles.
+
+    Returns (cache_key, wkt) pairs. Tiles fully inside the region are keyed by their grid
+    cell, so any other region covering the same cell reuses them; edge tiles are keyed by
+    their clipped geometry.
+    """
+    minx, miny, maxx, maxy = region.bounds
+    tiles = []
+    for i in range(math.floor(minx / tile_size), math.ceil(maxx / tile_size)):
+        for j in range(math.floor(miny / tile_size), math.ceil(maxy / tile_size)):
+            cell = box(i * tile_size, j * tile_size, (i + 1) * tile_size, (j + 1) * tile_size)
+            if not region.intersects(cell):
+                continue
+            if region.contains(cell):
+                tiles.append((make_cache_key('cell', tile_size, i, j), to_obis_wkt(cell)))
+                continue
+            clipped = region.intersection(cell)
+            if isinstance(clipped, (Polygon, MultiPolygon)):
+                part = clipped
+            else:
+                # Intersections can include lines/points along shared edges; keep the areas only
+                areas = [g for g in getattr(clipped, 'geoms', []) if isinstance(g, (Polygon, MultiPolygon))]
+                if not areas:
+                    continue
+                part = areas[0] if len(areas) == 1 else MultiPolygon(
+                    [p for g in areas for p in (g.geoms if isinstance(g, MultiPolygon) else [g])])
+            if part.is_empty or part.area == 0:
+                continue
+            part_wkt = to_obis_wkt(part)
+            tiles.append((make_cache_key('geometry', part_wkt), part_wkt))
+    return tiles
+
+def read_cached_tile(cache_key):
+    cache_file = os.path.join(OBIS_TILE_CACHE_DIR, f"{cache_key}.json")
+    if not os.path.exists(cache_file):
+        return None
+    if time.time() - os.path.getmtime(cache_file) > OBIS_TILE_CACHE_DAYS * 86400:
+        return None
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+def write_cached_tile(cache_key, results):
+    os.makedirs(OBIS_TILE_CACHE_DIR, exist_ok=True)
+    cache_file = os.path.join(OBIS_TILE_CACHE_DIR, f"{cache_key}.json")
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False)
+    os.replace(tmp_file, cache_file)
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=5, max=30),
+       retry=retry_if_exception_type(requests.RequestException), reraise=True)
+def fetch_checklist_page(session, geometry_wkt, skip):
+    response = session.get(OBIS_CHECKLIST_URL, params={
+        'geometry': geometry_wkt,
+        'size': OBIS_PAGE_SIZE,
+        'skip': skip
+    }, timeout=OBIS_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+def fetch_tile(cache_key, geometry_wkt):
+    """Return the OBIS checklist entries for one tile, paging through the results"""
+    cached = read_cached_tile(cache_key)
+    if cached is not None:
+        return cached, True
+
+    results = []
+    with requests.Session() as session:
+        page = fetch_checklist_page(session, geometry_wkt, 0)
+        total = page.get('total', 0)
+        results.extend(page.get('results', []))
+        while len(results) < total:
+            page = fetch_checklist_page(session, geometry_wkt, len(results))
+            if not page.get('results'):
+                break
+            results.extend(page['results'])
+
+    # Keep only the fields used downstream so the tile cache stays small
+    fields = ['scientificName', 'records'] + TAXONOMY_COLUMNS
+    results = [{field: entry.get(field) for field in fields} for entry in results]
+    write_cached_tile(cache_key, results)
+    return results, False
+
+def fetch_species_data(region, max_workers=OBIS_MAX_WORKERS):
+    tiles = make_tiles(region)
+    print(f"Fetching species data from OBIS for {len(tiles)} tiles...")
+
+    entries = []
+    cached_tiles = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_tile, key, tile_wkt): key for key, tile_wkt in tiles}
+        for completed, future in enumerate(as_completed(futures), start=1):
+            try:
+                results, from_cache = future.result()
+            except Exception as e:
+                raise RuntimeError(f"Failed to connect to the OBIS API: {e}") from e
+            cached_tiles += from_cache
+            entries.extend(results)
+            logging.info(f"Tile {completed}/{len(tiles)}: {len(results)} entries{' (cached)' if from_cache else ''}")
+
+    print(f"Reused {cached_tiles} of {len(tiles)} tiles from cache")
+    if not entries:
+        raise RuntimeError("No data returned from OBIS API")
+
+    species_data = pd.DataFrame(entries).reindex(columns=['scientificName', 'records'] + TAXONOMY_COLUMNS)
+    print(f"Total entries found: {len(species_data)}")
+    print(f"Total unique species found: {species_data['scientificName'].nunique()}")
+    return species_data
+
+def remove_general_entries(species_data):
+    """Keep only species-level entries (two-word names not equal to a higher rank)"""
+    print("Removing more general entries...")
+    filtered_data = species_data[species_level_mask(species_data)]
+    print(f"Removed {len(species_data) - len(filtered_data)} general entries")
+    return filtered_data
+
+def process_and_save_species(species_data, output_file):
+    print("Processing species data...")
+
+    # Tiles overlap at their edges, so the same taxon can come back from several tiles
+    species_data = species_data.copy()
+    species_data['records'] = pd.to_numeric(species_data['records'], errors='coerce').fillna(1)
+    unique_species = (
+        species_data
+        .groupby(['scientificName'] + TAXONOMY_COLUMNS, dropna=False, sort=False)['records']
+        .sum()
+        .astype(int)
+        .reset_index(name='occurrence_count')
+        .sort_values(TAXONOMY_COLUMNS + ['scientificName'], na_position='last')
+    )[OUTPUT_COLUMNS]
+
+    unique_species = remove_general_entries(unique_species)
+
+    unique_species.to_csv(output_file, index=False)
+    if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+        raise RuntimeError("Failed to create species list CSV file or file is empty")
+
+    print(f"Species list saved to {output_file}")
+    print(f"Total unique species: {len(unique_species)}")
+
+def main(geojson_path, output_file):
+    print(f"GeoJSON path: {geojson_path}")
+    print(f"Output file: {output_file}")
+
+    region = load_region(geojson_path)
+    print(f"Bounding Box: {region.bounds}")
+
+    species_data = fetch_species_data(region)
+    process_and_save_species(species_data, output_file)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python 01_identify_species.py <geojson_path> <output_file>")
+        sys.exit(1)
+
+    try:
+        main(sys.argv[1], sys.argv[2])
+    except Exception as e:
+        print(f"\nFatal error occurred:\n{e}")
+        sys.exit(1)
@@ -8,22 +8,27 @@ import subprocess
 import time
 from suds.client import Client
 from suds import WebFault
-from tqdm import tqdm
+from globi_store import write_globi_interactions, GLOBI_COLUMNS
+from cache_utils import JsonCache, get_cache_path
+from taxon_ranks import species_or_orphan_genus_mask
+from log_utils import configure_logging, pop_verbose_flag, SampledEvents
 
 # Import diet data functions
-def load_sealifebase_fooditems_data():
-    print("Loading SeaLifeBase food items data... This may take a while.")
-    data = duckdb.read_parquet("https://fishbase.ropensci.org/sealifebase/fooditems.parquet")
-    print("SeaLifeBase data loaded successfully.")
+# Each harvest stage runs in its own thread, so stages pass their own DuckDB connection
+# (the module-level default connection must not be shared between threads)
+def load_sealifebase_fooditems_data(con=None):
+    logging.info("Loading SeaLifeBase food items data... This may take a while.")
+    data = (con or duckdb).read_parquet("https://fishbase.ropensci.org/sealifebase/fooditems.parquet")
+    logging.info("SeaLifeBase data loaded successfully.")
     return data
 
-def load_fishbase_fooditems_data():
-    print("Loading FishBase food items data... This may take a while.")
-    data = duckdb.read_parquet("https://fishbase.ropensci.org/fishbase/fooditems.parquet")
-    print("FishBase data loaded successfully.")
+def load_fishbase_fooditems_data(con=None):
+    logging.info("Loading FishBase food items data... This may take a while.")
+    data = (con or duckdb).read_parquet("https://fishbase.ropensci.org/fishbase/fooditems.parquet")
+    logging.info("FishBase data loaded successfully.")
     return data
 
-def get_food_items_for_speccodes(sealifebase_df, spec_codes):
+def get_food_items_for_speccodes(sealifebase_df, spec_codes, con=None):
     """Batch process multiple SpecCodes at once"""
     if not spec_codes:
         return pd.DataFrame()
@@ -44,10 +49,10 @@ def get_food_items_for_speccodes(sealifebase_df, spec_codes):
     AND (PredatorStage LIKE '%adult%' OR PredatorStage LIKE '%juv%')
     """
     try:
-        result = duckdb.query(query).df()
+        result = (con or duckdb).query(query).df()
         return result
     except Exception as e:
-        print(f"Error querying food items for SpecCodes: {str(e)}")
+        logging.error(f"Error querying food items for SpecCodes: {str(e)}")
         return pd.DataFrame()
 
 # Set up logging
@@ -104,111 +109,171 @@ def load_species_list(file_path):
     # Filter out rows where scientificName is NA
     df = df.dropna(subset=['scientificName'])
     
-    # Create a dictionary to store genus to species mappings
-    genus_species_map = {}
-    
-    # Group species by their genus
-    for _, row in df.iterrows():
-        name = row['scientificName']
-        genus = name.split()[0]  # Get the first word as genus
-        if genus not in genus_species_map:
-            genus_species_map[genus] = []
-        genus_species_map[genus].append(name)
-    
-    # Filter out genus-level entries if species-level entries exist
-    names_to_keep = []
-    for genus, names in genus_species_map.items():
-        # Check if there are any species-level entries (names with spaces)
-        species_level_entries = [name for name in names if ' ' in name]
-        if species_level_entries:
-            # If species-level entries exist, only keep those
-            names_to_keep.extend(species_level_entries)
-        else:
-            # If no species-level entries, keep the genus-level entry
-            names_to_keep.extend([name for name in names if ' ' not in name])
-    
-    # Filter the dataframe to keep only the selected names
-    df = df[df['scientificName'].isin(names_to_keep)]
+    # Filter out genus-level entries if species-level entries exist for that genus
+    df = df[species_or_orphan_genus_mask(df)]
     
     logging.info(f"Loaded species list with {len(df)} entries after filtering higher-level taxa")
     logging.debug(f"Species list columns: {df.columns}")
     return df
 
-def load_database_data(species_df):
-    """Load only necessary data from databases based on species list"""
-    logging.info("Loading database data for species list...")
-    
-    # Extract unique genera from species list
-    genera = set()
-    for name in species_df['scientificName']:
-        if pd.isna(name):
-            continue
-        parts = name.split()
-        if len(parts) >= 1:
-            genera.add(parts[0])
-    
-    genera_list = list(genera)
-    genera_conditions = ",".join([f"'{g}'" for g in genera_list])
-    
-    # Load only relevant species from SeaLifeBase
-    logging.info("Loading filtered SeaLifeBase data...")
-    slb_query = f"""
+SPECIES_TABLE_URLS = {
+    'SeaLifeBase': 'https://fishbase.ropensci.org/sealifebase/species.parquet',
+    'FishBase': 'https://fishbase.ropensci.org/fishbase/species.parquet'
+}
+
+def get_genera(species_names):
+    """Unique genera (first word of each name) of a list of species names"""
+    return sorted({name.split()[0] for name in species_names if isinstance(name, str) and name.split()})
+
+def load_species_table(database_name, genera, con=None):
+    """Load only the rows of a SeaLifeBase/FishBase species table for the given genera"""
+    if not genera:
+        return pd.DataFrame()
+    logging.info(f"Loading filtered {database_name} data...")
+    genera_conditions = ",".join([f"'{g}'" for g in genera])
+    query = f"""
     SELECT *
-    FROM read_parquet('https://fishbase.ropensci.org/sealifebase/species.parquet')
+    FROM read_parquet('{SPECIES_TABLE_URLS[database_name]}')
     WHERE Genus IN ({genera_conditions})
     """
-    sealifebase_data = duckdb.query(slb_query).df()
-    # Load only relevant species from FishBase
-    logging.info("Loading filtered FishBase data...")
-    fb_query = f"""
-    SELECT *
-    FROM read_parquet('https://fishbase.ropensci.org/fishbase/species.parquet')
-    WHERE Genus IN ({genera_conditions})
+    return (con or duckdb).query(query).df()
+
+WORMS_WSDL = 'https://www.marinespecies.org/aphia.php?p=soap&wsdl=1'
+WORMS_NAME_CHUNK_SIZE = 50  # WoRMS accepts at most 50 names per bulk matching call
+WORMS_MAX_WORKERS = 8
+WORMS_CACHE_FILE = 'worms_cache.json'
+
+def resolve_worms_names(client, names):
+    """Resolve a chunk of names to AphiaRecords with the bulk name-matching endpoints.
+
+    Exact matches come from getAphiaRecordsByNames; names without an exact match are
+    retried once with matchAphiaRecordsByNames (TAXAMATCH fuzzy matching).
+    Returns {name: AphiaID or None}.
     """
-    fishbase_data = duckdb.query(fb_query).df()
-    
-    return sealifebase_data, fishbase_data
+    def pick_record(records):
+        if not records:
+            return None
+        accepted = [r for r in records if getattr(r, 'status', None) == 'accepted']
+        return (accepted or records)[0]
+
+    resolved = {}
+    exact_results = client.service.getAphiaRecordsByNames(names, like=False, fuzzy=False, marine_only=False) or []
+    for name, records in zip(names, exact_results):
+        record = pick_record(records)
+        resolved[name] = record.AphiaID if record is not None else None
+
+    unmatched = [name for name in names if resolved.get(name) is None]
+    if unmatched:
+        fuzzy_results = client.service.matchAphiaRecordsByNames(unmatched, marine_only=False) or []
+        for name, records in zip(unmatched, fuzzy_results):
+            record = pick_record(records)
+            resolved[name] = record.AphiaID if record is not None else None
+    return resolved
+
+def get_worms_functional_group(client, aphia_id):
+    attributes = client.service.getAphiaAttributesByAphiaID(aphia_id, include_inherited=True) or []
+    for attr in attributes:
+        if attr.measurementType == 'Functional group':
+            return attr.measurementValue
+    return None
+
+def is_worms_miss(entry):
+    """Whether a WoRMS cache entry records a name WoRMS could not resolve"""
+    return entry is not None and entry.get('AphiaID') is None
+
+def get_worms_data(species_names, cache_file=None, client_factory=None,
+                   chunk_size=WORMS_NAME_CHUNK_SIZE, max_workers=WORMS_MAX_WORKERS):
+    """Fetch AphiaIDs and functional groups from WoRMS for a list of species.
+
+    Names are resolved in bulk chunks, attributes are fetched concurrently, and every
+    result (including misses) is persisted by name in a shared cache so later runs and
+    other regions only query names they have not seen before.
+    client_factory returns a SOAP client (or any object exposing the same service
+    methods, e.g. a local stub); one client is created per worker thread.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
 
-def get_worms_data(species_names):
     logging.info("Fetching data from WoRMS...")
-    cl = Client('https://www.marinespecies.org/aphia.php?p=soap&wsdl=1')
-    
+    cache = JsonCache(cache_file or get_cache_path(WORMS_CACHE_FILE))
+    client_factory = client_factory or (lambda: Client(WORMS_WSDL))
+    thread_state = threading.local()
+
+    def get_client():
+        if not hasattr(thread_state, 'client'):
+            thread_state.client = client_factory()
+        return thread_state.client
+
+    names = list(dict.fromkeys(n for n in species_names if isinstance(n, str) and n.strip()))
+
+    # Resolve names to AphiaIDs in bulk for names not cached yet
+    unresolved = [name for name in names if name not in cache]
+    if unresolved:
+        chunks = [unresolved[i:i + chunk_size] for i in range(0, len(unresolved), chunk_size)]
+        logging.info(f"Resolving {len(unresolved)} names against WoRMS in {len(chunks)} chunks")
+
+        def resolve_chunk(chunk):
+            try:
+                return resolve_worms_names(get_client(), chunk)
+            except WebFault as e:
+                logging.error(f"Error resolving WoRMS names {chunk[0]}..{chunk[-1]}: {str(e)}")
+                return {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for resolved in executor.map(resolve_chunk, chunks):
+                for name, aphia_id in resolved.items():
+                    cache.set(name, {'AphiaID': aphia_id, 'scientificname': name})
+        cache.save()
+
+    # Fetch functional groups concurrently for resolved names still missing attributes
+    pending = [name for name in names
+               if (cache.get(name) or {}).get('AphiaID') is not None
+               and 'functional_group' not in cache.get(name)]
+    if pending:
+        logging.info(f"Fetching WoRMS attributes for {len(pending)} species")
+
+        def fetch_attributes(name):
+            entry = cache.get(name)
+            try:
+                return name, get_worms_functional_group(get_client(), entry['AphiaID']), True
+            except WebFault as e:
+                logging.error(f"Error fetching WoRMS attributes for {name}: {str(e)}")
+                return name, None, False
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for i, (name, functional_group, ok) in enumerate(executor.map(fetch_attributes, pending), 1):
+                if ok:  # Failed lookups are left uncached so the next run retries them
+                    cache.set(name, {**cache.get(name), 'functional_group': functional_group})
+                if i % 500 == 0:
+                    cache.save()
+        cache.save()
+
     worms_data = {}
-    for species_name in species_names:
-        try:
-            # Get AphiaID
-            aphia_id = cl.service.getAphiaID(species_name, marine_only=False)
-            if aphia_id is None:
-                logging.warning(f"No AphiaID found for {species_name}")
-                continue
-            
-            # Get attributes using AphiaID
-            attributes = cl.service.getAphiaAttributesByAphiaID(aphia_id, include_inherited=True)
-            
-            # Extract functional group
-            functional_group = None
-            for attr in attributes:
-                if attr.measurementType == 'Functional group':
-                    functional_group = attr.measurementValue
-                    break
-            
-            worms_data[species_name] = {
-                'AphiaID': aphia_id,
-                'scientificname': species_name,
-                'functional_group': functional_group
+    for name in names:
+        entry = cache.get(name)
+        if entry and entry.get('AphiaID') is not None:
+            worms_data[name] = {
+                'AphiaID': entry['AphiaID'],
+                'scientificname': name,
+                'functional_group': entry.get('functional_group')
             }
-        
-        except WebFault as e:
-            logging.error(f"Error fetching data from WoRMS for {species_name}: {str(e)}")
-    
+        else:
+            logging.debug(f"No AphiaID found for {name}")
+
     logging.info(f"Retrieved WoRMS data for {len(worms_data)} species")
     return worms_data
 
-def get_globi_data_for_species(species_names, batch_size=10):
-    """Fetch and clean GLOBI data for multiple species in parallel using requests"""
+def get_globi_data_for_species(species_names, batch_size=10, events=None):
+    """Fetch and clean GLOBI data for multiple species in parallel using requests.
+
+    Per-species outcomes are counted in events (a SampledEvents); raw responses are
+    only logged with --verbose.
+    """
     import requests
     from concurrent.futures import ThreadPoolExecutor
     from io import StringIO
+    if events is None:
+        events = SampledEvents()
     
     def clean_globi_data(df):
         """Clean and format GLOBI interaction data"""
@@ -234,16 +299,8 @@ def get_globi_data_for_species(species_names, batch_size=10):
             if col in df.columns:
                 df[col] = df[col].apply(lambda x: x.replace('root | ', '').strip() if isinstance(x, str) else x)
         
-        # Select relevant columns
-        relevant_cols = [
-            'sourceTaxonName', 'sourceTaxonPath',
-            'interactionTypeName',
-            'targetTaxonName', 'targetTaxonPath',
-            'sourceBodyPartName', 'targetBodyPartName',
-            'eventDate', 'decimalLatitude', 'decimalLongitude',
-            'localityName', 'referenceDoi', 'referenceCitation',
-            'studyTitle'
-        ]
+        # Select relevant columns (the columns stored in the Parquet dataset)
+        relevant_cols = [col for col in GLOBI_COLUMNS if col != 'species']
         df = df[relevant_cols]
         
         return df
@@ -254,12 +311,11 @@ def get_globi_data_for_species(species_names, batch_size=10):
         try:
             response = requests.get(url)
             if response.status_code == 200:
-                # Print raw data for debugging
-                print(f"\nRaw GLOBI data for {species_name}:")
-                print(response.text[:1000])  # Print first 500 chars to avoid flooding terminal
+                # Raw data for debugging, first 1000 chars to avoid flooding the log
+                events.record('responses', "Raw GLOBI data for %s:\n%s", species_name, response.text[:1000])
                 # Check if response only contains header
                 if len(response.text.strip().split('\n')) <= 1:
-                    logging.info(f"No interaction data for {species_name} (header only)")
+                    events.record('without interactions', "No interaction data for %s (header only)", species_name)
                     return species_name, {'interactions': [], 'metadata': {'total_interactions': 0, 'unique_prey': 0, 'data_sources': 0}}
                 
                 try:
@@ -297,9 +353,9 @@ def get_globi_data_for_species(species_names, batch_size=10):
                         # Clean and format the data
                         cleaned_df = clean_globi_data(df)
                         if not cleaned_df.empty:
-                            # Convert to dict format for JSON serialization
+                            # Keep the frame; the caller writes it to the Parquet dataset
                             return species_name, {
-                                'interactions': cleaned_df.to_dict(orient='records'),
+                                'interactions': cleaned_df,
                                 'metadata': {
                                     'total_interactions': len(cleaned_df),
                                     'unique_prey': cleaned_df['targetTaxonName'].nunique(),
@@ -307,7 +363,7 @@ def get_globi_data_for_species(species_names, batch_size=10):
                                 }
                             }
                 except pd.errors.EmptyDataError:
-                    logging.info(f"Empty CSV data for {species_name}")
+                    events.record('empty responses', "Empty CSV data for %s", species_name)
                     return species_name, {'interactions': [], 'metadata': {'total_interactions': 0, 'unique_prey': 0, 'data_sources': 0}}
                 except Exception as e:
                     logging.error(f"Error parsing CSV data for {species_name}: {str(e)}")
@@ -315,7 +371,7 @@ def get_globi_data_for_species(species_names, batch_size=10):
                 
                 return species_name, {'interactions': [], 'metadata': {'total_interactions': 0, 'unique_prey': 0, 'data_sources': 0}}
             else:
-                logging.info(f"No GLOBI data found for {species_name}")
+                events.record('not found', "No GLOBI data found for %s (HTTP %s)", species_name, response.status_code)
                 return species_name, {'interactions': [], 'metadata': {'total_interactions': 0, 'unique_prey': 0, 'data_sources': 0}}
         except Exception as e:
             logging.error(f"Exception while fetching GLOBI data for {species_name}: {str(e)}")
@@ -334,9 +390,9 @@ def get_globi_data_for_species(species_names, batch_size=10):
     return results
 
 def convert_int32(obj):
-    if isinstance(obj, np.int32):
+    if isinstance(obj, np.integer):
         return int(obj)
-    elif isinstance(obj, np.float64):
+    elif isinstance(obj, np.floating):
         return float(obj)
     elif isinstance(obj, pd.Timestamp):  # Handle Timestamp objects
         return obj.isoformat()
@@ -346,156 +402,12 @@ def convert_int32(obj):
         return [convert_int32(v) for v in obj]
     return obj
 
-def get_species_info(species_df, sealifebase_df, fishbase_df, sealifebase_fooditems_df, fishbase_fooditems_df, output_file):
-    logging.info("Processing species in batches")
-    
-    print("\nProcessing Species Info:")
-    print("SeaLifeBase DataFrame shape:", sealifebase_df.shape)
-    print("FishBase DataFrame shape:", fishbase_df.shape)
-    
-    # Load existing data if available
-    species_data = {}
-    if os.path.exists(output_file):
-        species_data = load_json_with_lock(output_file) or {}
-        print(f"\nLoaded existing data for {len(species_data)} species")
-    
-    # Filter out already processed species
-    unprocessed_species = []
-    for idx, row in species_df.iterrows():
-        species_name = row['scientificName']
-        if pd.isna(species_name) or (species_name in species_data and is_species_complete(species_data[species_name])):
-            continue
-        unprocessed_species.append((species_name, row))
-    
-    if not unprocessed_species:
-        logging.info("All species already processed")
-        return None, None, species_data
-    
-    # Process species in batches
-    BATCH_SIZE = 50
-    total_batches = (len(unprocessed_species) + BATCH_SIZE - 1) // BATCH_SIZE
-    
-    for batch_idx in range(total_batches):
-        start_idx = batch_idx * BATCH_SIZE
-        end_idx = min((batch_idx + 1) * BATCH_SIZE, len(unprocessed_species))
-        batch = unprocessed_species[start_idx:end_idx]
-        
-        # Prepare batch queries
-        genus_species_pairs = []
-        spec_codes = []
-        
-        for species_name, row in batch:
-            # Initialize species data if not exists
-            if species_name not in species_data:
-                species_data[species_name] = {
-                    'taxonomy': {},
-                    'ecology': {'SeaLifeBase': {}, 'FishBase': {}, 'WoRMS': {}},
-                    'diet': {'SeaLifeBase': [], 'FishBase': [], 'GLOBI': {'raw_data': None}}
-                }
-            
-            # Extract taxonomy data
-            species_data[species_name]['taxonomy'].update({
-                'Kingdom': row.get('kingdom'),
-                'Phylum': row.get('phylum'),
-                'Class': row.get('class'),
-                'Order': row.get('order'),
-                'Family': row.get('family'),
-                'Genus': row.get('genus')
-            })
-            
-            genus_species = species_name.split()
-            if len(genus_species) == 2:
-                genus_species_pairs.append((genus_species[0], genus_species[1]))
-        
-        # Batch query SeaLifeBase
-        if genus_species_pairs:
-            conditions = " OR ".join([f"(Genus = '{g}' AND Species = '{s}')" for g, s in genus_species_pairs])
-            slb_query = f"SELECT * FROM sealifebase_df WHERE {conditions}"
-            slb_results = duckdb.query(slb_query).df()
-            
-            # Process SeaLifeBase results
-            for _, slb_row in slb_results.iterrows():
-                species_name = f"{slb_row['Genus']} {slb_row['Species']}"
-                # Only process species that are in our input list
-                if species_name not in [name for name, _ in batch]:
-                    continue
-                    
-                if not pd.isna(slb_row['SpecCode']):
-                    spec_codes.append(slb_row['SpecCode'])
-                
-                ecology_data = {
-                    'habitat': {
-                        'Fresh': slb_row.get('Fresh'),
-                        'Brack': slb_row.get('Brack'),
-                        'Saltwater': slb_row.get('Saltwater'),
-                        'Land': slb_row.get('Land'),
-                        'DemersPelag': slb_row.get('DemersPelag')
-                    },
-                    'depth': {
-                        'DepthRangeShallow': slb_row.get('DepthRangeShallow'),
-                        'DepthRangeDeep': slb_row.get('DepthRangeDeep')
-                    },
-                    'characteristics': {
-                        'Length': slb_row.get('Length'),
-                        'LTypeMaxM': slb_row.get('LTypeMaxM'),
-                        'Importance': slb_row.get('Importance'),
-                        'Comments': slb_row.get('Comments')
-                    },
-                    'specCode': slb_row.get('SpecCode'),
-                    'author': slb_row.get('Author'),
-                    'commonName': slb_row.get('FBname'),
-                    'source': 'SeaLifeBase'
-                }
-                species_data[species_name]['ecology']['SeaLifeBase'] = ecology_data
-        
-        # Batch get diet data
-        if spec_codes:
-            diet_items = get_food_items_for_speccodes(sealifebase_fooditems_df, spec_codes)
-            if not diet_items.empty:
-                for _, diet_row in diet_items.iterrows():
-                    spec_code = diet_row['SpecCode']
-                    # Find species name for this SpecCode
-                    for species_name in species_data:
-                        if species_data[species_name].get('ecology', {}).get('SeaLifeBase', {}).get('specCode') == spec_code:
-                            if 'SeaLifeBase' not in species_data[species_name]['diet']:
-                                species_data[species_name]['diet']['SeaLifeBase'] = []
-                            species_data[species_name]['diet']['SeaLifeBase'].append(diet_row.to_dict())
-        
-        # Batch get GLOBI data
-        species_names = [name for name, _ in batch]
-        globi_results = get_globi_data_for_species(species_names)
-        for species_name, globi_data in globi_results.items():
-            if globi_data['interactions']:
-                species_data[species_name]['diet']['GLOBI'] = globi_data
-            else:
-                species_data[species_name]['diet']['GLOBI'] = {
-                    'interactions': [],
-                    'metadata': {'total_interactions': 0, 'unique_prey': 0, 'data_sources': 0}
-                }
-        
-        # Save after each batch
-        save_json_with_lock(species_data, output_file)
-        logging.info(f"Completed batch {batch_idx + 1}/{total_batches}")
-    
-    return None, None, species_data
-
 def clean_dict(d):
     if not isinstance(d, dict):
         return d
     return {k: clean_dict(v) for k, v in d.items() 
             if v is not None and not pd.isna(v) and v != 'NA' and v != ''}
 
-def get_database_data(row, database_name):
-    if row is None or row.empty:
-        return None
-    
-    # Convert row to dictionary and handle Timestamp objects
-    data = row.to_dict()
-    data = convert_int32(data)  # Convert any Timestamp objects to ISO format strings
-    data['Source'] = database_name
-    
-    return clean_dict(data)
-
 def is_species_complete(species_data):
     """Check if we have all possible data for a species"""
     if not species_data:
@@ -516,135 +428,262 @@ def is_species_complete(species_data):
     
     return has_taxonomy and has_db and has_globi
 
-def save_species_data(species_df, sealifebase_info, fishbase_info, worms_data, species_data, output_file):
-    logging.info("Processing species data...")
-    
-    # Use the existing species_data passed in
-    logging.info(f"Processing data for {len(species_data)} species")
-    
-    total_species = len(species_df)
-    processed = 0
-    skipped = 0
-    
-    # Process species with progress tracking
-    progress_bar = tqdm(total=total_species, desc=f"Processing species data (0/{total_species})")
+# Step 2 runs each data source as a concurrent producer stage; records are merged as they arrive
+HARVEST_PROGRESS_STEP = 'harvest_sealifebase_data'  # Step name used by main.py in progress.json
+HARVEST_SAVE_INTERVAL = 30  # Seconds between checkpoint saves of 02_species_data.json
+GLOBI_BATCH_SIZE = 50
+FOODITEMS_BATCH_SIZE = 500
+_STAGE_DONE = object()
+
+def get_taxonomy(row):
+    return {
+        rank: (None if pd.isna(row.get(column)) else row.get(column))
+        for rank, column in [('Kingdom', 'kingdom'), ('Phylum', 'phylum'), ('Class', 'class'),
+                             ('Order', 'order'), ('Family', 'family'), ('Genus', 'genus')]
+    }
+
+def new_species_record(row):
+    return {
+        'taxonomy': get_taxonomy(row),
+        'ecology': {'SeaLifeBase': {}, 'FishBase': {}, 'WoRMS': {}},
+        'diet': {'SeaLifeBase': [], 'FishBase': [], 'GLOBI': {'raw_data': None}}
+    }
+
+def sealifebase_stage(species_names, spec_codes_future):
+    """Yield SeaLifeBase ecology per species and publish the SpecCode -> species map for the food items stage"""
+    con = duckdb.connect()
+    spec_codes = {}
+    try:
+        wanted = set(species_names)
+        sealifebase_df = load_species_table('SeaLifeBase', get_genera(species_names), con)
+        logging.debug(f"SeaLifeBase DataFrame shape: {sealifebase_df.shape}")
+        for _, slb_row in sealifebase_df.iterrows():
+            species_name = f"{slb_row['Genus']} {slb_row['Species']}"
+            # Only process species that are in our input list
+            if species_name not in wanted:
+                continue
+            if not pd.isna(slb_row['SpecCode']):
+                spec_codes[slb_row['SpecCode']] = species_name
+            ecology_data = {
+                'habitat': {
+                    'Fresh': slb_row.get('Fresh'),
+                    'Brack': slb_row.get('Brack'),
+                    'Saltwater': slb_row.get('Saltwater'),
+                    'Land': slb_row.get('Land'),
+                    'DemersPelag': slb_row.get('DemersPelag')
+                },
+                'depth': {
+                    'DepthRangeShallow': slb_row.get('DepthRangeShallow'),
+                    'DepthRangeDeep': slb_row.get('DepthRangeDeep')
+                },
+                'characteristics': {
+                    'Length': slb_row.get('Length'),
+                    'LTypeMaxM': slb_row.get('LTypeMaxM'),
+                    'Importance': slb_row.get('Importance'),
+                    'Comments': slb_row.get('Comments')
+                },
+                'specCode': slb_row.get('SpecCode'),
+                'author': slb_row.get('Author'),
+                'commonName': slb_row.get('FBname'),
+                'source': 'SeaLifeBase'
+            }
+            yield species_name, ('ecology', 'SeaLifeBase'), convert_int32(clean_dict(ecology_data))
+    finally:
+        spec_codes_future.set_result(spec_codes)
+        con.close()
+
+def fishbase_stage(species_names):
+    con = duckdb.connect()
+    try:
+        wanted = set(species_names)
+        fishbase_df = load_species_table('FishBase', get_genera(species_names), con)
+        logging.debug(f"FishBase DataFrame shape: {fishbase_df.shape}")
+        if fishbase_df.empty:
+            return
+        for genus, species in fishbase_df[['Genus', 'Species']].drop_duplicates().itertuples(index=False):
+            species_name = f"{genus} {species}"
+            if species_name in wanted:
+                yield species_name, ('ecology', 'FishBase'), {'habitat': {}, 'depth': {}, 'characteristics': {}}
+    finally:
+        con.close()
+
+def fooditems_stage(spec_codes_future):
+    """Yield SeaLifeBase food items per species once the SeaLifeBase stage has resolved SpecCodes"""
+    con = duckdb.connect()
+    try:
+        sealifebase_fooditems_df = load_sealifebase_fooditems_data(con)
+        spec_codes = spec_codes_future.result()
+        codes = list(spec_codes)
+        for i in range(0, len(codes), FOODITEMS_BATCH_SIZE):
+            diet_items = get_food_items_for_speccodes(sealifebase_fooditems_df, codes[i:i + FOODITEMS_BATCH_SIZE], con)
+            if diet_items.empty:
+                continue
+            for spec_code, rows in diet_items.groupby('SpecCode', sort=False):
+                if spec_code in spec_codes:
+                    yield spec_codes[spec_code], ('diet', 'SeaLifeBase'), convert_int32(rows.to_dict(orient='records'))
+    finally:
+        con.close()
+
+def globi_stage(species_names, output_dir):
+    """Yield GLOBI metadata per species; interactions go to the Parquet dataset, only metadata stays in the JSON"""
+    events = SampledEvents()
+    for i in range(0, len(species_names), GLOBI_BATCH_SIZE):
+        batch = species_names[i:i + GLOBI_BATCH_SIZE]
+        globi_results = get_globi_data_for_species(batch, events=events)
+        interaction_frames = {
+            species_name: globi_data['interactions']
+            for species_name, globi_data in globi_results.items()
+            if isinstance(globi_data['interactions'], pd.DataFrame)
+        }
+        # Every species of the batch replaces what an earlier harvest stored for it
+        interactions_path = write_globi_interactions(interaction_frames, output_dir, species=list(globi_results))
+        for species_name, globi_data in globi_results.items():
+            if species_name in interaction_frames:
+                globi_entry = {'interactions_path': interactions_path, 'metadata': convert_int32(globi_data['metadata'])}
+            else:
+                globi_entry = {'metadata': {'total_interactions': 0, 'unique_prey': 0, 'data_sources': 0}}
+            yield species_name, ('diet', 'GLOBI'), globi_entry
+        logging.info(f"GLOBI: completed {min(i + GLOBI_BATCH_SIZE, len(species_names))}/{len(species_names)} species")
+    events.summary("GLOBI species")
+
+def worms_stage(species_names):
+    for species_name, worms_info in get_worms_data(species_names).items():
+        yield species_name, ('ecology', 'WoRMS'), clean_dict(worms_info)
+
+def run_harvest_pipeline(stages, on_record):
+    """Run producer stages concurrently and pass every record to on_record in the calling thread.
+
+    stages maps a source name to a zero-argument callable returning an iterator of
+    (species_name, section, payload) records. Returns per-source timing and status.
+    """
+    import queue
+    import threading
+
+    records = queue.Queue(maxsize=10000)
+    source_timing = {}
+
+    def run_stage(name, producer):
+        start_time = time.time()
+        success = True
+        try:
+            for record in producer():
+                records.put(record)
+        except Exception as e:
+            success = False
+            logging.error(f"Harvest stage {name} failed: {str(e)}", exc_info=True)
+        finally:
+            source_timing[name] = {'timing': round(time.time() - start_time, 2), 'success': success}
+            records.put((name, _STAGE_DONE, None))
+
+    threads = [threading.Thread(target=run_stage, args=(name, producer), name=f"harvest-{name}", daemon=True)
+               for name, producer in stages.items()]
+    for thread in threads:
+        thread.start()
+
+    remaining = len(threads)
+    while remaining:
+        species_name, section, payload = records.get()
+        if section is _STAGE_DONE:
+            remaining -= 1
+            logging.info(f"Source {species_name} finished in {source_timing[species_name]['timing']:.1f}s")
+            continue
+        on_record(species_name, section, payload)
+
+    for thread in threads:
+        thread.join()
+    return source_timing
+
+def record_source_timing(output_dir, source_timing):
+    """Store per-source harvest timing under the step 2 entry of progress.json"""
+    progress_file = os.path.join(output_dir, 'progress.json')
+    progress = load_json_with_lock(progress_file) if os.path.exists(progress_file) else {}
+    progress = progress or {}
+    progress.setdefault(HARVEST_PROGRESS_STEP, {})['source_timing'] = source_timing
+    save_json_with_lock(progress, progress_file)
+
+def harvest_species_data(species_df, output_file):
+    """Harvest all sources for the species not yet complete in output_file and merge them per species"""
+    output_dir = os.path.dirname(output_file)
+
+    # Load existing data if available
+    species_data = {}
+    if os.path.exists(output_file):
+        species_data = load_json_with_lock(output_file) or {}
+        logging.info(f"Loaded existing data for {len(species_data)} species")
+
+    # Filter out already processed species
+    unprocessed_species = []
     for _, row in species_df.iterrows():
         species_name = row['scientificName']
-        if pd.isna(species_name):
-            continue
-        
-        # Check if species is already fully processed in current file
-        if species_name in species_data and is_species_complete(species_data[species_name]):
-            skipped += 1
-            progress_bar.set_description(f"Processing species data ({processed}/{total_species}, {skipped} skipped)")
-            progress_bar.update(1)
+        if pd.isna(species_name) or (species_name in species_data and is_species_complete(species_data[species_name])):
             continue
-        
-        # Get database rows by matching Genus and Species
-        genus_species = species_name.split()
-        if len(genus_species) == 2:
-            genus, species = genus_species
-            slb_row = sealifebase_info[(sealifebase_info['Genus'] == genus) & (sealifebase_info['Species'] == species)].iloc[0] if not sealifebase_info[(sealifebase_info['Genus'] == genus) & (sealifebase_info['Species'] == species)].empty else None
-            fb_row = fishbase_info[(fishbase_info['Genus'] == genus) & (fishbase_info['Species'] == species)].iloc[0] if not fishbase_info[(fishbase_info['Genus'] == genus) & (fishbase_info['Species'] == species)].empty else None
+        if species_name not in species_data:
+            species_data[species_name] = new_species_record(row)
         else:
-            slb_row = None
-            fb_row = None
-        
-        sealifebase_data = get_database_data(slb_row, 'SeaLifeBase') if slb_row is not None else None
-        fishbase_data = get_database_data(fb_row, 'FishBase') if fb_row is not None else None
-        worms_info = worms_data.get(species_name, None)
-        
-        # Get existing data or create new
-        current_data = species_data.get(species_name, {})
-        
-        # Organize data into new structure
-        species_info = {
-            'taxonomy': clean_dict({
-                'Kingdom': row.get('kingdom'),
-                'Phylum': row.get('phylum'),
-                'Class': row.get('class'),
-                'Order': row.get('order'),
-                'Family': row.get('family'),
-                'Genus': row.get('genus')
-            }),
-            'ecology': {
-                'SeaLifeBase': clean_dict({
-                    'habitat': {
-                        'Fresh': sealifebase_data.get('Fresh') if sealifebase_data else None,
-                        'Brack': sealifebase_data.get('Brack') if sealifebase_data else None,
-                        'Saltwater': sealifebase_data.get('Saltwater') if sealifebase_data else None,
-                        'Land': sealifebase_data.get('Land') if sealifebase_data else None,
-                        'DemersPelag': sealifebase_data.get('DemersPelag') if sealifebase_data else None
-                    },
-                    'depth': {
-                        'DepthRangeShallow': sealifebase_data.get('DepthRangeShallow') if sealifebase_data else None,
-                        'DepthRangeDeep': sealifebase_data.get('DepthRangeDeep') if sealifebase_data else None
-                    },
-                    'characteristics': {
-                        'Length': sealifebase_data.get('Length') if sealifebase_data else None,
-                        'LTypeMaxM': sealifebase_data.get('LTypeMaxM') if sealifebase_data else None,
-                        'Importance': sealifebase_data.get('Importance') if sealifebase_data else None,
-                        'Comments': sealifebase_data.get('Comments') if sealifebase_data else None
-                    }
-                }) if sealifebase_data else {},
-                'FishBase': clean_dict({
-                    'habitat': {},
-                    'depth': {},
-                    'characteristics': {}
-                }) if fishbase_data else {},
-                'WoRMS': clean_dict(worms_info) if worms_info else {}
-            },
-            'diet': current_data.get('diet', {
-                'SeaLifeBase': [],
-                'FishBase': [],
-                'GLOBI': {'raw_data': None}
-            })
-        }
-        
-        if species_info:
-            species_data[species_name] = convert_int32(species_info)
-            processed += 1
-            
-            # Save after each species is processed
+            species_data[species_name]['taxonomy'] = get_taxonomy(row)
+        unprocessed_species.append(species_name)
+
+    # WoRMS lookups are cached, so also backfill species completed before WoRMS was harvested.
+    # Names WoRMS has no AphiaID for are cached as misses and count as resolved.
+    worms_cache = JsonCache(get_cache_path(WORMS_CACHE_FILE))
+    missing_worms = [name for name in species_df['scientificName']
+                     if name in species_data and not species_data[name].get('ecology', {}).get('WoRMS')
+                     and not is_worms_miss(worms_cache.get(name))]
+
+    if not unprocessed_species and not missing_worms:
+        logging.info("All species already processed")
+        return species_data, {}
+
+    logging.info(f"Harvesting {len(unprocessed_species)} species from all sources")
+    from concurrent.futures import Future
+    spec_codes_future = Future()
+    stages = {}
+    if unprocessed_species:
+        stages.update({
+            'SeaLifeBase': lambda: sealifebase_stage(unprocessed_species, spec_codes_future),
+            'FishBase': lambda: fishbase_stage(unprocessed_species),
+            'FoodItems': lambda: fooditems_stage(spec_codes_future),
+            'GLOBI': lambda: globi_stage(unprocessed_species, output_dir),
+        })
+    if missing_worms:
+        stages['WoRMS'] = lambda: worms_stage(missing_worms)
+
+    last_save = time.time()
+
+    def merge_record(species_name, section, payload):
+        nonlocal last_save
+        category, source = section
+        species_data[species_name].setdefault(category, {})[source] = payload
+        # Checkpoint periodically so an interrupted harvest keeps completed sources
+        if time.time() - last_save > HARVEST_SAVE_INTERVAL:
             save_json_with_lock(species_data, output_file)
-        
-        progress_bar.set_description(f"Processing species data ({processed}/{total_species}, {skipped} skipped)")
-        progress_bar.update(1)
-    
-    progress_bar.close()
-    logging.info(f"All species data saved to {output_file}")
+            last_save = time.time()
+
+    source_timing = run_harvest_pipeline(stages, merge_record)
+    save_json_with_lock(species_data, output_file)
+    return species_data, source_timing
 
 def main(species_list_file, output_dir='outputs'):
     species_df = load_species_list(species_list_file)
     
-    # Load only necessary database data
-    sealifebase_df, fishbase_df = load_database_data(species_df)
-    
-    # Load diet data
-    sealifebase_fooditems_df = load_sealifebase_fooditems_data()
-    fishbase_fooditems_df = load_fishbase_fooditems_data()
-    
     species_data_file = os.path.join(output_dir, '02_species_data.json')
-    print(species_data_file)
-    
-    # Get species info first
-    _, _, species_data = get_species_info(
-        species_df, sealifebase_df, fishbase_df, sealifebase_fooditems_df, fishbase_fooditems_df, species_data_file
-    )
-    
-    # Get WoRMS data
-    species_names = species_df['scientificName'].tolist()
-    worms_data = {}  # Disabled for now: worms_data = get_worms_data(species_names)
-    
-    # Pass the database DataFrames directly
-    save_species_data(species_df, sealifebase_df, fishbase_df, worms_data, species_data, species_data_file)
-    logging.info(f"Species data saved to {species_data_file}")
+    logging.debug(f"Species data file: {species_data_file}")
+    
+    # Fetch SeaLifeBase, FishBase, food items, GLOBI and WoRMS concurrently
+    species_data, source_timing = harvest_species_data(species_df, species_data_file)
+    if source_timing:
+        record_source_timing(output_dir, source_timing)
+        for source, status in source_timing.items():
+            logging.info(f"{source}: {status['timing']:.1f}s ({'ok' if status['success'] else 'failed'})")
+    logging.info(f"Species data saved to {species_data_file} ({len(species_data)} species)")
 
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) < 2:
-        print("Usage: python 02_download_data.py <species_list_file> [output_dir]")
+    args, verbose = pop_verbose_flag(sys.argv[1:])
+    if not args:
+        print("Usage: python 02_download_data.py <species_list_file> [output_dir] [--verbose]")
         sys.exit(1)
+    configure_logging(verbose)
     
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'outputs'
-    main(sys.argv[1], output_dir)
+    output_dir = args[1] if len(args) > 1 else 'outputs'
+    main(args[0], output_dir)
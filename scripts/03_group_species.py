@@ -3,11 +3,13 @@ import sys
 import logging
 import json
 from group_species_utils import (
-    load_species_data, load_reference_groups, preprocess_data, create_hierarchical_json,
-    assign_groups, save_assignments, load_assignments, write_json_to_file, read_research_focus,
-    load_ai_config
+    load_species_data, load_reference_groups, preprocess_data, build_taxonomy_tree,
+    assign_groups_batch, save_assignments, load_assignments, write_json_to_file, read_research_focus,
+    load_ai_config, GROUPING_MAX_WORKERS, ASSIGNMENT_INDEX_FILE, load_assignment_index, save_assignment_index,
+    AssignmentMemo, GroupingWorkLog, WORK_LOG_FILE
 )
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from group_index import GroupIndex, GROUP_INDEX_FILE
+from taxonomy_tree import ROOT
 
 # ANSI escape codes for colors
 GREEN = '\033[92m'
@@ -26,20 +28,37 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Get the absolute path of the EwE directory
 EWE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
-def load_processed_taxa(file_path):
-    try:
-        with open(file_path, 'r') as f:
-            assignments = json.load(f)
-        processed_taxa = set()
-        for group in assignments.values():
-            processed_taxa.update(group.keys())
-        return processed_taxa
-    except FileNotFoundError:
-        return set()
-
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=4, max=60), retry=retry_if_exception_type(Exception))
-def retry_assign_groups(taxa, level, reference_group_dict, is_leaf_level, research_focus=None, ai_model='claude'):
-    return assign_groups(taxa, level, reference_group_dict, is_leaf_level, research_focus, ai_model)
+def load_assignment_state(index_file, assignments_file, extra_groups_file, taxonomy_tree):
+    """Load the assignment index to resume from, converting full assignment files of older runs"""
+    if os.path.exists(index_file):
+        return load_assignment_index(index_file)
+
+    index = {'assignments': {}, 'extra_groups': {}}
+    for section, file_path in [('assignments', assignments_file), ('extra_groups', extra_groups_file)]:
+        if not os.path.exists(file_path):
+            continue
+        for group, taxa in load_assignments(file_path).items():
+            for taxon in taxa:
+                # Shallowest node with that name, as a breadth-first search of the JSON would find
+                paths = [taxonomy_tree.path_to_root(node) for node in taxonomy_tree.find(taxon)]
+                if paths:
+                    index[section].setdefault(group, {})[taxon] = min(paths, key=len)
+    return index
+
+def seed_work_log(work_log, index):
+    """Log the answers implied by an assignment index of an older run, so they are replayed.
+
+    A taxon assigned at some path was answered there, and each of its ancestors was RESOLVE.
+    """
+    answers = {}
+    for section in ['assignments', 'extra_groups']:
+        for group, taxa in index[section].items():
+            for taxon, path in taxa.items():
+                for depth in range(len(path) - 1):
+                    answers.setdefault(tuple(path[:depth]), {})[path[depth]] = 'RESOLVE'
+                answers.setdefault(tuple(path[:-1]), {})[taxon] = group
+    for path, response in answers.items():
+        work_log.record_answers(path, response)
 
 def write_grouping_report(report_file, assignments):
     with open(report_file, 'a') as f:
@@ -48,10 +67,32 @@ def write_grouping_report(report_file, assignments):
                 f.write(f"Functional Group: {functional_group}\n")
                 f.write(f"      Taxon: {taxon}\n\n")
 
-def assign_groups_iteratively(hierarchical_json, reference_group_dict, assignments_file, extra_groups_file, output_dir, ai_model, force_grouping):
-    assignments = load_assignments(assignments_file)
-    extra_groups = load_assignments(extra_groups_file) if os.path.exists(extra_groups_file) else {}
-    processed_taxa = load_processed_taxa(assignments_file)
+def assignment_subtrees(assignments, taxonomy_tree):
+    """{group: {taxon: node}} as {group: {taxon: subtree}}, the shape of the assignment files"""
+    return {group: {taxon: taxonomy_tree.to_json(node) if isinstance(node, int) else node
+                    for taxon, node in taxa.items()}
+            for group, taxa in assignments.items()}
+
+def assign_groups_iteratively(taxonomy_tree, reference_group_dict, assignments_file, extra_groups_file, output_dir, ai_model, force_grouping, max_workers=GROUPING_MAX_WORKERS, memo_policy='never'):
+    """Walk the taxonomy tree from the top and assign taxa to functional groups.
+
+    Returns (assignments, extra_groups) as {group: {taxon: tree node}}; the node ids are
+    turned into subtrees with assignment_subtrees when the files are written.
+    """
+    # The work log records every answer; on a restart the walk is replayed from it and only
+    # unanswered taxa are sent. The compact index of taxon paths is rebuilt along the way.
+    index_file = os.path.join(output_dir, ASSIGNMENT_INDEX_FILE)
+    work_log = GroupingWorkLog(os.path.join(output_dir, WORK_LOG_FILE))
+    if len(work_log) == 0:
+        previous_index = load_assignment_state(index_file, assignments_file, extra_groups_file, taxonomy_tree)
+        seed_work_log(work_log, previous_index)
+    resuming = len(work_log) > 0
+    if resuming:
+        logging.info(f"Resuming from work log: {work_log.summary()}")
+    index = {'assignments': {}, 'extra_groups': {}}
+    assignments = {}
+    extra_groups = {}
+    processed_taxa = set()
     research_focus = read_research_focus(output_dir)
     report_file = os.path.join(output_dir, '03_grouping_report.txt')
     
@@ -64,65 +105,116 @@ def assign_groups_iteratively(hierarchical_json, reference_group_dict, assignmen
     except Exception as e:
         logging.error(f"Error saving reference groups: {e}")
     
-    # Initialize the report file
-    with open(report_file, 'w') as f:
-        f.write("High-level Grouping Decisions Report\n")
-        f.write("====================================\n\n")
+    # Initialize the report file; a resumed run appends the decisions it has not reported yet
+    if not resuming or not os.path.exists(report_file):
+        with open(report_file, 'w') as f:
+            f.write("High-level Grouping Decisions Report\n")
+            f.write("====================================\n\n")
     
-    def process_level(level, path, reference_group_dict, is_leaf_level=False):
-        taxa = [key for key in level.keys() if key not in ['specCode', 'ecology'] and key not in processed_taxa]
-        if taxa:
-            logging.info(f"Processing {len(taxa)} taxa at level {len(path)}")
-            try:
-                group_assignments = retry_assign_groups(taxa, len(path), reference_group_dict, is_leaf_level, research_focus, ai_model)
-                processed_taxa.update(taxa)
-                
-                # Write non-RESOLVE assignments to the report file
-                write_grouping_report(report_file, group_assignments)
-                
-                assigned_count = 0
-                extra_assigned_count = 0
-                for taxon, assignment in group_assignments.items():
-                    if assignment != 'RESOLVE':
-                        if assignment in reference_group_dict:
+    def process_frontier(frontier, reference_group_dict, is_leaf_level=False):
+        """Assign the taxa of all subtrees in the frontier concurrently and return the RESOLVE subtrees below them"""
+        nodes = []
+        frontier_taxa = set()
+        for node, path in frontier:
+            children = {taxonomy_tree.name(child): child for child in taxonomy_tree.children(node)}
+            # A taxon name shared by two subtrees is only sent once, as in a depth-first walk
+            taxa = [name for name in children if name not in processed_taxa and name not in frontier_taxa]
+            frontier_taxa.update(taxa)
+            if taxa:
+                nodes.append((children, path, taxa))
+        if not nodes:
+            return []
+        
+        rank = len(nodes[0][1])
+        logging.info(f"Processing {len(frontier_taxa)} taxa in {len(nodes)} subtrees at level {rank}")
+        for _, path, taxa in nodes:
+            work_log.mark_pending(path, taxa)
+        
+        # Answers already in the work log are reused; only the rest is sent
+        logged = [{taxon: answer for taxon, answer in work_log.answers_for(path).items() if taxon in taxa}
+                  for _, path, taxa in nodes]
+        unanswered = [[taxon for taxon in taxa if taxon not in answers] for (_, _, taxa), answers in zip(nodes, logged)]
+        to_send = [i for i, taxa in enumerate(unanswered) if taxa]
+        if len(to_send) < len(nodes) or any(logged):
+            logging.info(f"Replaying {sum(len(a) for a in logged)} logged answers; {sum(len(t) for t in unanswered)} taxa left to ask")
+        fresh = [{} for _ in nodes]
+        if to_send:
+            memo = AssignmentMemo(memo_policy, reference_group_dict, research_focus, ai_model)
+            progress = work_log.batch([nodes[i][1] for i in to_send])
+            results = assign_groups_batch([unanswered[i] for i in to_send], rank, reference_group_dict, is_leaf_level, research_focus, ai_model, max_workers, memo, progress)
+            for i, result in zip(to_send, results):
+                fresh[i] = result
+        
+        # Merge in frontier order so the outcome does not depend on which request finished first
+        next_frontier = []
+        for (children, path, taxa), logged_answers, fresh_answers in zip(nodes, logged, fresh):
+            if fresh_answers is None:
+                logging.error(f"Error assigning groups under {'/'.join(path) or 'the top level'} after multiple retries")
+                continue
+            processed_taxa.update(taxa)
+            combined = {**logged_answers, **fresh_answers}
+            group_assignments = {taxon: combined[taxon] for taxon in taxa if taxon in combined}
+            
+            # Write non-RESOLVE assignments to the report file; replayed ones were reported before
+            write_grouping_report(report_file, fresh_answers)
+            
+            assigned_count = 0
+            extra_assigned_count = 0
+            for taxon, assignment in group_assignments.items():
+                if taxon not in children:
+                    logging.warning(f"Ignoring assignment for unknown taxon '{taxon}'")
+                    continue
+                if assignment != 'RESOLVE':
+                    taxon_path = path + [str(taxon)]
+                    if assignment in reference_group_dict:
+                        if assignment not in assignments:
+                            assignments[assignment] = {}
+                        assignments[assignment][taxon] = children[taxon]
+                        index['assignments'].setdefault(assignment, {})[taxon] = taxon_path
+                        assigned_count += 1
+                    else:
+                        if not force_grouping:
+                            reference_group_dict[assignment] = f"AI-generated group for {taxon}"
                             if assignment not in assignments:
                                 assignments[assignment] = {}
-                            assignments[assignment][taxon] = level[taxon]
+                            assignments[assignment][taxon] = children[taxon]
+                            index['assignments'].setdefault(assignment, {})[taxon] = taxon_path
                             assigned_count += 1
+                            logging.info(f"Added new group '{assignment}' to reference groups.")
                         else:
-                            if not force_grouping:
-                                reference_group_dict[assignment] = f"AI-generated group for {taxon}"
-                                if assignment not in assignments:
-                                    assignments[assignment] = {}
-                                assignments[assignment][taxon] = level[taxon]
-                                assigned_count += 1
-                                logging.info(f"Added new group '{assignment}' to reference groups.")
-                            else:
-                                if assignment not in extra_groups:
-                                    extra_groups[assignment] = {}
-                                extra_groups[assignment][taxon] = level[taxon]
-                                extra_assigned_count += 1
-                    else:
-                        # If RESOLVE, continue processing the subtree
-                        process_level(level[taxon], path + [str(taxon)], reference_group_dict, is_leaf_level)
-                
-                logging.info(f"Assigned {assigned_count} out of {len(taxa)} taxa at level {len(path)} to regular groups")
-                if extra_assigned_count > 0:
-                    logging.info(f"Assigned {extra_assigned_count} out of {len(taxa)} taxa at level {len(path)} to extra groups")
-            except Exception as e:
-                logging.error(f"Error assigning groups after multiple retries: {e}")
+                            if assignment not in extra_groups:
+                                extra_groups[assignment] = {}
+                            extra_groups[assignment][taxon] = children[taxon]
+                            index['extra_groups'].setdefault(assignment, {})[taxon] = taxon_path
+                            extra_assigned_count += 1
+                else:
+                    # If RESOLVE, process the subtree with the next frontier
+                    next_frontier.append((children[taxon], path + [str(taxon)]))
             
-            # Save assignments and extra groups after processing each level
-            save_assignments(assignments, assignments_file)
-            save_assignments(extra_groups, extra_groups_file)
-        return level
+            logging.info(f"Assigned {assigned_count} out of {len(taxa)} taxa at level {rank} to regular groups")
+            if extra_assigned_count > 0:
+                logging.info(f"Assigned {extra_assigned_count} out of {len(taxa)} taxa at level {rank} to extra groups")
+            work_log.mark_done(path)
+        
+        # Save the assignment index after processing each frontier; full files are written once at the end
+        save_assignment_index(index, index_file)
+        return next_frontier
+
+    def process_level(node, path, reference_group_dict, is_leaf_level=False):
+        # Breadth-first: all RESOLVE subtrees at one depth are independent and are dispatched together
+        frontier = [(node, path)]
+        while frontier:
+            frontier = process_frontier(frontier, reference_group_dict, is_leaf_level)
 
     taxonomic_ranks = ['Kingdom', 'Phylum', 'Class', 'Order', 'Family', 'Genus', 'Species']
     
-    for rank_number, rank in enumerate(taxonomic_ranks):
-        logging.info(f"Processing rank: {rank} ({rank_number + 1} of {len(taxonomic_ranks)})")
-        is_leaf_level = rank == taxonomic_ranks[-1]
-        hierarchical_json = process_level(hierarchical_json, [], reference_group_dict, is_leaf_level)
+    try:
+        for rank_number, rank in enumerate(taxonomic_ranks):
+            logging.info(f"Processing rank: {rank} ({rank_number + 1} of {len(taxonomic_ranks)})")
+            is_leaf_level = rank == taxonomic_ranks[-1]
+            process_level(ROOT, [], reference_group_dict, is_leaf_level)
+    finally:
+        work_log.close()
     
     # Add Detritus as a functional group
     if "Detritus" not in assignments:
@@ -136,7 +228,7 @@ def assign_groups_iteratively(hierarchical_json, reference_group_dict, assignmen
         }
         logging.info("Added Detritus to functional groups")
     
-    return hierarchical_json, assignments, extra_groups
+    return assignments, extra_groups
 
 def main(species_data_file, output_file_hierarchy, output_file_assignments, output_file_extra_groups, output_dir, json_file_path):
     try:
@@ -145,9 +237,13 @@ def main(species_data_file, output_file_hierarchy, output_file_assignments, outp
         ai_model = ai_config.get('groupSpeciesAI', 'gemini')
         grouping_template = ai_config.get('groupingTemplate', {'type': 'default', 'path': '03_grouping_template.json'})
         force_grouping = ai_config.get('forceGrouping', False)
+        max_workers = ai_config.get('groupingWorkers', GROUPING_MAX_WORKERS)
+        memo_policy = ai_config.get('assignmentMemo', 'never')
         logging.info(f"Using AI model: {ai_model} for group species task")
         logging.info(f"Using grouping template: {grouping_template['type']} from {grouping_template['path']}")
         logging.info(f"Force grouping: {force_grouping}")
+        logging.info(f"Grouping workers: {max_workers}")
+        logging.info(f"Assignment memo: {memo_policy}")
 
         # Load reference groups with taxonomic classification
         logging.info("Loading reference groups with taxonomic classification...")
@@ -167,20 +263,27 @@ def main(species_data_file, output_file_hierarchy, output_file_assignments, outp
         processed_data = preprocess_data(species_data)
         logging.info(f"Preprocessed {len(processed_data)} species")
         
-        logging.info("Creating initial hierarchical JSON...")
-        hierarchical_json = create_hierarchical_json(processed_data)
-        logging.info(f"Created hierarchical JSON with {len(hierarchical_json)} top-level keys")
+        logging.info("Creating taxonomy tree...")
+        taxonomy_tree = build_taxonomy_tree(processed_data)
+        logging.info(f"Created taxonomy tree with {len(taxonomy_tree)} taxa and {len(taxonomy_tree.children())} top-level keys")
         
         logging.info("Assigning groups iteratively...")
-        grouped_hierarchical_json, assignments, extra_groups = assign_groups_iteratively(
-            hierarchical_json, reference_group_dict, output_file_assignments, output_file_extra_groups,
-            output_dir, ai_model, force_grouping
+        assignments, extra_groups = assign_groups_iteratively(
+            taxonomy_tree, reference_group_dict, output_file_assignments, output_file_extra_groups,
+            output_dir, ai_model, force_grouping, max_workers, memo_policy
         )
         
         logging.info("Exporting results...")
-        write_json_to_file(grouped_hierarchical_json, output_file_hierarchy)
-        save_assignments(assignments, output_file_assignments)
-        save_assignments(extra_groups, output_file_extra_groups)
+        write_json_to_file(taxonomy_tree.to_json(), output_file_hierarchy)
+        assignments = assignment_subtrees(assignments, taxonomy_tree)
+        save_assignments(assignments, output_file_assignments, species_data)
+        save_assignments(assignment_subtrees(extra_groups, taxonomy_tree), output_file_extra_groups, species_data)
+        
+        # Flat taxon -> group lookup for steps 4 and 5, written after the assignments so it is never older
+        assignment_index = load_assignment_index(os.path.join(output_dir, ASSIGNMENT_INDEX_FILE))
+        group_index = GroupIndex.from_assignments(assignments, taxonomy_tree, assignment_index['assignments'])
+        group_index.save(os.path.join(output_dir, GROUP_INDEX_FILE))
+        logging.info(f"Saved group index with {len(group_index)} taxa to {GROUP_INDEX_FILE}")
         
         logging.info(f"Script completed successfully. Assigned {len(assignments)} groups.")
         logging.info(f"Extra AI groups saved: {len(extra_groups)}")
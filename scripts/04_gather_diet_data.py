@@ -1,4 +1,5 @@
 import os
+import re
 import json
 import logging
 from collections import Counter
@@ -7,17 +8,49 @@ from tqdm import tqdm
 from rag_search import rag_search
 from ask_AI import ask_ai
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from diet_data_utils import (
-    clean_group_name, extract_species_names, parse_ai_response, format_diet_description,
-    create_species_group_lookup, find_functional_group_from_path, find_functional_group, normalize_category
+    clean_group_name, parse_ai_response, format_diet_description,
+    create_species_group_lookup, aggregate_globi_interactions
 )
+from globi_store import read_globi_interactions, has_globi_dataset, inline_interactions_frame, GLOBI_DIET_COLUMNS
+from run_context import RunContext
+from diet_evidence import summarize_diet_evidence, EvidenceMatrix, EVIDENCE_MATRIX_FILE
+from token_utils import count_tokens
+from cache_utils import make_cache_key
+from log_utils import configure_logging, pop_verbose_flag, SampledEvents
 
 # Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
 
 # Get the absolute path of the EwE directory
 EWE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
+# Groups processed at the same time; each one makes a RAG query and an AI call
+DIET_MAX_WORKERS = 4
+
+# One record per group (its 04a and 04d entries and the key of its inputs), written as each
+# group finishes; 04a/04d are assembled from them once per run
+DIET_RECORDS_DIR = '04_group_records'
+
+_rag_lock = threading.Lock()
+_rag_ready = set()
+
+def search_diet_literature(query, directory):
+    """rag_search that is safe to call from several groups at once.
+
+    The first call may build or update the persisted index, so it runs alone; once the
+    index exists, queries run concurrently.
+    """
+    if directory not in _rag_ready:
+        with _rag_lock:
+            if directory not in _rag_ready:
+                results = rag_search(query, directory)
+                _rag_ready.add(directory)
+                return results
+    return rag_search(query, directory)
+
 def extract_species_from_nested(data):
     """Recursively extract species names from nested dictionary structure"""
     species_names = []
@@ -88,39 +121,76 @@ def save_json_with_lock(data, file_path, max_retries=5, retry_delay=1):
             time.sleep(retry_delay)
     return False
 
-def get_representative_species(species_list_df, group_data):
-    """Get representative species from the most common genera in the group"""
+def group_record_path(records_dir, clean_group_str):
+    """File of one group's record: a readable name plus a hash, since group names may contain any character"""
+    safe_name = re.sub(r'[^A-Za-z0-9]+', '_', clean_group_str).strip('_')[:60]
+    return os.path.join(records_dir, f"{safe_name}_{make_cache_key(clean_group_str)[:8]}.json")
+
+def save_group_record(records_dir, record):
+    """Write one group's record; the cost depends on that group only"""
+    os.makedirs(records_dir, exist_ok=True)
+    file_path = group_record_path(records_dir, record['group'])
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, file_path)
+
+def load_group_records(records_dir):
+    """{group: record} of every record written so far; unreadable records are skipped and redone"""
+    records = {}
+    if not os.path.isdir(records_dir):
+        return records
+    for file_name in sorted(os.listdir(records_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(records_dir, file_name), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            records[record['group']] = record
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable group record {file_name}: {str(e)}")
+    return records
+
+def index_species_list(species_list_df):
+    """01_species_list.csv indexed by scientificName, with the genus and occurrence count of each species"""
+    columns = [column for column in ('genus', 'occurrence_count') if column in species_list_df.columns]
+    if 'scientificName' not in species_list_df.columns or 'genus' not in columns:
+        return pd.DataFrame(columns=['genus'], index=pd.Index([], name='scientificName'))
+    species_index = species_list_df.drop_duplicates('scientificName').set_index('scientificName')[columns]
+    # Same test as before: a genus must be present and non-empty
+    return species_index[species_index['genus'].notna() & (species_index['genus'].astype(str) != '')]
+
+def get_representative_species(species_index, group_data, weight_by_occurrence=False, n_genera=3):
+    """Get representative species from the most common genera in the group.
+
+    Genera are ranked by their number of species in the group, or by their summed OBIS
+    occurrences with weight_by_occurrence; the example of each genus is its first species
+    by name, or its most recorded one when weighting.
+    """
     try:
+        if species_index.index.name != 'scientificName':
+            species_index = index_species_list(species_index)
         # Extract species names from nested structure
-        group_species_names = list(set(extract_species_from_nested(group_data)))
-        
-        if not group_species_names:
+        group_species_names = sorted(extract_species_from_nested(group_data))
+        members = species_index[species_index.index.isin(group_species_names)].sort_index()
+        if members.empty:
             return []
-        
-        # Get genus counts from species_list_df
-        genus_counts = {}
-        species_by_genus = {}
-        for species in group_species_names:
-            species_info = species_list_df[species_list_df['scientificName'] == species]
-            if len(species_info) > 0:
-                genus = species_info['genus'].iloc[0]
-                if genus and not pd.isna(genus):  # Check if genus is valid
-                    if genus not in genus_counts:
-                        genus_counts[genus] = 0
-                        species_by_genus[genus] = []
-                    genus_counts[genus] += 1
-                    species_by_genus[genus].append(species)
-        
-        # Get top 3 genera by number of species
-        top_genera = sorted(genus_counts.items(), key=lambda x: x[1], reverse=True)[:3]
-        
-        # Get one example species from each top genus
-        representative_species = []
-        for genus, count in top_genera:
-            if species_by_genus[genus]:
-                representative_species.append(f"{species_by_genus[genus][0]} (1 of {count} species in genus {genus})")
-        
-        return representative_species
+
+        weighted = weight_by_occurrence and 'occurrence_count' in members.columns
+        if weighted:
+            members = members.assign(occurrence_count=pd.to_numeric(members['occurrence_count'], errors='coerce').fillna(0))
+            members = members.sort_values('occurrence_count', ascending=False, kind='stable')
+
+        by_genus = members.reset_index().groupby('genus', sort=False)
+        genera = pd.DataFrame({
+            'count': by_genus.size(),
+            'example': by_genus['scientificName'].first(),
+            'weight': by_genus['occurrence_count'].sum() if weighted else by_genus.size()
+        })
+        top_genera = genera.rename_axis('genus').reset_index().sort_values(
+            ['weight', 'genus'], ascending=[False, True], kind='stable').head(n_genera)
+
+        return [f"{row.example} (1 of {row.count} species in genus {row.genus})" for row in top_genera.itertuples()]
     except Exception as e:
         logging.warning(f"Error getting representative species: {str(e)}")
         return []
@@ -177,7 +247,15 @@ def compress_food_categories(species_data, species_group_lookup=None):
     
     return dict(food_categories)
 
-def gather_all_diet_data(directory, grouped_species_data, species_data, output_file, output_dir):
+def gather_all_diet_data(directory, grouped_species_data, species_data, output_file, output_dir, globi_interactions=None,
+                         max_workers=DIET_MAX_WORKERS, weight_by_occurrence=False, context=None):
+    """Gather and summarize the diet data of every functional group.
+
+    globi_interactions is a DataFrame of GLOBI interactions (GLOBI_DIET_COLUMNS); without it
+    the interactions kept inline in species_data (older models) are used. weight_by_occurrence
+    picks the example species of each group by OBIS occurrences rather than species counts.
+    context is the RunContext of grouped_species_data, created here when not given.
+    """
     logging.info(f"Starting to gather diet data from directory: {directory}")
 
     if not os.path.exists(directory):
@@ -203,19 +281,26 @@ def gather_all_diet_data(directory, grouped_species_data, species_data, output_f
     if os.path.exists(group_desc_file):
         group_descriptions = load_json_with_lock(group_desc_file) or {}
 
+    # Groups finished by an earlier run, keyed by everything their prompt depends on
+    records_dir = os.path.join(os.path.dirname(output_file), DIET_RECORDS_DIR)
+    group_records = load_group_records(records_dir)
 
     # Load species list for occurrence counts
     species_list_file = os.path.join(os.path.dirname(output_file), '01_species_list.csv')
     species_list_df = pd.read_csv(species_list_file) if os.path.exists(species_list_file) else pd.DataFrame()
+    species_index = index_species_list(species_list_df)
     
     unique_groups = list(grouped_species_data.keys())
     logging.info(f"Found {len(unique_groups)} unique groups to process.")
     
-    # Create species to group lookup
-    species_group_lookup = create_species_group_lookup(grouped_species_data)
+    # Create species to group lookup; the GLOBI aggregation looks taxa up in the same index
+    if context is None:
+        context = RunContext(grouped_species_data, os.path.dirname(output_file))
+    species_group_lookup = create_species_group_lookup(grouped_species_data, context.group_index)
     
-    # Track statistics
+    # Track statistics; per-species events are counted, and only logged with --verbose
     stats = {'processed': 0, 'cached': 0}
+    events = SampledEvents()
 
     # Create enhanced available_groups object
     available_groups = {}
@@ -224,7 +309,7 @@ def gather_all_diet_data(directory, grouped_species_data, species_data, output_f
         available_groups[clean_group_name_str] = {
             'name': group,
             'description': group_descriptions.get(group, ''),
-            'top_species': get_representative_species(species_list_df, grouped_species_data[group])
+            'top_species': get_representative_species(species_index, grouped_species_data[group], weight_by_occurrence)
         }
     
     # Add Detritus to available groups
@@ -233,51 +318,71 @@ def gather_all_diet_data(directory, grouped_species_data, species_data, output_f
         'description': 'Dead organic matter and associated bacteria, crucial in nutrient cycling',
         'top_species': []
     }
-    
-    for group in tqdm(unique_groups, desc="Processing groups"):
+
+    if globi_interactions is None:
+        globi_interactions = inline_interactions_frame(species_data, GLOBI_DIET_COLUMNS)
+    start = time.perf_counter()
+    globi_counts_by_species = aggregate_globi_interactions(globi_interactions, grouped_species_data)
+    logging.info(f"Aggregated {len(globi_interactions)} GLOBI interactions of {len(globi_counts_by_species)} species "
+                 f"in {time.perf_counter() - start:.2f}s")
+
+    species_by_group = {group: context.species(group) for group in unique_groups}
+    total_species = sum(len(species) for species in species_by_group.values())
+
+    descriptions = {name: details['description'] for name, details in available_groups.items()}
+
+    # Records are newer than the aggregate files when a run was interrupted before assembling them
+    for group in unique_groups:
+        record = group_records.get(clean_group_name(group))
+        if record is not None:
+            group_diet_data[record['group']] = record['group_diet_data']
+            all_diet_data[record['group']] = record['diet_summary']
+
+    # Weighting changes the example species in the prompt, so weighted summaries get their own key
+    weighting = ['weightByOccurrence'] if weight_by_occurrence else []
+
+    def group_key(group):
+        return make_cache_key(group, species_by_group[group], descriptions, *weighting)
+
+    def is_done(group):
+        record = group_records.get(clean_group_name(group))
+        if record is None or record.get('key') != group_key(group):
+            return False
+        entry = record['diet_summary']
+        return bool(entry.get('diet_proportions')) and 'error' not in entry.get('source_data', {})
+
+    def process_group(group):
+        """RAG search, species aggregation and AI summary of one group; shared state is only read"""
         clean_group_str = clean_group_name(group)
-        print(f"Processing {clean_group_str}..............................")
-        if clean_group_str not in all_diet_data:
-            all_diet_data[clean_group_str] = {
-                'diet_proportions': {},
-                'source_data': {
-                    'globi': {},
-                    'rag': [],
-                    'fishbase': {},
-                    'sealifebase': {}
-                }
-            }
+        logging.info(f"Processing {clean_group_str} ({len(species_by_group[group])} species)")
         
-        species_in_group = extract_species_names(json.dumps(grouped_species_data[group]))
+        species_in_group = species_by_group[group]
         top_species = available_groups[clean_group_str]['top_species']
         species_examples = "; ".join(top_species) if top_species else clean_group_str
         rag_query = f"What do {clean_group_str} (for example: {species_examples}) eat?"
         try:
-            rag_results, _ = rag_search(rag_query, directory)
-            all_diet_data[clean_group_str]['source_data']['rag'] = rag_results
+            rag_results, _ = search_diet_literature(rag_query, directory)
         except Exception as e:
             logging.error(f"Error during RAG search for group {clean_group_str}: {str(e)}")
-            all_diet_data[clean_group_str]['source_data']['rag'] = ["No RAG search results available due to an error."]
+            rag_results = ["No RAG search results available due to an error."]
         
-        # Initialize group in intermediate data if not exists
-        if clean_group_str not in group_diet_data:
-            group_diet_data[clean_group_str] = {
-                "species_data": {},
-                "group_summary": {
-                    "rag_results": rag_results,
-                    "total_prey_interactions": 0,
-                    "total_predator_interactions": 0,
-                    "prey_items": {},
-                    "predator_items": {}
-                }
+        group_entry = {
+            "species_data": {},
+            "group_summary": {
+                "rag_results": rag_results,
+                "total_prey_interactions": 0,
+                "total_predator_interactions": 0,
+                "prey_items": {},
+                "predator_items": {}
             }
+        }
         
         # Initialize group-level database data
         fishbase_data = {}
         sealifebase_data = {}
         
-        for species in tqdm(species_in_group, desc=f"Processing species in {clean_group_str}"):
-            print(species)
+        for species in species_in_group:
+            events.record('species', "Species %s of %s", species, clean_group_str)
             # Initialize diet data structure
             species_diet_data = {
                 "sealifebase_data": [],
@@ -288,114 +393,30 @@ def gather_all_diet_data(directory, grouped_species_data, species_data, output_f
                 }
             }
             if species in species_data and 'diet' in species_data[species]:
-                print("SPECIES DATA...........")
                 diet_data = species_data[species]['diet']
-                print(diet_data)
+                events.record('with diet data', "Diet data of %s: %s", species, diet_data)
                 # Handle SeaLifeBase and FishBase data
                 if 'SeaLifeBase' in diet_data:
-                    print("SeaLifeBase...........")
+                    events.record('with SeaLifeBase records')
                     species_diet_data["sealifebase_data"] = diet_data['SeaLifeBase']
                     sealifebase_data[species] = diet_data['SeaLifeBase']
                 if 'FishBase' in diet_data:
-                    print("FishBase..........")
+                    events.record('with FishBase records')
                     species_diet_data["fishbase_data"] = diet_data['FishBase']
                     fishbase_data[species] = diet_data['FishBase']
                 
-                # Process GLOBI data
-                if 'GLOBI' in diet_data and 'interactions' in diet_data['GLOBI']:
-                    print("GLOBI..........")
-                    interactions = diet_data['GLOBI']['interactions']
-                    for interaction in interactions:
-                        print(species)
-                        print(interaction)
-                        # Check interaction type
-                        interaction_type = interaction.get('interactionTypeName', '').lower()
-                        
-                        # Print full interaction details for debugging
-                        logging.debug(f"\nSpecies: {species}")
-                        logging.debug(f"Interaction type: {interaction_type}")
-                        logging.debug(f"Source: {interaction.get('sourceTaxonName')} ({interaction.get('sourceTaxonPath', '')})")
-                        logging.debug(f"Target: {interaction.get('targetTaxonName')} ({interaction.get('targetTaxonPath', '')})")
-                        
-                        # Handle both predator and prey interactions
-                        is_predator = interaction_type in ['eats', 'preyson']
-                        is_prey = interaction_type in ['eatenby', 'preyeduponby']
-                        
-                        if is_predator or is_prey:
-                            source_species = interaction.get('sourceTaxonName')
-                            source_path = interaction.get('sourceTaxonPath')
-                            target_species = interaction.get('targetTaxonName')
-                            target_path = interaction.get('targetTaxonPath')
-                            
-                            def find_group_from_interaction(species_name, taxon_path, is_normalized=False):
-                                """Helper function to find functional group using consistent lookup chain"""
-                                try:
-                                    if not species_name or species_name == 'no:match':
-                                        return None
-                                        
-                                    # First normalize if not already normalized
-                                    if not is_normalized:
-                                        species_name = normalize_category(species_name)
-                                    
-                                    # Try lookup chain:
-                                    # 1. Direct functional group lookup
-                                    group = find_functional_group(species_name, grouped_species_data)
-                                    if group:
-                                        return group
-                                        
-                                    # 2. Path-based lookup
-                                    if taxon_path:
-                                        group, _ = find_functional_group_from_path(taxon_path, grouped_species_data)
-                                        if group:
-                                            return group
-                                    
-                                    # 3. Fallback to cleaned species name
-                                    return clean_group_name(species_name)
-                                    
-                                except Exception as e:
-                                    logging.warning(f"Error in group lookup chain: {str(e)}")
-                                    return None
-                            
-                            if is_predator and target_species and target_species != 'no:match':
-                                # This species is eating something
-                                normalized_target = normalize_category(target_species)
-                                prey_group = find_group_from_interaction(normalized_target, target_path, is_normalized=True)
-                                
-                                # Update prey counts
-                                if prey_group:
-                                    species_diet_data["globi_data"]["prey_items"][prey_group] = \
-                                        species_diet_data["globi_data"]["prey_items"].get(prey_group, 0) + 1
-                            
-                            elif is_prey and source_species and source_species != 'no:match':
-                                # Something is eating this species
-                                normalized_source = normalize_category(source_species)
-                                predator_group = find_group_from_interaction(normalized_source, source_path, is_normalized=True)
-                                
-                                # Update predator counts
-                                if predator_group:
-                                    species_diet_data["globi_data"]["predator_items"][predator_group] = \
-                                        species_diet_data["globi_data"]["predator_items"].get(predator_group, 0) + 1
- 
-            
-            # Add species diet data to group data structure
-            if clean_group_str not in group_diet_data:
-                group_diet_data[clean_group_str] = {
-                    "species_data": {},
-                    "group_summary": {
-                        "total_prey_interactions": 0,
-                        "total_predator_interactions": 0,
-                        "prey_items": {},
-                        "predator_items": {},
-                        "rag_results": all_diet_data[clean_group_str]['source_data'].get('rag', [])
-                    }
-                }
+                # GLOBI prey and predator groups, counted for all species before the groups run
+                globi_counts = globi_counts_by_species.get(species)
+                if globi_counts:
+                    events.record('with GLOBI interactions')
+                    species_diet_data["globi_data"]["prey_items"] = dict(globi_counts['prey_items'])
+                    species_diet_data["globi_data"]["predator_items"] = dict(globi_counts['predator_items'])
             
             # Store species data
-            group_diet_data[clean_group_str]["species_data"][species] = species_diet_data
-            stats['processed'] += 1
+            group_entry["species_data"][species] = species_diet_data
             
         # Process group-level summaries
-        collapsed_species_data = remove_empty_fields(group_diet_data[clean_group_str]["species_data"])
+        collapsed_species_data = remove_empty_fields(group_entry["species_data"])
         compressed_food_categories = compress_food_categories(collapsed_species_data, species_group_lookup)
         
         # Aggregate GLOBI data at group level
@@ -418,29 +439,19 @@ def gather_all_diet_data(directory, grouped_species_data, species_data, output_f
                     total_predator_interactions += count
         
         # Update group summary
-        group_diet_data[clean_group_str]["group_summary"].update({
+        group_entry["group_summary"].update({
             "total_prey_interactions": total_prey_interactions,
             "total_predator_interactions": total_predator_interactions,
             "prey_items": group_prey_items,
             "predator_items": group_predator_items,
             "compressed_food_categories": compressed_food_categories
         })
-
-        # Prepare the prompt for ask_ai with the processed data
-        combined_data = {
-            "rag_results": group_diet_data[clean_group_str]["group_summary"]["rag_results"],
-            "compressed_food_categories": compressed_food_categories,
-            "globi_data": {
-                "prey_items": group_diet_data[clean_group_str]["group_summary"]["prey_items"],
-                "predator_items": group_diet_data[clean_group_str]["group_summary"]["predator_items"],
-                "total_prey_interactions": group_diet_data[clean_group_str]["group_summary"]["total_prey_interactions"],
-                "total_predator_interactions": group_diet_data[clean_group_str]["group_summary"]["total_predator_interactions"]
-            }
-        }
-        combined_data_json = json.dumps(combined_data, indent=2)
         
-        # Save intermediate group diet data
-        save_json_with_lock(group_diet_data, group_diet_file)
+        # Ranked, bounded summary of the evidence instead of the raw per-species records
+        evidence = summarize_diet_evidence(group_entry, species_group_lookup)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Diet evidence of {clean_group_str}: ~{count_tokens(evidence)} tokens "
+                          f"(raw records ~{count_tokens(str(remove_empty_fields(group_entry)))})")
         
         ai_prompt = f"""Based on the following information about the diet composition of the group '{clean_group_str}', 
         provide a summary of their diet. Include the prey items and their estimated proportions in the diet. 
@@ -448,9 +459,9 @@ def gather_all_diet_data(directory, grouped_species_data, species_data, output_f
         Available functional groups and their details:
         {json.dumps(available_groups, indent=2)}
 
-        Here is the diet data for {clean_group_str}:
+        Here is the diet evidence for {clean_group_str}:
 
-        {remove_empty_fields(group_diet_data[clean_group_str])}
+        {evidence}
 
         Format your response as a list, with each item on a new line in the following format:
         Prey Item: Percentage
@@ -467,72 +478,124 @@ def gather_all_diet_data(directory, grouped_species_data, species_data, output_f
         3. Consider that some species may feed on juvenile or larval forms of other species, these proportions should only consider adult forms.
         """
 
+        result = {
+            'group_entry': group_entry,
+            'rag_results': rag_results,
+            'source_data': {
+                'globi': group_entry["group_summary"],
+                'rag': rag_results,
+                'fishbase': fishbase_data,
+                'sealifebase': sealifebase_data
+            },
+            'species_count': len(species_in_group),
+            'diet_proportions': None,
+            'error': None
+        }
         try:
             # Get AI response and parse it
             ai_response = ask_ai(ai_prompt, 'claude')
-            parsed_diet_proportions = parse_ai_response(ai_response)
-            
-            # Store the parsed diet proportions in all_diet_data
-            all_diet_data[clean_group_str]['diet_proportions'] = parsed_diet_proportions
-            
+            result['diet_proportions'] = parse_ai_response(ai_response)
         except Exception as e:
             logging.error(f"Error processing diet data for group {clean_group_str}: {str(e)}")
-            # Save what we have so far
-            all_diet_data[clean_group_str]['source_data']['error'] = str(e)
-            save_json_with_lock(all_diet_data, output_file)
-            continue
+            result['error'] = str(e)
+        return result
+
+    def commit_group(group, result):
+        """Merge one group's result into the outputs and save its record, in the order of unique_groups"""
+        clean_group_str = clean_group_name(group)
+        entry = all_diet_data.setdefault(clean_group_str, {
+            'diet_proportions': {},
+            'source_data': {
+                'globi': {},
+                'rag': [],
+                'fishbase': {},
+                'sealifebase': {}
+            }
+        })
+        group_diet_data[clean_group_str] = result['group_entry']
+        stats['processed'] += result['species_count']
         
-        try:
-            # Debug logging
+        if result['error'] is not None:
+            # Save what we have so far
+            entry['source_data']['rag'] = result['rag_results']
+            entry['source_data']['error'] = result['error']
+        else:
             logging.info(f"Saving diet data for group: {clean_group_str}")
-            logging.info(f"Available groups in group_diet_data: {list(group_diet_data.keys())}")
-            
-            # Ensure group exists in both dictionaries
-            if clean_group_str not in group_diet_data:
-                logging.error(f"Group {clean_group_str} not found in group_diet_data")
-                group_diet_data[clean_group_str] = {
-                    "group_summary": {
-                        "total_prey_interactions": 0,
-                        "total_predator_interactions": 0,
-                        "prey_items": {},
-                        "predator_items": {}
-                    }
-                }
-            
-            # Update final output structure with source data
-            all_diet_data[clean_group_str]['source_data'].update({
-                'globi': group_diet_data[clean_group_str]["group_summary"],
-                'rag': rag_results,
-                'fishbase': fishbase_data,
-                'sealifebase': sealifebase_data
-            })
-            
-            logging.info(f"Successfully saved diet data for group: {clean_group_str}")
-            
-        except Exception as e:
-            logging.error(f"Error saving diet data for group {clean_group_str}")
-            logging.error(f"Error details: {str(e)}")
-            logging.error(f"Group diet data structure: {json.dumps(group_diet_data.get(clean_group_str, {}), indent=2)}")
-            all_diet_data[clean_group_str]['source_data']['error'] = str(e)
+            entry['diet_proportions'] = result['diet_proportions']
+            entry['source_data'].pop('error', None)
+            entry['source_data'].update(result['source_data'])
+        
+        # Save this group only and print status
+        group_records[clean_group_str] = {
+            'group': clean_group_str,
+            'key': group_key(group),
+            'group_diet_data': result['group_entry'],
+            'diet_summary': entry
+        }
+        save_group_record(records_dir, group_records[clean_group_str])
+        remaining = total_species - (stats['processed'] + stats['cached'])
+        logging.info(f"Species progress: {stats['processed']} processed, {stats['cached']} from cache, {remaining} remaining")
+
+    pending_groups = []
+    for group in unique_groups:
+        if is_done(group):
+            stats['cached'] += len(species_by_group[group])
+        else:
+            pending_groups.append(group)
+    if stats['cached']:
+        logging.info(f"Reusing {len(unique_groups) - len(pending_groups)} groups finished by an earlier run")
 
-        # Save progress and print status
+    # Groups run concurrently (RAG, aggregation and the AI summary of different groups overlap),
+    # but are committed in their original order so the output files do not depend on timing
+    completed = {}
+    next_to_commit = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending_groups) or 1))) as executor:
+            futures = {executor.submit(process_group, group): position for position, group in enumerate(pending_groups)}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Processing groups"):
+                position = futures[future]
+                try:
+                    completed[position] = future.result()
+                except Exception as e:
+                    logging.error(f"Error processing group {pending_groups[position]}: {str(e)}")
+                    completed[position] = None
+                while next_to_commit in completed:
+                    result = completed.pop(next_to_commit)
+                    if result is not None:
+                        commit_group(pending_groups[next_to_commit], result)
+                    next_to_commit += 1
+    finally:
+        # Assemble the aggregate files once, also when the run stops early
+        save_json_with_lock(group_diet_data, group_diet_file)
         save_json_with_lock(all_diet_data, output_file)
-        total_species = sum(len(extract_species_names(json.dumps(grouped_species_data[g]))) for g in unique_groups)
-        remaining = total_species - (stats['processed'] + stats['cached'])
-        print(f"\nSpecies progress: {stats['processed']} processed, {stats['cached']} from cache, {remaining} remaining")
+        try:
+            evidence_file = os.path.join(os.path.dirname(output_file), EVIDENCE_MATRIX_FILE)
+            EvidenceMatrix.build(group_diet_data, list(available_groups), species_group_lookup).save(evidence_file)
+        except Exception as e:
+            logging.error(f"Error saving the diet evidence matrix: {str(e)}")
 
-    print(f"\nProcessing complete: {stats['processed']} species processed, {stats['cached']} from cache")
+    events.summary("Species")
+    logging.info(f"Processing complete: {stats['processed']} species processed, {stats['cached']} from cache")
     return all_diet_data
 
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) < 2:
-        print("Usage: python 04_gather_diet_data.py [output_dir]")
+    args, verbose = pop_verbose_flag(sys.argv[1:])
+    if not args:
+        print("Usage: python 04_gather_diet_data.py [output_dir] [--verbose]")
         sys.exit(1)
+    configure_logging(verbose)
     
-    output_dir = sys.argv[1] if len(sys.argv) > 1 else 'outputs'
+    output_dir = args[0]
     logging.info("Starting diet data gathering process...")
     
+    # Opt-in switch saved by main.py --weight_by_occurrence
+    weight_by_occurrence = False
+    ai_config_file = os.path.join(EWE_DIR, output_dir, 'ai_config.json')
+    if os.path.exists(ai_config_file):
+        weight_by_occurrence = bool((load_json_with_lock(ai_config_file) or {}).get('weightByOccurrence', False))
+    logging.info(f"Weight representative species by occurrence: {weight_by_occurrence}")
+    
     directory = os.path.join(EWE_DIR, "SW_Atlantis_Diets_of_Functional_Groups")
     grouped_species_json = os.path.join(EWE_DIR, output_dir, "03_grouped_species_assignments.json")
     species_data_json = os.path.join(EWE_DIR, output_dir, "02_species_data.json")
@@ -546,14 +609,20 @@ if __name__ == "__main__":
         for item in os.listdir(EWE_DIR):
             logging.info(f"  {'[DIR]' if os.path.isdir(os.path.join(EWE_DIR, item)) else '[FILE]'} {item}")
     else:
-        with open(grouped_species_json, 'r', encoding='utf-8') as f:
-            grouped_species_data = json.load(f)
+        context = RunContext.load(os.path.join(EWE_DIR, output_dir))
         
         with open(species_data_json, 'r', encoding='utf-8') as f:
             species_data = json.load(f)
+
+        # Read only the GLOBI columns needed for prey/predator counts
+        globi_interactions = None
+        if has_globi_dataset(os.path.join(EWE_DIR, output_dir)):
+            globi_interactions = read_globi_interactions(os.path.join(EWE_DIR, output_dir), columns=GLOBI_DIET_COLUMNS)
                
         try:
-            diet_data = gather_all_diet_data(directory, grouped_species_data, species_data, output_file, output_dir)
+            diet_data = gather_all_diet_data(directory, context.grouped_species_data, species_data, output_file, output_dir,
+                                             globi_interactions, weight_by_occurrence=weight_by_occurrence,
+                                             context=context)
 
             if diet_data is not None:
                 readable_output = os.path.join(EWE_DIR, output_dir, '04e_diet_summaries_readable.txt')
@@ -4,6 +4,9 @@ import pandas as pd
 import argparse
 import re
 from ask_AI import ask_ai
+from run_context import RunContext
+from diet_data_utils import clean_group_name
+from diet_evidence import load_evidence_matrix
 import logging
 
 # Set up logging
@@ -23,11 +26,6 @@ def load_ai_config(output_dir):
             'constructDietMatrixAI': 'gemini'
         }
 
-def load_species_list(filename):
-    with open(filename, 'r') as f:
-        data = json.load(f)
-    return list(data.keys())
-
 def load_diet_data(filename):
     with open(filename, 'r') as f:
         data = json.load(f)
@@ -121,13 +119,24 @@ def save_intermediate_results(filename, data):
     with open(filename, 'w') as f:
         json.dump(data, f, indent=2)
 
-def construct_diet_matrix(species_list, diet_data, intermediate_file, ai_model):
+def construct_diet_matrix(species_list, diet_data, intermediate_file, ai_model, group_index=None, evidence=None):
+    """Predator x prey matrix of diet proportions.
+
+    Rows of predators without diet proportions stay empty, unless evidence (the step 4
+    EvidenceMatrix, passed only with --evidence_fallback) is given: those rows are then
+    filled with the predator's raw evidence shares.
+    """
     intermediate_results = load_intermediate_results(intermediate_file)
     
     # Combine species_list with keys from intermediate_results
     all_species = list(set(species_list + list(intermediate_results.keys())))
     
-    matrix = pd.DataFrame(0, index=all_species, columns=all_species)
+    # Float from the start: pandas no longer upcasts an integer frame when proportions are set
+    matrix = pd.DataFrame(0.0, index=all_species, columns=all_species)
+    # Lowercased once for the partial matches below, not once per prey item
+    lowered_species = [(species.lower(), species) for species in all_species]
+    # Step 4 evidence uses the cleaned group names
+    species_by_clean_name = {clean_group_name(species): species for species in all_species}
     
     for predator in all_species:
         logging.info(predator)
@@ -141,7 +150,15 @@ def construct_diet_matrix(species_list, diet_data, intermediate_file, ai_model):
                     intermediate_results[predator] = proportions
                     save_intermediate_results(intermediate_file, intermediate_results)
             else:
-                continue
+                proportions = None
+            
+            if not proportions and evidence is not None and predator in evidence:
+                # Opted in: fall back to the uncurated GLOBI and FishBase/SeaLifeBase counts of step 4
+                proportions = scale_proportions({species_by_clean_name[prey]: share
+                                                 for prey, share in evidence.proportions(predator).items()
+                                                 if prey in species_by_clean_name})
+                if proportions:
+                    logging.warning(f"No diet proportions for '{predator}'; filled its row with raw step 4 evidence shares")
             
             # Only process if we have valid proportions
             if proportions and isinstance(proportions, dict):
@@ -150,10 +167,14 @@ def construct_diet_matrix(species_list, diet_data, intermediate_file, ai_model):
                         continue
                     if prey in all_species:
                         matrix.at[predator, prey] = float(proportion)
+                    elif group_index is not None and group_index.get(prey) in all_species:
+                        # The model named a taxon instead of its group
+                        matrix.at[predator, group_index.get(prey)] = float(proportion)
                     else:
                         # Handle cases where the prey item doesn't exactly match a species in the list
-                        for species in all_species:
-                            if prey.lower() in species.lower():
+                        lowered_prey = prey.lower()
+                        for lowered, species in lowered_species:
+                            if lowered_prey in lowered:
                                 matrix.at[predator, species] = float(proportion)
                                 break
                         else:
@@ -164,21 +185,36 @@ def construct_diet_matrix(species_list, diet_data, intermediate_file, ai_model):
     
     return matrix
 
-def main(species_file, diet_file, output_file, intermediate_file, output_dir):
+def main(species_file, diet_file, output_file, intermediate_file, output_dir, evidence_fallback=False):
     print("Loading AI configuration...")
     ai_config = load_ai_config(output_dir)
     ai_model = ai_config.get('constructDietMatrixAI', 'gemini')
     print(f"Using AI model: {ai_model} for constructing diet matrix")
 
     print(f"Loading species list from {species_file}")
-    species_list = load_species_list(species_file)
+    context = RunContext.load(os.path.dirname(species_file), species_file)
+    species_list = context.groups
     
     print(f"Loading diet data from {diet_file}")
     diet_data = load_diet_data(diet_file)
     
+    group_index = None
+    try:
+        group_index = context.group_index
+    except (OSError, ValueError) as e:
+        logging.warning(f"Group index not available, prey names are matched to groups by substring only: {e}")
+    
+    evidence = None
+    if evidence_fallback:
+        evidence = load_evidence_matrix(os.path.dirname(diet_file))
+        if evidence is None:
+            logging.warning("--evidence_fallback given but no step 4 evidence matrix was found")
+        else:
+            logging.warning("Rows of groups without diet proportions will be filled from the step 4 evidence matrix")
+    
     print("Constructing diet matrix")
     try:
-        diet_matrix = construct_diet_matrix(species_list, diet_data, intermediate_file, ai_model)
+        diet_matrix = construct_diet_matrix(species_list, diet_data, intermediate_file, ai_model, group_index, evidence)
         
         print("Diet Matrix:")
         print(diet_matrix)
@@ -203,6 +239,8 @@ if __name__ == "__main__":
     parser.add_argument("--diet_file", help="Path to the diet data file")
     parser.add_argument("--output_file", help="Path to save the output diet matrix")
     parser.add_argument("--intermediate_file", help="Path to save/load intermediate results")
+    parser.add_argument("--evidence_fallback", action="store_true",
+                        help="Fill the rows of groups without diet proportions with their raw step 4 evidence shares")
     
     args = parser.parse_args()
     
@@ -216,6 +254,6 @@ if __name__ == "__main__":
     if not args.intermediate_file:
         args.intermediate_file = os.path.join(EWE_DIR, args.output_dir, "05_intermediate_results.json")
     
-    success = main(args.species_file, args.diet_file, args.output_file, args.intermediate_file, args.output_dir)
+    success = main(args.species_file, args.diet_file, args.output_file, args.intermediate_file, args.output_dir, args.evidence_fallback)
     if not success:
         sys.exit(1)
@@ -0,0 +1,75 @@
+"""Benchmark vectorized rank resolution against the former row-wise implementation.
+
+Usage: python benchmark_rank_resolution.py [n_records]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from taxon_ranks import RANK_COLUMNS, resolve_ranks
+
+def get_rank_value(row):
+    """Row-wise rank resolution, as step 1 did it before (port of the R remove_general_entries)"""
+    def is_filled(value):
+        return not pd.isna(value) and value != ''
+
+    scientific_name = row['scientificName']
+    for position, rank in enumerate(RANK_COLUMNS[1:], start=2):
+        if is_filled(row[rank]) and is_filled(scientific_name) and scientific_name == row[rank]:
+            return position
+    if is_filled(scientific_name):
+        word_count = len(scientific_name.split(' '))
+        if word_count == 2:
+            return 1
+        elif word_count == 1:
+            return 2
+    for position, rank in enumerate(RANK_COLUMNS, start=1):
+        if is_filled(row[rank]):
+            return position
+    return len(RANK_COLUMNS) + 1
+
+def make_checklist(n_records, seed=42):
+    """Synthetic OBIS checklist mixing species, genus, family and incomplete records"""
+    rng = np.random.default_rng(seed)
+    genus_ids = rng.integers(0, n_records // 10 + 1, n_records)
+    df = pd.DataFrame({
+        'kingdom': 'Animalia',
+        'phylum': [f"Phylum{g % 7}" for g in genus_ids],
+        'class': [f"Class{g % 31}" for g in genus_ids],
+        'order': [f"Order{g % 97}" for g in genus_ids],
+        'family': [f"Family{g % 401}" for g in genus_ids],
+        'genus': [f"Genus{g}" for g in genus_ids],
+    })
+    kind = rng.choice(['species', 'subspecies', 'genus', 'family', 'missing'], n_records,
+                      p=[0.75, 0.05, 0.1, 0.05, 0.05])
+    names = np.where(kind == 'species', df['genus'] + ' sp' + pd.Series(rng.integers(0, 50, n_records)).astype(str),
+            np.where(kind == 'subspecies', df['genus'] + ' sp1 var2',
+            np.where(kind == 'genus', df['genus'],
+            np.where(kind == 'family', df['family'], None))))
+    df.insert(0, 'scientificName', names)
+    # Some records lack lower ranks, as OBIS returns for higher taxa
+    df.loc[kind == 'family', 'genus'] = None
+    df.loc[rng.random(n_records) < 0.02, 'order'] = ''
+    return df
+
+def main(n_records=100_000):
+    df = make_checklist(n_records)
+    print(f"Synthetic checklist: {len(df)} records")
+
+    start = time.perf_counter()
+    row_wise = df.apply(get_rank_value, axis=1)
+    row_wise_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = resolve_ranks(df)
+    vectorized_time = time.perf_counter() - start
+
+    mismatches = int((row_wise.to_numpy() != vectorized.to_numpy()).sum())
+    print(f"Row-wise:   {row_wise_time:.3f}s")
+    print(f"Vectorized: {vectorized_time:.3f}s ({row_wise_time / vectorized_time:.1f}x faster)")
+    print(f"Rank counts: {vectorized.value_counts().sort_index().to_dict()}")
+    print(f"Mismatches: {mismatches}")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
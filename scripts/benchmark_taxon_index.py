@@ -0,0 +1,117 @@
+"""Benchmark the inverted taxon index behind find_functional_group against the former tree scans.
+
+The tree scans are timed on a sample of the interactions and extrapolated, since scanning
+every group for each of 100k interactions takes far too long.
+
+Usage: python benchmark_taxon_index.py [n_interactions] [legacy_sample]
+"""
+import sys
+import time
+import zlib
+import numpy as np
+import pandas as pd
+from diet_data_utils import find_functional_group, find_functional_group_from_path, normalize_category
+
+def legacy_find_functional_group(taxon_name, grouped_species_data):
+    """Tree scan, as find_functional_group did it before"""
+    for func_group, taxonomy_tree in grouped_species_data.items():
+        def traverse_tree(tree):
+            if isinstance(tree, dict):
+                if 'specCode' in tree:
+                    return False
+                for key, value in tree.items():
+                    if key.lower() == taxon_name.lower():
+                        return True
+                    if traverse_tree(value):
+                        return True
+            return False
+        if traverse_tree(taxonomy_tree):
+            return func_group
+    return None
+
+def legacy_find_functional_group_from_path(taxon_path, grouped_species_data):
+    """One tree scan per path element, as find_functional_group_from_path did it before"""
+    if not taxon_path or pd.isna(taxon_path):
+        return None, None
+    taxa = [t.strip().lower() for t in str(taxon_path).split('|')]
+    taxa = [t for t in taxa if t and t != 'root']
+    for taxon in reversed(taxa):
+        group = legacy_find_functional_group(taxon, grouped_species_data)
+        if group:
+            return group, taxon
+    return None, None
+
+def lookup_chain(species_name, taxon_path, grouped_species_data, find_group, find_group_from_path):
+    """The lookup order of step 4's find_group_from_interaction"""
+    species_name = normalize_category(species_name)
+    group = find_group(species_name, grouped_species_data)
+    if group:
+        return group
+    if taxon_path:
+        group, _ = find_group_from_path(taxon_path, grouped_species_data)
+        if group:
+            return group
+    return None
+
+def make_region(n_groups=40, n_species=5000, seed=42):
+    """Synthetic grouped species data: groups assigned at order, family, genus or species level"""
+    rng = np.random.default_rng(seed)
+    species = []
+    for i in range(n_species):
+        genus = f"Genus{i // 4}"
+        species.append({
+            'Phylum': f"Phylum{i % 9}", 'Class': f"Class{i % 37}", 'Order': f"Order{i % 113}",
+            'Family': f"Family{i % 409}", 'Genus': genus, 'Species': f"{genus} species{i}"
+        })
+    grouped = {f"Group {g}": {} for g in range(n_groups)}
+    assigned_ranks = rng.choice(['Order', 'Family', 'Genus', 'Species'], n_species, p=[0.1, 0.3, 0.3, 0.3])
+    for record, rank in zip(species, assigned_ranks):
+        group = grouped[f"Group {zlib.crc32(record[rank].encode()) % n_groups}"]
+        node = group.setdefault(record[rank], {})
+        below = ['Order', 'Family', 'Genus', 'Species']
+        for lower in below[below.index(rank) + 1:]:
+            node = node.setdefault(record[lower], {})
+        node.update({'specCode': 1, 'ecology': {}})
+    return grouped, species
+
+def make_interactions(species, n_interactions, seed=7):
+    """GLOBI-like (name, path) pairs: known species, unknown species of known genera, and outsiders"""
+    rng = np.random.default_rng(seed)
+    interactions = []
+    for i in rng.integers(0, len(species), n_interactions):
+        record = species[i]
+        path = ' | '.join(['Animalia', record['Phylum'], record['Class'], record['Order'], record['Family'], record['Genus']])
+        kind = rng.random()
+        if kind < 0.6:
+            interactions.append((record['Species'], path + ' | ' + record['Species']))
+        elif kind < 0.9:
+            interactions.append((f"{record['Genus']} novus", path + f" | {record['Genus']} novus"))
+        else:
+            interactions.append(('unidentified detritus', 'Root | Detritus'))
+    return interactions
+
+def main(n_interactions=100_000, legacy_sample=500):
+    grouped, species = make_region()
+    interactions = make_interactions(species, n_interactions)
+    print(f"Synthetic region: {len(grouped)} groups, {len(species)} species, {len(interactions)} interactions")
+
+    start = time.perf_counter()
+    indexed = [lookup_chain(name, path, grouped, find_functional_group, find_functional_group_from_path)
+               for name, path in interactions]
+    indexed_time = time.perf_counter() - start
+
+    sample = interactions[:legacy_sample]
+    start = time.perf_counter()
+    legacy = [lookup_chain(name, path, grouped, legacy_find_functional_group, legacy_find_functional_group_from_path)
+              for name, path in sample]
+    legacy_time = (time.perf_counter() - start) * len(interactions) / len(sample)
+
+    mismatches = sum(a != b for a, b in zip(legacy, indexed))
+    print(f"Tree scans: {legacy_time:.1f}s (extrapolated from {len(sample)} interactions)")
+    print(f"Index:      {indexed_time:.3f}s ({legacy_time / indexed_time:.0f}x faster)")
+    print(f"Resolved:   {sum(g is not None for g in indexed)} of {len(indexed)}")
+    print(f"Mismatches: {mismatches} of {len(sample)}")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:3])))
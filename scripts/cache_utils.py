@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+# Get the absolute path of the EwE directory
+EWE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Caches shared across models and runs (WoRMS lookups, OBIS tiles, LLM classifications, ...)
+CACHE_DIR = os.path.join(EWE_DIR, 'cache')
+
+def get_cache_path(name):
+    """Return the path of a named cache file inside the shared cache directory"""
+    return os.path.join(CACHE_DIR, name)
+
+def make_cache_key(*parts):
+    """Build a stable key from arbitrary JSON-serializable parts"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+class JsonCache:
+    """Thread-safe key/value cache persisted to a single JSON file.
+
+    Values must be JSON-serializable. On save, entries written meanwhile by other
+    processes (e.g. parallel validation iterations) are merged in, and the file is
+    replaced atomically so an interrupted run never leaves a truncated cache.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._data = self._read()
+        self._discarded = set()
+        self._dirty = False
+
+    def _read(self):
+        if not os.path.exists(self.file_path):
+            return {}
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logging.warning(f"Ignoring unreadable cache {self.file_path}: {e}")
+            return {}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._dirty = True
+
+    def update(self, values):
+        with self._lock:
+            self._data.update(values)
+            self._dirty = bool(values) or self._dirty
+
+    def discard(self, keys):
+        """Remove entries, also from the file on the next save"""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._discarded.add(key)
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+            merged = self._read()
+            merged.update(self._data)
+            for key in self._discarded:
+                merged.pop(key, None)
+            self._data = merged
+            tmp_path = f"{self.file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.file_path)
+            self._discarded = set()
+            self._dirty = False
@@ -6,6 +6,7 @@ import re
 from functools import lru_cache
 from tqdm import tqdm
 import logging
+from group_index import GroupIndex
 
 def load_sealifebase_fooditems_data():
     print("Loading SeaLifeBase food items data... This may take a while.")
@@ -39,6 +40,12 @@ def get_food_items_for_speccode(sealifebase_df, spec_code):
         print(f"Error querying food items for SpecCode {spec_code}: {str(e)}")
         return pd.DataFrame()
 
+# Distinct names remembered by normalize_category and clean_group_name
+NORMALIZE_CACHE_SIZE = 65536
+
+# Parenthesised qualifiers such as "(juvenile)" that clean_group_name drops
+GROUP_QUALIFIER_PATTERN = re.compile(r'\s*\([^)]*\)')
+
 # Lookup table for malformed category names
 CATEGORY_LOOKUP = {
     # Original mappings
@@ -69,10 +76,15 @@ def normalize_category(category_name):
     Returns:
         str: The normalized category name
     """
+    if isinstance(category_name, str):
+        return _normalize_category_text(category_name)
     if pd.isna(category_name):
         return category_name
-    
-    category_name = str(category_name).lower().strip()
+    return _normalize_category_text(str(category_name))
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_category_text(category_name):
+    category_name = category_name.lower().strip()
     
     # First try exact match in lookup table
     if category_name in CATEGORY_LOOKUP:
@@ -90,10 +102,23 @@ def normalize_category(category_name):
     # If all else fails, return original
     return category_name
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def clean_group_name(group_name):
-    return re.sub(r'\s*\([^)]*\)', '', group_name).strip()
+    return GROUP_QUALIFIER_PATTERN.sub('', group_name).strip()
+
+def normalize_many(values, normalizer=normalize_category):
+    """
+    Apply normalize_category (or clean_group_name) to a list, NumPy array or pandas Series.
+
+    Each distinct value is normalized once and missing values are kept as they are.
+    Returns a Series with the same index for a Series, and an object array otherwise.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values, dtype='object')
+    normalized = {value: normalizer(value) for value in series.dropna().unique()}
+    result = series.astype('object').map(normalized).where(series.notna(), series.astype('object'))
+    return result if isinstance(values, pd.Series) else result.to_numpy(dtype=object)
 
-def create_species_group_lookup(grouped_species_data):
+def create_species_group_lookup(grouped_species_data, group_index=None):
     """
     Create a lookup function that maps species to their functional groups based on the taxonomic structure.
     The grouped_species_data structure is expected to be:
@@ -110,51 +135,33 @@ def create_species_group_lookup(grouped_species_data):
             }
         }
     }
+    Names are matched case-insensitively at any rank, then by genus. Pass the step 3
+    group index (see group_index.load_group_index) to avoid walking the tree again.
     """
-    # Create a mapping of species to their functional groups
-    species_to_group = {}
-    for functional_group, taxonomy_tree in grouped_species_data.items():
-        def traverse_tree(tree, group):
-            if isinstance(tree, dict):
-                for key, value in tree.items():
-                    if ' ' in key:  # This is a species name
-                        species_to_group[key.lower()] = group
-                    traverse_tree(value, group)
-        traverse_tree(taxonomy_tree, functional_group)
-
-    # Create a mapping of genera to functional groups
-    genus_to_group = {}
-    for species, group in species_to_group.items():
-        try:
-            genus = species.split()[0]  # Get first word (genus)
-            if genus not in genus_to_group:
-                genus_to_group[genus] = group
-            elif genus_to_group[genus] != group:
-                logging.warning(f"Genus {genus} found in multiple groups: {genus_to_group[genus]} and {group}")
-        except:
-            logging.warning(f"Could not extract genus from {species}")
-
-    def get_group(species_name):
-        if not species_name:
-            return None
-            
-        species_lower = species_name.lower()
-        
-        # First try exact species match
-        if species_lower in species_to_group:
-            return species_to_group[species_lower]
-            
-        # Then try genus match
-        try:
-            genus = species_lower.split()[0]
-            if genus in genus_to_group:
-                return genus_to_group[genus]
-        except:
-            logging.warning(f"Could not extract genus from {species_name}")
-        
-        return None
+    if group_index is None:
+        group_index = GroupIndex.from_assignments(grouped_species_data)
+    return group_index.group_of_species
+
+# Inverted taxon index of the grouped species data last looked up, built once per step 4 run
+_group_index_cache = (None, None)
 
-    return get_group
+def get_group_index(grouped_species_data, group_index=None):
+    """
+    Case-folded taxon -> (group, rank) index of grouped_species_data, built on first use.
+
+    The index is cached for the grouped_species_data object it was built from, which
+    must not be modified afterwards. Pass an already loaded group_index (e.g. the step 3
+    03_group_index.csv) to use it for that object instead of building one.
+    """
+    global _group_index_cache
+    cached_data, cached_index = _group_index_cache
+    if group_index is not None:
+        _group_index_cache = (grouped_species_data, group_index)
+        return group_index
+    if cached_data is not grouped_species_data:
+        cached_index = GroupIndex.from_assignments(grouped_species_data)
+        _group_index_cache = (grouped_species_data, cached_index)
+    return cached_index
 
 def find_functional_group_from_path(taxon_path, grouped_species_data):
     """
@@ -180,85 +187,130 @@ def find_functional_group_from_path(taxon_path, grouped_species_data):
         return None, None
     
     # Search from most specific (end) to least specific (start)
+    group_index = get_group_index(grouped_species_data)
     for taxon in reversed(taxa):
-        for func_group, taxonomy_tree in grouped_species_data.items():
-            def traverse_tree(tree):
-                if isinstance(tree, dict):
-                    # Skip species-level entries
-                    if 'specCode' in tree:
-                        return False
-                        
-                    for key, value in tree.items():
-                        # Check for exact match (case-insensitive)
-                        if key.lower() == taxon:
-                            return True
-                            
-                        # Recursively search deeper
-                        if traverse_tree(value):
-                            return True
-                return False
-            
-            if traverse_tree(taxonomy_tree):
-                return func_group, taxon
+        func_group = group_index.get(taxon)
+        if func_group is not None:
+            return func_group, taxon
                 
     return None, None
 
 def find_functional_group(taxon_name, grouped_species_data):
     """
-    Find the functional group for a taxon by traversing the taxonomic hierarchy.
+    Find the functional group for a taxon at any rank of the taxonomic hierarchy.
     Returns the functional group name if found, None otherwise.
     """
-    # First try direct match with the taxon name
-    for func_group, taxonomy_tree in grouped_species_data.items():
-        def traverse_tree(tree):
-            if isinstance(tree, dict):
-                # Skip species-level entries
-                if 'specCode' in tree:
-                    return False
-                    
-                for key, value in tree.items():
-                    # Check for exact match (case-insensitive)
-                    if key.lower() == taxon_name.lower():
-                        return True
-                        
-                    # Recursively search deeper
-                    if traverse_tree(value):
-                        return True
-            return False
-        
-        if traverse_tree(taxonomy_tree):
-            return func_group
-            
-    return None
+    return get_group_index(grouped_species_data).get(taxon_name)
 
 
+# GLOBI interaction types in which the harvested species is the predator or the prey
+GLOBI_PREDATOR_TYPES = ['eats', 'preyson']
+GLOBI_PREY_TYPES = ['eatenby', 'preyeduponby']
+
+def groups_from_paths(paths, lookup_table):
+    """Group of the most specific taxon in each ' | '-separated path, as find_functional_group_from_path"""
+    paths = pd.Series(paths, dtype='object')
+    parts = paths.astype(str).str.split('|').explode().str.strip().str.lower()
+    parts = parts[(parts != '') & (parts != 'root')]
+    groups = parts.str.casefold().map(lookup_table).dropna()
+    # The last match along a path is its most specific taxon
+    most_specific = groups.groupby(level=0).last()
+    return dict(zip(paths[most_specific.index], most_specific.values))
+
+def aggregate_globi_interactions(interactions, grouped_species_data):
+    """
+    Count prey and predator functional groups of every species in a DataFrame of GLOBI interactions.
+
+    Follows the lookup chain of step 4: the normalized taxon name in the group index,
+    then its taxon path, then the cleaned name itself. Names are normalized once per
+    distinct value and all rows are counted with one groupby.
+
+    Returns {species: {'prey_items': {group: count}, 'predator_items': {group: count}}},
+    groups in the order they first occur.
+    """
+    if interactions is None or interactions.empty:
+        return {}
+    types = interactions['interactionTypeName'].astype('string').str.lower()
+
+    parts = []
+    for role, type_names, name_column, path_column in [
+            ('prey_items', GLOBI_PREDATOR_TYPES, 'targetTaxonName', 'targetTaxonPath'),
+            ('predator_items', GLOBI_PREY_TYPES, 'sourceTaxonName', 'sourceTaxonPath')]:
+        mask = types.isin(type_names).fillna(False).to_numpy(dtype=bool)
+        parts.append(pd.DataFrame({
+            'species': interactions.loc[mask, 'species'].astype('string'),
+            'role': role,
+            'name': interactions.loc[mask, name_column].astype('string'),
+            'path': interactions.loc[mask, path_column].astype('string')
+        }))
+    rows = pd.concat(parts, ignore_index=True)
+    rows = rows[~rows['name'].fillna('').isin(['', 'no:match'])]
+    if rows.empty:
+        return {}
+
+    rows['name'] = normalize_many(rows['name']).astype('string')
+    rows = rows[~rows['name'].fillna('').isin(['', 'no:match'])]
+
+    lookup_table = get_group_index(grouped_species_data).lookup_table()
+    groups = rows['name'].str.strip().str.casefold().map(lookup_table).astype('object')
+    by_path = groups.isna() & ~rows['path'].fillna('').eq('')
+    if by_path.any():
+        path_groups = groups_from_paths(rows.loc[by_path, 'path'].unique(), lookup_table)
+        groups[by_path] = rows.loc[by_path, 'path'].map(path_groups)
+    unmatched = groups.isna()
+    groups[unmatched] = normalize_many(rows.loc[unmatched, 'name'], clean_group_name)
+    rows['group'] = groups
+    rows = rows[~rows['group'].fillna('').eq('')]
+
+    counts = rows.groupby(['species', 'role', 'group'], sort=False, observed=True).size()
+    result = {}
+    for (species, role, group), count in counts.items():
+        result.setdefault(species, {'prey_items': {}, 'predator_items': {}})[role][group] = int(count)
+    return result
+
 @lru_cache(maxsize=None)
 def extract_species_names(group_data):
-    data = json.loads(group_data)  # Convert JSON string back to Python object
-    if data is None:
+    """species_names_in for a group serialized as a JSON string"""
+    return species_names_in(json.loads(group_data))
+
+def species_names_in(group_data, spec_codes=None, paths=None):
+    """
+    Species names of one group's taxonomy subtree, in tree order.
+
+    Any key containing a space counts as a species name, as step 4 has always done.
+    Optionally fills spec_codes ({species: specCode}) and paths ({species: [keys from
+    the group down to the species]}) for the species records found in the same walk.
+    """
+    if group_data is None:
         return []
     
     species_names = []
-    def traverse(data, parent_key=None):
+    seen = set()
+    def traverse(data, path):
         if isinstance(data, dict):
             for key, value in data.items():
                 if ' ' in key:
                     species_names.append(key)
+                    seen.add(key)
                 if isinstance(value, dict):
                     if 'specCode' in value:
-                        if key not in species_names:
+                        if key not in seen:
                             species_names.append(key)
-                    traverse(value, key)
+                            seen.add(key)
+                        if spec_codes is not None:
+                            spec_codes.setdefault(key, value['specCode'])
+                        if paths is not None:
+                            paths.setdefault(key, path + [key])
+                    traverse(value, path + [key])
                 elif isinstance(value, list):
                     for item in value:
-                        traverse(item, key)
+                        traverse(item, path + [key])
         elif isinstance(data, list):
             for item in data:
-                traverse(item, parent_key)
+                traverse(item, path)
     
-    traverse(data)
-    species_names_filtered = [s for s in species_names if " " in s]
-    return species_names_filtered
+    traverse(group_data, [])
+    return [s for s in species_names if " " in s]
 
 def get_spec_code(group_data, species_name):
     def traverse(data):
@@ -0,0 +1,280 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from diet_data_utils import clean_group_name, normalize_category
+from token_utils import count_tokens, truncate_to_tokens
+
+# Ceiling of the evidence text in the step 4 prompt, in tokens (as count_tokens measures them)
+DIET_EVIDENCE_MAX_TOKENS = 2000
+
+# Share of the ceiling the literature text may use; the table gets the rest
+LITERATURE_TOKEN_SHARE = 0.4
+
+# Prey rows listed individually before the rest is collapsed into "other" rows
+MAX_PREY_ROWS = 25
+
+# Predator groups listed for reference
+MAX_PREDATOR_ROWS = 5
+
+# Predator group x prey group evidence written by step 4 next to 04d_diet_summaries.json
+EVIDENCE_MATRIX_FILE = '04_evidence_matrix.npz'
+EVIDENCE_CHANNELS = ['globi', 'database', 'literature']
+
+DATABASE_SOURCES = {'fishbase_data': 'FishBase', 'sealifebase_data': 'SeaLifeBase'}
+GLOBI_CATEGORY = 'GLOBI'
+
+def _food_path(item):
+    """FoodCategories or FoodI > FoodII > FoodIII of a database food item, as compress_food_categories reads them"""
+    if 'FoodCategories' in item:
+        return [c for c in str(item['FoodCategories']).split(' > ') if c]
+    if all(k in item for k in ['FoodI', 'FoodII', 'FoodIII']):
+        categories = [item['FoodI'], item['FoodII'], item['FoodIII']]
+        return [c for c in categories if c and str(c).lower() != 'n.a./others']
+    return []
+
+def collect_prey_evidence(species_data, species_group_lookup=None):
+    """
+    Evidence per prey item from the per-species data of a group (04a species_data).
+
+    Database food items are keyed by their food category path, GLOBI prey by functional
+    group (or cleaned name). Returns {prey: {'category', 'records', 'globi', 'species', 'sources'}}
+    where species and sources are sets.
+    """
+    evidence = {}
+
+    def add(prey, category, species, source, records=0, globi=0):
+        row = evidence.setdefault(prey, {'category': category, 'records': 0, 'globi': 0, 'species': set(), 'sources': set()})
+        row['records'] += records
+        row['globi'] += globi
+        row['species'].add(species)
+        row['sources'].add(source)
+
+    for species, data in species_data.items():
+        for field, source in DATABASE_SOURCES.items():
+            for item in data.get(field) or []:
+                path = _food_path(item)
+                if path:
+                    add(' > '.join(path), path[0], species, source, records=1)
+        for prey, count in ((data.get('globi_data') or {}).get('prey_items') or {}).items():
+            prey_group = species_group_lookup(prey) if species_group_lookup is not None else None
+            add(prey_group or clean_group_name(prey), GLOBI_CATEGORY, species, GLOBI_CATEGORY, globi=count)
+    return evidence
+
+def _mentioned(name, literature, literature_words):
+    """Whether the (lowercase) literature text names a prey as whole words"""
+    name = name.strip().lower()
+    words = re.findall(r'\w+', name)
+    # Most names fail the word-set test, so the text is only searched for the few that pass
+    if not words or not all(word in literature_words for word in words):
+        return False
+    return name == words[0] or re.search(rf"\b{re.escape(name)}\b", literature) is not None
+
+def rank_prey_evidence(evidence, literature_text=''):
+    """Prey rows strongest first: by reporting species, sources, literature mentions, then records"""
+    literature = literature_text.lower()
+    literature_words = set(re.findall(r'\w+', literature))
+    rows = []
+    for prey, row in evidence.items():
+        rows.append({
+            'prey': prey,
+            'category': row['category'],
+            'species': len(row['species']),
+            'sources': len(row['sources']),
+            'records': row['records'],
+            'globi': row['globi'],
+            'literature': _mentioned(prey.split(' > ')[-1], literature, literature_words),
+            'species_set': row['species'],
+            'source_set': row['sources']
+        })
+    rows.sort(key=lambda r: (-r['species'], -r['sources'], -r['literature'], -(r['records'] + r['globi']), r['prey']))
+    return rows
+
+def _collapse(rows, by_category=True):
+    """One "other" row per category (or a single one) for the rows past the listed ones"""
+    buckets = {}
+    for row in rows:
+        key = row['category'] if by_category else None
+        bucket = buckets.setdefault(key, {'items': 0, 'records': 0, 'globi': 0, 'species_set': set(),
+                                          'source_set': set(), 'literature': False})
+        bucket['items'] += 1
+        bucket['records'] += row['records']
+        bucket['globi'] += row['globi']
+        bucket['species_set'] |= row['species_set']
+        bucket['source_set'] |= row['source_set']
+        bucket['literature'] |= row['literature']
+    collapsed = []
+    for key, bucket in buckets.items():
+        label = f"Other {key} prey" if key == GLOBI_CATEGORY else (f"Other {key}" if key else "Other prey")
+        collapsed.append({
+            'prey': f"{label} ({bucket['items']} items)",
+            'species': len(bucket['species_set']),
+            'sources': len(bucket['source_set']),
+            'records': bucket['records'],
+            'globi': bucket['globi'],
+            'literature': bucket['literature']
+        })
+    collapsed.sort(key=lambda r: (-(r['records'] + r['globi']), r['prey']))
+    return collapsed
+
+def format_evidence_table(rows, total_species):
+    lines = [f"Prey evidence (species = of {total_species} in the group reporting it; "
+             f"db = FishBase/SeaLifeBase food items; globi = GLOBI interactions; lit = named in the literature below):",
+             "prey | species | db | globi | lit"]
+    for row in rows:
+        lines.append(f"{row['prey']} | {row['species']} | {row['records']} | {row['globi']} | {'yes' if row['literature'] else '-'}")
+    return '\n'.join(lines)
+
+def format_predators(predator_items, max_rows=MAX_PREDATOR_ROWS):
+    if not predator_items:
+        return ''
+    ranked = sorted(predator_items.items(), key=lambda item: (-item[1], item[0]))
+    listed = ', '.join(f"{name} ({count})" for name, count in ranked[:max_rows])
+    rest = len(ranked) - max_rows
+    return f"GLOBI predators of the group: {listed}" + (f" and {rest} more" if rest > 0 else '')
+
+def summarize_diet_evidence(group_entry, species_group_lookup=None, max_tokens=DIET_EVIDENCE_MAX_TOKENS,
+                            max_rows=MAX_PREY_ROWS):
+    """
+    Evidence text of one group (a 04a entry) for the diet prompt, at most max_tokens long.
+
+    The literature (RAG) text gets up to LITERATURE_TOKEN_SHARE of the ceiling; the prey
+    table gets the rest, listing as many of the strongest prey as fit (up to max_rows)
+    and collapsing the others into one "other" row per food category.
+    """
+    species_data = group_entry.get('species_data') or {}
+    summary = group_entry.get('group_summary') or {}
+    literature = '\n'.join(str(result) for result in summary.get('rag_results') or [] if result)
+
+    literature_text = ''
+    if literature:
+        literature_text = "Literature:\n" + truncate_to_tokens(literature, int(max_tokens * LITERATURE_TOKEN_SHARE))
+    predators = format_predators(summary.get('predator_items') or {})
+    table_budget = max_tokens - count_tokens(literature_text) - count_tokens(predators) - 1
+
+    rows = rank_prey_evidence(collect_prey_evidence(species_data, species_group_lookup), literature)
+    table = ''
+    if rows:
+        # Fewer listed rows until the table fits; at the end a single "other" row is left
+        for listed in range(min(max_rows, len(rows)), -1, -1):
+            rest = rows[listed:]
+            table = format_evidence_table(rows[:listed] + _collapse(rest), len(species_data))
+            if count_tokens(table) <= table_budget:
+                break
+            table = format_evidence_table(rows[:listed] + _collapse(rest, by_category=False), len(species_data))
+            if count_tokens(table) <= table_budget:
+                break
+    else:
+        table = "No FishBase, SeaLifeBase or GLOBI diet records for this group."
+
+    text = '\n\n'.join(part for part in [table, predators, literature_text] if part)
+    return truncate_to_tokens(text, max_tokens)
+
+class EvidenceMatrix:
+    """Diet evidence between the functional groups of a model, as dense arrays.
+
+    values[channel, predator, prey] holds, per EVIDENCE_CHANNELS: GLOBI interactions of the
+    predator group's species with the prey group, FishBase/SeaLifeBase food items naming a
+    prey taxon of the group, and 1 when the predator's literature (RAG) text names the prey
+    group. unassigned[channel, predator] counts the evidence whose prey is no group.
+    """
+
+    def __init__(self, groups, values, unassigned=None, channels=EVIDENCE_CHANNELS):
+        self.groups = list(groups)
+        self.channels = list(channels)
+        self.values = values
+        self.unassigned = unassigned if unassigned is not None else np.zeros(values.shape[:2], dtype=values.dtype)
+        self._positions = {name.casefold(): i for i, name in enumerate(self.groups)}
+
+    @classmethod
+    def build(cls, group_diet_data, groups, species_group_lookup=None):
+        """
+        Matrix of the 04a group entries over groups (the cleaned group names of 04d).
+
+        Every prey name of every group is collected first and each distinct name is
+        resolved to a group once; all counts are then added with one np.add.at.
+        """
+        groups = list(groups)
+        positions = {name.casefold(): i for i, name in enumerate(groups)}
+        predators, names, channels, counts = [], [], [], []
+        literature_texts = {}
+        for predator, entry in group_diet_data.items():
+            p = positions.get(clean_group_name(predator).casefold())
+            if p is None:
+                continue
+            summary = entry.get('group_summary') or {}
+            for prey, count in (summary.get('prey_items') or {}).items():
+                predators.append(p); names.append(prey); channels.append(0); counts.append(count)
+            for data in (entry.get('species_data') or {}).values():
+                for field in DATABASE_SOURCES:
+                    for item in data.get(field) or []:
+                        if item.get('Foodname'):
+                            predators.append(p); names.append(item['Foodname']); channels.append(1); counts.append(1)
+            literature = '\n'.join(str(result) for result in summary.get('rag_results') or [] if result).lower()
+            if literature:
+                literature_texts[p] = literature
+
+        def resolve(name):
+            if species_group_lookup is not None:
+                group = species_group_lookup(name) or species_group_lookup(normalize_category(name))
+                if group is not None:
+                    name = group
+            return positions.get(clean_group_name(str(name)).casefold(), -1)
+
+        values = np.zeros((len(EVIDENCE_CHANNELS), len(groups), len(groups)), dtype=np.float64)
+        unassigned = np.zeros((len(EVIDENCE_CHANNELS), len(groups)), dtype=np.float64)
+        if names:
+            rows = pd.DataFrame({'predator': predators, 'name': names, 'channel': channels,
+                                 'count': pd.to_numeric(pd.Series(counts), errors='coerce').fillna(0)})
+            resolved = {name: resolve(name) for name in rows['name'].unique()}
+            prey = rows['name'].map(resolved).to_numpy()
+            matched = prey >= 0
+            channel, predator, count = rows['channel'].to_numpy(), rows['predator'].to_numpy(), rows['count'].to_numpy()
+            np.add.at(values, (channel[matched], predator[matched], prey[matched]), count[matched])
+            np.add.at(unassigned, (channel[~matched], predator[~matched]), count[~matched])
+
+        for p, literature in literature_texts.items():
+            literature_words = set(re.findall(r'\w+', literature))
+            for q, name in enumerate(groups):
+                if q != p and _mentioned(name, literature, literature_words):
+                    values[2, p, q] = 1
+        return cls(groups, values, unassigned)
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path, allow_pickle=False) as data:
+            return cls(data['groups'].tolist(), data['values'], data['unassigned'], data['channels'].tolist())
+
+    def save(self, file_path):
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, groups=np.array(self.groups, dtype=str), channels=np.array(self.channels, dtype=str),
+                                values=self.values, unassigned=self.unassigned)
+        os.replace(tmp_path, file_path)
+
+    def __contains__(self, group):
+        return clean_group_name(str(group)).casefold() in self._positions
+
+    def channel(self, name):
+        """One channel as a DataFrame, predators as rows and prey as columns"""
+        return pd.DataFrame(self.values[self.channels.index(name)], index=self.groups, columns=self.groups)
+
+    def total(self, channels=('globi', 'database')):
+        return pd.DataFrame(sum(self.values[self.channels.index(name)] for name in channels),
+                            index=self.groups, columns=self.groups)
+
+    def proportions(self, predator, channels=('globi', 'database')):
+        """{prey group: share} of a predator's counted evidence, or {} when it has none"""
+        p = self._positions.get(clean_group_name(str(predator)).casefold())
+        if p is None:
+            return {}
+        row = sum(self.values[self.channels.index(name), p] for name in channels)
+        total = row.sum()
+        if total <= 0:
+            return {}
+        return {self.groups[q]: float(row[q] / total) for q in np.flatnonzero(row)}
+
+def load_evidence_matrix(output_dir):
+    """EvidenceMatrix written by step 4 in output_dir, or None for models without one"""
+    file_path = os.path.join(output_dir, EVIDENCE_MATRIX_FILE)
+    return EvidenceMatrix.load(file_path) if os.path.exists(file_path) else None
@@ -2,36 +2,35 @@ import os
 import json
 import pandas as pd
 from collections import Counter
+from globi_store import GLOBI_DATASET_DIR, has_globi_dataset, read_globi_interactions, inline_interactions_frame
+
+def count_unspecified(target_names, unspecified_categories):
+    for target_name in target_names.dropna().astype(str):
+        if target_name and 'unspecified' in target_name.lower():
+            unspecified_categories[target_name.lower()] += 1
 
 def find_unspecified_categories(directory):
     """
-    Search through species data files in the given directory for any 'unspecified' categories
+    Search through the model directories under the given directory for any 'unspecified' categories
     in GLOBI target taxon names.
     """
     unspecified_categories = Counter()
     
     # Walk through the directory
     for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file == '02_species_data.json':  # This file contains the GLOBI data
-                file_path = os.path.join(root, file)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        species_data = json.load(f)
-                        
-                        # Iterate through each species
-                        for species_info in species_data.values():
-                            if 'diet' in species_info and 'GLOBI' in species_info['diet']:
-                                globi_data = species_info['diet']['GLOBI']
-                                
-                                # Check interactions
-                                if 'interactions' in globi_data:
-                                    for interaction in globi_data['interactions']:
-                                        target_name = interaction.get('targetTaxonName', '')
-                                        if target_name and 'unspecified' in target_name.lower():
-                                            unspecified_categories[target_name.lower()] += 1
-                except Exception as e:
-                    print(f"Error processing {file_path}: {str(e)}")
+        try:
+            # GLOBI interactions are stored as a Parquet dataset next to the species data
+            if os.path.basename(root) != GLOBI_DATASET_DIR and has_globi_dataset(root):
+                interactions = read_globi_interactions(root, columns=['targetTaxonName'])
+                count_unspecified(interactions['targetTaxonName'], unspecified_categories)
+            elif '02_species_data.json' in files:
+                # Older models keep the interactions inline in the species data
+                with open(os.path.join(root, '02_species_data.json'), 'r', encoding='utf-8') as f:
+                    species_data = json.load(f)
+                interactions = inline_interactions_frame(species_data, columns=['targetTaxonName'])
+                count_unspecified(interactions['targetTaxonName'], unspecified_categories)
+        except Exception as e:
+            print(f"Error processing {root}: {str(e)}")
     
     return unspecified_categories
 
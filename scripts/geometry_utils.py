@@ -0,0 +1,217 @@
+import os
+import json
+import threading
+import numpy as np
+
+# Douglas-Peucker tolerance in degrees for the cached region (~10 m, the precision sent to OBIS)
+DEFAULT_SIMPLIFY_TOLERANCE = 1e-4
+
+BBOX_SUFFIX = '.bbox.json'
+SIMPLIFIED_SUFFIX = '.simplified.geojson'
+
+_cache_lock = threading.Lock()
+
+def _as_points(coordinates):
+    """Coordinates as an (n, 2) float array, dropping any z/m values"""
+    try:
+        points = np.asarray(coordinates, dtype=float)
+    except ValueError:
+        # Mixed 2D/3D positions make a ragged array
+        points = np.asarray([position[:2] for position in coordinates], dtype=float)
+    if points.size == 0:
+        return np.empty((0, 2))
+    return np.atleast_2d(points)[:, :2]
+
+def iter_geometries(geojson):
+    """Geometries of a FeatureCollection, Feature or bare geometry, with collections flattened"""
+    if geojson is None:
+        return
+    kind = geojson.get('type')
+    if kind == 'FeatureCollection':
+        for feature in geojson.get('features', []):
+            yield from iter_geometries(feature)
+    elif kind == 'Feature':
+        yield from iter_geometries(geojson.get('geometry'))
+    elif kind == 'GeometryCollection':
+        for geometry in geojson.get('geometries', []):
+            yield from iter_geometries(geometry)
+    elif kind is not None:
+        yield geojson
+
+def iter_coordinate_arrays(geometry):
+    """Every point set, line and ring of a geometry as a coordinate array"""
+    kind = geometry['type']
+    coordinates = geometry.get('coordinates') or []
+    if kind in ('Point', 'MultiPoint', 'LineString'):
+        parts = [coordinates]
+    elif kind in ('Polygon', 'MultiLineString'):
+        parts = coordinates
+    elif kind == 'MultiPolygon':
+        parts = [ring for polygon in coordinates for ring in polygon]
+    else:
+        raise ValueError(f"Unsupported geometry type: {kind}")
+    for part in parts:
+        points = _as_points(part)
+        if len(points):
+            yield points
+
+def geojson_bounds(geojson):
+    """(min_lon, min_lat, max_lon, max_lat) over all rings and geometry types, or None if empty"""
+    arrays = [points for geometry in iter_geometries(geojson) for points in iter_coordinate_arrays(geometry)]
+    if not arrays:
+        return None
+    points = np.concatenate(arrays)
+    min_lon, min_lat = points.min(axis=0)
+    max_lon, max_lat = points.max(axis=0)
+    return float(min_lon), float(min_lat), float(max_lon), float(max_lat)
+
+def simplify_line(coordinates, tolerance):
+    """Douglas-Peucker simplification of one line or ring; the end points are always kept"""
+    points = np.asarray(coordinates, dtype=float)
+    if len(points) < 3 or tolerance <= 0:
+        return points
+    xy = points[:, :2]
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Explicit stack instead of recursion, so long coastlines cannot hit the recursion limit
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[start + 1:end]
+        direction = xy[end] - xy[start]
+        offset = segment - xy[start]
+        length = np.hypot(*direction)
+        if length == 0:
+            # Closed ring: measure from the shared start/end point
+            distances = np.hypot(offset[:, 0], offset[:, 1])
+        else:
+            distances = np.abs(direction[0] * offset[:, 1] - direction[1] * offset[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+def _as_ring_array(ring):
+    try:
+        return np.asarray(ring, dtype=float)
+    except ValueError:
+        return _as_points(ring)
+
+def _simplify_ring(ring, tolerance):
+    simplified = simplify_line(_as_ring_array(ring), tolerance)
+    # A ring needs four positions; keep small islands and holes as they were
+    return simplified.tolist() if len(simplified) >= 4 else ring
+
+def simplify_geometry(geometry, tolerance):
+    """Copy of a GeoJSON geometry with its lines and rings simplified"""
+    kind = geometry['type']
+    coordinates = geometry.get('coordinates')
+    if kind == 'GeometryCollection':
+        simplified = {'geometries': [simplify_geometry(g, tolerance) for g in geometry.get('geometries', [])]}
+    elif kind == 'LineString':
+        simplified = {'coordinates': simplify_line(_as_ring_array(coordinates), tolerance).tolist()}
+    elif kind == 'MultiLineString':
+        simplified = {'coordinates': [simplify_line(_as_ring_array(line), tolerance).tolist() for line in coordinates]}
+    elif kind == 'Polygon':
+        simplified = {'coordinates': [_simplify_ring(ring, tolerance) for ring in coordinates]}
+    elif kind == 'MultiPolygon':
+        simplified = {'coordinates': [[_simplify_ring(ring, tolerance) for ring in polygon] for polygon in coordinates]}
+    else:
+        # Points have nothing to simplify
+        return geometry
+    return {**geometry, **simplified}
+
+def simplify_geojson(geojson, tolerance=DEFAULT_SIMPLIFY_TOLERANCE):
+    """Copy of a FeatureCollection, Feature or geometry with every geometry simplified"""
+    kind = geojson.get('type')
+    if kind == 'FeatureCollection':
+        return {**geojson, 'features': [simplify_geojson(feature, tolerance) for feature in geojson.get('features', [])]}
+    if kind == 'Feature':
+        geometry = geojson.get('geometry')
+        return {**geojson, 'geometry': simplify_geometry(geometry, tolerance) if geometry else geometry}
+    return simplify_geometry(geojson, tolerance)
+
+def count_vertices(geojson):
+    return sum(len(points) for geometry in iter_geometries(geojson) for points in iter_coordinate_arrays(geometry))
+
+def is_geographic(geojson):
+    """True unless the GeoJSON declares a CRS other than WGS84 (the tolerance is in degrees)"""
+    name = str(((geojson.get('crs') or {}).get('properties') or {}).get('name', 'CRS84'))
+    return 'CRS84' in name or name.endswith(':4326')
+
+def _cache_paths(geojson_path):
+    base, _ = os.path.splitext(geojson_path)
+    return base + BBOX_SUFFIX, base + SIMPLIFIED_SUFFIX
+
+def _source_stamp(geojson_path):
+    stat = os.stat(geojson_path)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _read_summary(geojson_path, tolerance):
+    bbox_path, simplified_path = _cache_paths(geojson_path)
+    try:
+        with open(bbox_path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if summary.get('source') != _source_stamp(geojson_path) or summary.get('tolerance') != tolerance:
+        return None
+    if summary.get('simplified') and not os.path.exists(simplified_path):
+        return None
+    return summary
+
+def cache_region(geojson_path, tolerance=DEFAULT_SIMPLIFY_TOLERANCE):
+    """Bounds and simplified copy of a region file, cached next to it.
+
+    Writes <name>.bbox.json and <name>.simplified.geojson beside the source and
+    reuses them until the source changes (by mtime and size), so the full file
+    is only parsed once. Returns the summary stored in <name>.bbox.json.
+    """
+    with _cache_lock:
+        summary = _read_summary(geojson_path, tolerance)
+        if summary is not None:
+            return summary
+
+        stamp = _source_stamp(geojson_path)
+        with open(geojson_path, 'r', encoding='utf-8') as f:
+            geojson = json.load(f)
+        bounds = geojson_bounds(geojson)
+        if bounds is None:
+            raise ValueError(f"No coordinates found in {geojson_path}")
+
+        summary = {
+            'source': stamp,
+            'bounds': list(bounds),
+            'tolerance': tolerance,
+            'vertices': count_vertices(geojson),
+            'simplified': False
+        }
+        bbox_path, simplified_path = _cache_paths(geojson_path)
+        if tolerance and is_geographic(geojson):
+            simplified = simplify_geojson(geojson, tolerance)
+            summary['simplified'] = True
+            summary['simplified_vertices'] = count_vertices(simplified)
+            _write_json(simplified_path, simplified)
+        _write_json(bbox_path, summary)
+        return summary
+
+def get_region_bounds(geojson_path):
+    """(min_lon, min_lat, max_lon, max_lat) of a region file, from the cache when possible"""
+    return tuple(cache_region(geojson_path)['bounds'])
+
+def get_simplified_geojson_path(geojson_path, tolerance=DEFAULT_SIMPLIFY_TOLERANCE):
+    """Path of the cached simplified region, or the source itself if it could not be simplified"""
+    summary = cache_region(geojson_path, tolerance)
+    return _cache_paths(geojson_path)[1] if summary['simplified'] else geojson_path
@@ -0,0 +1,143 @@
+import os
+import hashlib
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Directory (inside the model output directory) holding the GLOBI Parquet dataset
+GLOBI_DATASET_DIR = '02_globi_interactions'
+
+# Columns kept for each interaction; everything else GLOBI returns is dropped in step 2
+GLOBI_COLUMNS = [
+    'species',
+    'sourceTaxonName', 'sourceTaxonPath',
+    'interactionTypeName',
+    'targetTaxonName', 'targetTaxonPath',
+    'decimalLatitude', 'decimalLongitude',
+    'referenceCitation'
+]
+
+# Columns needed to aggregate prey/predator counts in step 4
+GLOBI_DIET_COLUMNS = [
+    'species',
+    'sourceTaxonName', 'sourceTaxonPath',
+    'interactionTypeName',
+    'targetTaxonName', 'targetTaxonPath'
+]
+
+# String columns with few distinct values, read back as categoricals to keep memory low
+DICTIONARY_COLUMNS = ['species', 'sourceTaxonName', 'sourceTaxonPath', 'interactionTypeName',
+                      'targetTaxonName', 'targetTaxonPath', 'referenceCitation']
+
+def get_globi_dataset_dir(output_dir):
+    return os.path.join(output_dir, GLOBI_DATASET_DIR)
+
+def has_globi_dataset(output_dir):
+    dataset_dir = get_globi_dataset_dir(output_dir)
+    return os.path.isdir(dataset_dir) and any(f.endswith('.parquet') for f in os.listdir(dataset_dir))
+
+def _write_part(table, file_path):
+    tmp_path = f"{file_path}.tmp"
+    pq.write_table(table, tmp_path, use_dictionary=[c for c in DICTIONARY_COLUMNS if c in table.column_names],
+                   compression='zstd')
+    os.replace(tmp_path, file_path)
+
+def remove_globi_species(output_dir, species):
+    """Drop all rows of the given species from the dataset.
+
+    Parts holding only those species are deleted, parts that also hold other species are
+    rewritten without them. Returns the number of rows removed.
+    """
+    dataset_dir = get_globi_dataset_dir(output_dir)
+    species = sorted(set(species))
+    if not species or not os.path.isdir(dataset_dir):
+        return 0
+    value_set = pa.array(species, type=pa.string())
+    removed = 0
+    for file_name in sorted(os.listdir(dataset_dir)):
+        if not file_name.endswith('.parquet'):
+            continue
+        file_path = os.path.join(dataset_dir, file_name)
+        # Only the species column is read to decide whether the part is affected
+        present = pq.read_table(file_path, columns=['species']).column('species').cast(pa.string())
+        replaced = pc.is_in(present, value_set=value_set)
+        count = pc.sum(replaced).as_py() or 0
+        if not count:
+            continue
+        removed += count
+        if count == len(present):
+            os.remove(file_path)
+        else:
+            table = pq.read_table(file_path)
+            _write_part(table.filter(pc.invert(replaced)), file_path)
+    return removed
+
+def write_globi_interactions(frames, output_dir, species=None):
+    """Write the interactions of a batch of species as one part of the Parquet dataset.
+
+    frames maps species name -> cleaned GLOBI DataFrame. The rows already stored for the
+    species of the batch (species, or the keys of frames) are removed first, so a species
+    that is harvested again replaces its interactions instead of adding them a second time,
+    whichever batch it comes back in.
+    Returns the part path relative to output_dir, or None if there was nothing to write.
+    """
+    removed = remove_globi_species(output_dir, frames.keys() if species is None else species)
+    if removed:
+        logging.info(f"Replacing {removed} stored GLOBI interactions of re-harvested species")
+
+    parts = []
+    for species_name, df in frames.items():
+        if df is None or df.empty:
+            continue
+        part = df.reindex(columns=GLOBI_COLUMNS[1:]).copy()
+        part.insert(0, 'species', species_name)
+        parts.append(part)
+
+    if not parts:
+        return None
+
+    table_df = pd.concat(parts, ignore_index=True)
+    for col in ['decimalLatitude', 'decimalLongitude']:
+        table_df[col] = pd.to_numeric(table_df[col], errors='coerce')
+    for col in DICTIONARY_COLUMNS:
+        table_df[col] = table_df[col].astype('string')
+
+    batch_key = hashlib.sha1('\n'.join(sorted(frames.keys())).encode('utf-8')).hexdigest()[:16]
+    relative_path = os.path.join(GLOBI_DATASET_DIR, f"part-{batch_key}.parquet")
+    file_path = os.path.join(output_dir, relative_path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    _write_part(pa.Table.from_pandas(table_df, preserve_index=False), file_path)
+    logging.info(f"Wrote {len(table_df)} GLOBI interactions for {len(parts)} species to {relative_path}")
+    return relative_path
+
+def read_globi_interactions(output_dir, columns=None, species=None):
+    """Read GLOBI interactions from the Parquet dataset as a DataFrame.
+
+    Only the requested columns are read; string columns come back as categoricals.
+    If species is given, only interactions of those species are returned.
+    """
+    columns = list(columns) if columns else list(GLOBI_COLUMNS)
+    if not has_globi_dataset(output_dir):
+        return pd.DataFrame(columns=columns)
+
+    filters = [('species', 'in', list(species))] if species is not None else None
+    table = pq.read_table(
+        get_globi_dataset_dir(output_dir),
+        columns=columns,
+        filters=filters,
+        read_dictionary=[c for c in columns if c in DICTIONARY_COLUMNS]
+    )
+    return table.to_pandas()
+
+def inline_interactions_frame(species_data, columns=None):
+    """GLOBI interactions kept inline in 02_species_data.json (older models), as a DataFrame"""
+    columns = list(columns) if columns else list(GLOBI_COLUMNS)
+    rows = [
+        {**interaction, 'species': species}
+        for species, record in species_data.items()
+        for interaction in (record.get('diet') or {}).get('GLOBI', {}).get('interactions') or []
+    ]
+    return pd.DataFrame(rows).reindex(columns=columns)
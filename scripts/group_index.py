@@ -0,0 +1,147 @@
+import os
+import csv
+import json
+import logging
+
+# Flat taxon -> functional group lookup written by step 3 next to 03_grouped_species_assignments.json
+GROUP_INDEX_FILE = '03_group_index.csv'
+ASSIGNMENTS_FILE = '03_grouped_species_assignments.json'
+INDEX_COLUMNS = ['key', 'name', 'rank', 'group']
+
+# Keys of a species record rather than child taxa
+RECORD_KEYS = {'specCode', 'ecology', 'diet', 'taxonomy'}
+
+def normalize_key(name):
+    return str(name).strip().casefold()
+
+def is_species_record(node):
+    return isinstance(node, dict) and any(key in node for key in RECORD_KEYS)
+
+class GroupIndex:
+    """Every assigned taxon (species, genus and each rank in between) mapped to its functional group.
+
+    Rows are (key, name, rank, group) sorted by the case-folded key. A key found under more
+    than one group (homonyms) resolves to the group listed first in the assignments, as a
+    scan of the groups in order would.
+    """
+
+    def __init__(self, rows):
+        # Stable sort: rows of the same key keep the order of the groups
+        self.rows = sorted(rows, key=lambda row: row[0])
+        self._groups = {}
+        ambiguous = 0
+        for key, name, rank, group in self.rows:
+            if key not in self._groups:
+                self._groups[key] = (group, rank, name)
+            elif self._groups[key][0] != group:
+                ambiguous += 1
+        if ambiguous:
+            logging.warning(f"{ambiguous} taxa appear in more than one functional group; using the first")
+
+    @classmethod
+    def from_assignments(cls, assignments, taxonomy_tree=None, paths=None):
+        """Build the index from {group: {taxon: subtree}} as in 03_grouped_species_assignments.json.
+
+        With the step 3 TaxonomyTree (and the taxon paths of the assignment index) the rank of
+        every row is known; otherwise only species records get a rank.
+        """
+        rows = []
+        for group, taxa in assignments.items():
+            for taxon, subtree in taxa.items():
+                node = None
+                if taxonomy_tree is not None:
+                    path = (paths or {}).get(group, {}).get(taxon)
+                    node = taxonomy_tree.node_at(path) if path else None
+                    if node is None:
+                        candidates = taxonomy_tree.find(taxon)
+                        node = min(candidates, key=lambda n: len(taxonomy_tree.path_to_root(n))) if candidates else None
+                if node is not None:
+                    for n in [node] + list(taxonomy_tree.descendants(node)):
+                        name = taxonomy_tree.name(n)
+                        rows.append((normalize_key(name), name, taxonomy_tree.rank(n), group))
+                else:
+                    rows.extend(_subtree_rows(taxon, subtree, group))
+        return cls(rows)
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            return cls([(row['key'], row['name'], row['rank'], row['group']) for row in csv.DictReader(f)])
+
+    def save(self, file_path):
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(INDEX_COLUMNS)
+            writer.writerows(self.rows)
+        os.replace(tmp_path, file_path)
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __contains__(self, name):
+        return normalize_key(name) in self._groups
+
+    def get(self, name, default=None):
+        """Functional group of a taxon name at any rank (case-insensitive)"""
+        if not name:
+            return default
+        entry = self._groups.get(normalize_key(name))
+        return entry[0] if entry else default
+
+    def lookup_table(self):
+        """{case-folded key: group}, for vectorized lookups with Series.map"""
+        return {key: group for key, (group, _, _) in self._groups.items()}
+
+    def rank(self, name):
+        entry = self._groups.get(normalize_key(name))
+        return entry[1] if entry else None
+
+    def group_of_species(self, species_name):
+        """Group of a species, falling back to its genus (the first word of the name)"""
+        if not species_name:
+            return None
+        group = self.get(species_name)
+        if group is None:
+            genus = str(species_name).split()
+            group = self.get(genus[0]) if genus else None
+        return group
+
+    def groups(self):
+        return sorted({group for _, _, _, group in self.rows})
+
+    def species_to_group(self):
+        """{species name: group} for all species-level rows, as listed in the assignments"""
+        return {name: group for _, name, rank, group in self.rows if rank == 'Species'}
+
+def _subtree_rows(taxon, subtree, group):
+    """Rows for a taxon and everything below it, from the nested JSON alone"""
+    rows = []
+    stack = [(taxon, subtree)]
+    while stack:
+        name, node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        species = is_species_record(node)
+        rows.append((normalize_key(name), name, 'Species' if species else '', group))
+        if not species:
+            stack.extend(node.items())
+    return rows
+
+def load_group_index(output_dir, assignments=None):
+    """GroupIndex of a model directory.
+
+    Reads the 03_group_index.csv sidecar when it is at least as new as the assignments file,
+    and otherwise builds the index from the assignments (passed in, or read from disk).
+    """
+    index_file = os.path.join(output_dir, GROUP_INDEX_FILE)
+    assignments_file = os.path.join(output_dir, ASSIGNMENTS_FILE)
+    if os.path.exists(index_file) and (
+            not os.path.exists(assignments_file) or os.path.getmtime(index_file) >= os.path.getmtime(assignments_file)):
+        return GroupIndex.load(index_file)
+
+    if assignments is None:
+        with open(assignments_file, 'r', encoding='utf-8') as f:
+            assignments = json.load(f)
+    logging.info(f"No current {GROUP_INDEX_FILE} in {output_dir}; building the group index from the assignments")
+    return GroupIndex.from_assignments(assignments)
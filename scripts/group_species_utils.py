@@ -4,7 +4,14 @@ import re
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import requests
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from ask_AI import ask_ai
+from cache_utils import JsonCache, get_cache_path, make_cache_key
+from token_utils import count_tokens
+from taxonomy_tree import TaxonomyTree
+from geometry_utils import get_region_bounds
 
 # Optional import for EcoBase functionality
 try:
@@ -17,25 +24,8 @@ except ImportError:
 
 def get_geojson_extents(geojson_path):
     """Extract the maximum extents (bounding box) from a geojson file."""
-    with open(geojson_path, 'r') as f:
-        geojson = json.load(f)
-    
-    # Initialize min/max values
-    min_lon = float('inf')
-    max_lon = float('-inf')
-    min_lat = float('inf')
-    max_lat = float('-inf')
-    
-    # Process all features
-    for feature in geojson['features']:
-        if feature['geometry']['type'] == 'Polygon':
-            coordinates = feature['geometry']['coordinates'][0]  # First array contains exterior ring
-            for lon, lat in coordinates:
-                min_lon = min(min_lon, lon)
-                max_lon = max(max_lon, lon)
-                min_lat = min(min_lat, lat)
-                max_lat = max(max_lat, lat)
-    
+    # Covers every geometry type and ring; cached next to the file after the first call
+    min_lon, min_lat, max_lon, max_lat = get_region_bounds(geojson_path)
     return {
         'min_lon': min_lon,
         'max_lon': max_lon,
@@ -43,19 +33,43 @@ def get_geojson_extents(geojson_path):
         'max_lat': max_lat
     }
 
-def get_ai_reference_groups(geojson_path, ai_model='claude', researchFocus='', num_iterations=5):
+# Proposals and area descriptions of an unfinished step 0 run, so a failed synthesis does not redo them
+GROUP_PROPOSALS_FILE = 'ai_group_proposals.json'
+
+# Several models can write to the same output directory concurrently (validate_ai_groupings)
+_reference_groups_lock = threading.Lock()
+
+def propose_reference_groups(groups_prompt, ai_model, iteration, num_iterations):
+    """Ask for one proposed grouping; returns the parsed list or None"""
+    logging.info(f"Running iteration {iteration}/{num_iterations}")
+    groups_response = ask_ai(groups_prompt, ai_model)
+    if isinstance(groups_response, list) and len(groups_response) > 0:
+        groups_response = groups_response[0].text
+
+    # Extract JSON from the response
+    json_match = re.search(r'\[.*\]', groups_response, re.DOTALL)
+    if json_match:
+        json_str = json_match.group(0)
+        try:
+            return json.loads(json_str)
+        except json.JSONDecodeError as e:
+            logging.error(f"Error decoding JSON response in iteration {iteration}: {e}")
+    return None
+
+def generate_ai_reference_groups(geojson_path, ai_model='claude', researchFocus='', num_iterations=5, run_id=None):
     """Generate reference groups using AI based on the area defined in a geojson file.
     
-    Runs multiple iterations and synthesizes the results into a final grouping.
+    Runs the proposal iterations concurrently and synthesizes the results into a final
+    grouping. Proposals are cached per run_id (pass a new one for independent runs).
+    Returns (group_names, group_dict, area_description).
     """
     # Get the extents
     extents = get_geojson_extents(geojson_path)
     output_dir = os.path.dirname(geojson_path)
     os.makedirs(output_dir, exist_ok=True)
     
-    # Store all iteration results
-    all_groups = []
-    area_descriptions = []
+    proposals_cache = JsonCache(os.path.join(output_dir, GROUP_PROPOSALS_FILE))
+    run_key = make_cache_key('reference-groups', run_id, ai_model, extents, researchFocus)
     
     # First, get a description of the marine area
     area_prompt = f"""Given a marine area bounded by these coordinates:
@@ -74,12 +88,18 @@ Important:
 - Ensure each section is on its own line
 - Do not include any other text or formatting"""
 
-    area_description = ask_ai(area_prompt, ai_model)
-    if isinstance(area_description, list) and len(area_description) > 0:
-        area_description = area_description[0].text
+    area_key = make_cache_key(run_key, 'area')
+    area_description = proposals_cache.get(area_key)
+    if area_description is None:
+        area_description = ask_ai(area_prompt, ai_model)
+        if isinstance(area_description, list) and len(area_description) > 0:
+            area_description = area_description[0].text
+        proposals_cache.set(area_key, area_description)
+        with _reference_groups_lock:
+            proposals_cache.save()
         
-    # Store the description as a class attribute
-    get_ai_reference_groups.last_description = area_description
+    # Keep the full response for callers that report it
+    full_area_description = area_description
 
     # Load the expanded template as a reference
     try:
@@ -105,11 +125,8 @@ Important:
         if description_match:
             area_description = description_match.group(1).strip()
 
-    # Run multiple iterations of group generation
-    for i in range(num_iterations):
-        logging.info(f"Running iteration {i+1}/{num_iterations}")
-        
-        groups_prompt = f"""Based on this marine area:
+    # The proposals are independent, so all iterations are requested at once
+    groups_prompt = f"""Based on this marine area:
 Region: {region}
 Ecosystem Type: {ecosystem_type}
 Description: {area_description}
@@ -138,20 +155,30 @@ Aim to have 40 distinct groups and return the groups in this exact JSON format:
 
 The descriptions should explain the group's specific role in this {ecosystem_type} ecosystem."""
 
-        groups_response = ask_ai(groups_prompt, ai_model)
-        if isinstance(groups_response, list) and len(groups_response) > 0:
-            groups_response = groups_response[0].text
-
-        # Extract JSON from the response
-        json_match = re.search(r'\[.*\]', groups_response, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-            try:
-                groups = json.loads(json_str)
-                all_groups.append(groups)
-            except json.JSONDecodeError as e:
-                logging.error(f"Error decoding JSON response in iteration {i+1}: {e}")
-                continue
+    all_groups = []
+    proposal_keys = [make_cache_key(run_key, 'proposal', i) for i in range(num_iterations)]
+    pending = [i for i, key in enumerate(proposal_keys) if proposals_cache.get(key) is None]
+    if len(pending) < num_iterations:
+        logging.info(f"Reusing {num_iterations - len(pending)} cached group proposals")
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            futures = {i: executor.submit(propose_reference_groups, groups_prompt, ai_model, i + 1, num_iterations) for i in pending}
+            for i, future in futures.items():
+                try:
+                    groups = future.result()
+                except Exception as e:
+                    logging.error(f"Error generating groups in iteration {i+1}: {e}")
+                    continue
+                if groups is not None:
+                    proposals_cache.set(proposal_keys[i], groups)
+        with _reference_groups_lock:
+            proposals_cache.save()
+    for key in proposal_keys:
+        groups = proposals_cache.get(key)
+        if groups is not None:
+            all_groups.append(groups)
+    if not all_groups:
+        raise ValueError("No valid group proposals were generated")
 
     # Now synthesize the results
     synthesis_prompt = f"""I have {num_iterations} different proposed groupings for an EwE model of this marine ecosystem:
@@ -191,20 +218,25 @@ Return the final consensus grouping in the exact same JSON format as the input g
             try:
                 final_groups = json.loads(json_str)
                 
-                # Save the ecosystem description to ai_config.json
-                ai_config_path = os.path.join(output_dir, 'ai_config.json')
-                with open(ai_config_path, 'w') as f:
-                    json.dump({
-                        'ecosystemDescription': area_description,
-                        'groupSpeciesAI': ai_model,
-                        'iterations': num_iterations,
-                        'allGroupings': all_groups
-                    }, f, indent=2)
-
-                # Save the final groups to a file
-                output_path = os.path.join(output_dir, 'ai_reference_groups.json')
-                with open(output_path, 'w') as f:
-                    json.dump(final_groups, f, indent=2)
+                with _reference_groups_lock:
+                    # Save the ecosystem description to ai_config.json
+                    ai_config_path = os.path.join(output_dir, 'ai_config.json')
+                    with open(ai_config_path, 'w') as f:
+                        json.dump({
+                            'ecosystemDescription': area_description,
+                            'groupSpeciesAI': ai_model,
+                            'iterations': num_iterations,
+                            'allGroupings': all_groups
+                        }, f, indent=2)
+
+                    # Save the final groups to a file
+                    output_path = os.path.join(output_dir, 'ai_reference_groups.json')
+                    with open(output_path, 'w') as f:
+                        json.dump(final_groups, f, indent=2)
+
+                    # The run is complete, so the next one starts from fresh proposals
+                    proposals_cache.discard(proposal_keys + [area_key])
+                    proposals_cache.save()
                 
                 # Convert to the format expected by load_reference_groups
                 group_names = []
@@ -213,7 +245,7 @@ Return the final consensus grouping in the exact same JSON format as the input g
                     group_dict.update(item)
                     group_names.extend(item.keys())
                 
-                return group_names, group_dict
+                return group_names, group_dict, full_area_description
             except json.JSONDecodeError as e:
                 if attempt < max_synthesis_attempts - 1:
                     logging.warning(f"Error decoding synthesis response (attempt {attempt + 1}/{max_synthesis_attempts}): {e}. Retrying...")
@@ -228,6 +260,17 @@ Return the final consensus grouping in the exact same JSON format as the input g
             logging.error(f"Error in synthesis after all attempts: {str(e)}")
             raise
 
+def get_ai_reference_groups(geojson_path, ai_model='claude', researchFocus='', num_iterations=5, run_id=None):
+    """Generate reference groups using AI based on the area defined in a geojson file.
+    
+    Runs multiple iterations and synthesizes the results into a final grouping.
+    """
+    group_names, group_dict, area_description = generate_ai_reference_groups(
+        geojson_path, ai_model, researchFocus, num_iterations, run_id)
+    # Store the description as a class attribute
+    get_ai_reference_groups.last_description = area_description
+    return group_names, group_dict
+
 # Initialize the class attribute
 get_ai_reference_groups.last_description = None
 
@@ -375,23 +418,12 @@ def preprocess_data(data):
         cleaned_data.append(cleaned_item)
     return cleaned_data
 
+def build_taxonomy_tree(data):
+    """Compact array-backed taxonomy of the preprocessed species records"""
+    return TaxonomyTree.from_records(data)
+
 def create_hierarchical_json(data):
-    hierarchical = {}
-    for item in data:
-        current = hierarchical
-        for level in ['Kingdom', 'Phylum', 'Class', 'Order', 'Family', 'Genus', 'Species']:
-            if level in item and item[level] is not None and str(item[level]).lower() != 'nan':
-                value = str(item[level]).strip()
-                if value:  # Only process non-empty strings
-                    if value not in current:
-                        current[value] = {}
-                    current = current[value]
-        current['specCode'] = item.get('SpecCode', 'Unknown')
-        if 'Ecology' in item:
-            current['ecology'] = item['Ecology']
-        if 'diet' in item:
-            current['diet'] = item['diet']
-    return hierarchical
+    return build_taxonomy_tree(data).to_json()
 
 @retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=2, min=4, max=60), 
        retry=retry_if_exception_type((requests.exceptions.RequestException, json.JSONDecodeError, TypeError)))
@@ -421,22 +453,52 @@ Or "None" if no single taxonomic group applies."""
             return {"rank": rank.strip(), "name": name.strip()}
     return None
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=2, min=4, max=60), 
-       retry=retry_if_exception_type((requests.exceptions.RequestException, json.JSONDecodeError, TypeError)))
-def process_taxa_chunk(taxa_chunk, rank, reference_group_dict, research_focus, ai_model):
-    """Process a small chunk of taxa and return their assignments"""
-    logging.info(f"Starting to process chunk with taxa: {taxa_chunk}")
+# Group classifications are shared by every run and validation iteration using the same groups and model
+TAXONOMIC_CACHE_FILE = get_cache_path('taxonomic_classifications.json')
+TAXONOMY_WARMUP_WORKERS = 8
+
+_taxonomic_cache_lock = threading.Lock()
+
+def warm_taxonomic_cache(reference_group_dict, ai_model):
+    """Classify the reference groups once per process, before chunks are dispatched to workers.
+
+    Classifications are persisted keyed by (group name, description, model); only groups
+    missing from the on-disk cache are sent to the LLM, concurrently.
+    """
+    with _taxonomic_cache_lock:
+        if hasattr(process_taxa_chunk, 'taxonomic_cache'):
+            return
+        cache = JsonCache(TAXONOMIC_CACHE_FILE)
+        cache_keys = {group: make_cache_key(group, description, ai_model)
+                      for group, description in reference_group_dict.items()}
+        missing_groups = [group for group, key in cache_keys.items() if key not in cache]
+        logging.info(f"Taxonomic classifications: {len(cache_keys) - len(missing_groups)} cached, {len(missing_groups)} to request")
+
+        taxonomic_cache = {}
+        if missing_groups:
+            with ThreadPoolExecutor(max_workers=min(TAXONOMY_WARMUP_WORKERS, len(missing_groups))) as executor:
+                futures = {group: executor.submit(get_taxonomic_classification, group, ai_model) for group in missing_groups}
+                for group, future in futures.items():
+                    try:
+                        classification = future.result()
+                    except Exception as e:
+                        # Not cached, so the group is asked again on the next run
+                        logging.error(f"Failed to classify group '{group}': {str(e)}")
+                        taxonomic_cache[group] = None
+                        continue
+                    cache.set(cache_keys[group], classification)
+                    logging.info(f"Group '{group}' taxonomic classification: {classification}")
+            cache.save()
+
+        for group, key in cache_keys.items():
+            if group not in taxonomic_cache:
+                taxonomic_cache[group] = cache.get(key)
+        process_taxa_chunk.taxonomic_cache = taxonomic_cache
+
+def build_grouping_prompt(taxa_chunk, rank, reference_group_dict, research_focus):
+    """Build the prompt asking the AI to assign a chunk of taxa to functional groups"""
     newline = "\n"
 
-    # First, get taxonomic classifications for all groups if not already cached
-    if not hasattr(process_taxa_chunk, 'taxonomic_cache'):
-        process_taxa_chunk.taxonomic_cache = {}
-        for group in reference_group_dict.keys():
-            if group not in process_taxa_chunk.taxonomic_cache:
-                classification = get_taxonomic_classification(group, ai_model)
-                process_taxa_chunk.taxonomic_cache[group] = classification
-                logging.info(f"Group '{group}' taxonomic classification: {classification}")
-    
     research_focus_guidance = ""
     if research_focus:
         research_focus_guidance = f"""
@@ -477,6 +539,20 @@ Return only a JSON object with taxa as keys and assigned groups as values. Examp
     "Taxon2": "RESOLVE",
     "Taxon3": "Group2"
 }}"""
+    return prompt
+
+# Unparseable responses (usually truncated because the chunk was too large) are not retried
+# here; assign_taxa_lists asks again for the chunk's taxa with a smaller chunk size
+@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=2, min=4, max=60), 
+       retry=retry_if_exception_type((requests.exceptions.RequestException, TypeError)))
+def process_taxa_chunk(taxa_chunk, rank, reference_group_dict, research_focus, ai_model):
+    """Process a small chunk of taxa and return their assignments"""
+    logging.info(f"Starting to process chunk with taxa: {taxa_chunk}")
+
+    # First, get taxonomic classifications for all groups if not already cached
+    warm_taxonomic_cache(reference_group_dict, ai_model)
+    
+    prompt = build_grouping_prompt(taxa_chunk, rank, reference_group_dict, research_focus)
 
     try:
         logging.info("Sending request to AI model...")
@@ -511,54 +587,305 @@ Return only a JSON object with taxa as keys and assigned groups as values. Examp
         logging.error(f"Error type: {type(e)}")
         raise
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=2, min=4, max=60), 
-       retry=retry_if_exception_type((requests.exceptions.RequestException, json.JSONDecodeError, TypeError)))
-def assign_groups_with_retry(taxa, rank, reference_group_dict, is_leaf_level, research_focus=None, ai_model='claude'):
-    """Process taxa in chunks of 5 elements"""
-    # Filter out None and NaN values
+# Maximum number of LLM requests in flight (overridable with 'groupingWorkers' in ai_config.json)
+GROUPING_MAX_WORKERS = 4
+
+# Chunk sizes are derived from each model's token limits; the prompt may use this share of them
+MODEL_TOKEN_LIMITS = {
+    'claude': {'context': 200000, 'output': 8192},
+    'aws_claude': {'context': 200000, 'output': 8192},
+    'gemini': {'context': 1000000, 'output': 8192},
+    'gemma2': {'context': 8192, 'output': 4096},
+    'llama3': {'context': 128000, 'output': 32768},
+    'mixtral': {'context': 32768, 'output': 16384}
+}
+TOKEN_BUDGET_FRACTION = 0.5
+GROUPING_MIN_CHUNK_SIZE = 1
+GROUPING_INITIAL_CHUNK_SIZE = 10
+GROUPING_MAX_CHUNK_SIZE = 40  # Larger chunks save calls but the model starts skipping taxa
+GROUPING_MAX_ATTEMPTS = 3  # Times a taxon is asked for before it is left unassigned
+GROUPING_CHUNKS_PER_WORKER = 2  # Chunks per worker in each wave between chunk size adjustments
+
+def get_chunk_token_budget(taxa, rank, reference_group_dict, research_focus, ai_model):
+    """Largest number of taxa per prompt that fits the model's input and output limits"""
+    limits = MODEL_TOKEN_LIMITS.get(ai_model, {'context': 8192, 'output': 4096})
+    base_tokens = count_tokens(build_grouping_prompt([], rank, reference_group_dict, research_focus))
+    longest_group = max((count_tokens(group) for group in reference_group_dict), default=8)
+    taxon_tokens = max(count_tokens(str(taxon)) for taxon in taxa) + 1
+    # Each answer line is roughly '"Taxon": "Group",'
+    output_tokens_per_taxon = taxon_tokens + longest_group + 6
+
+    input_budget = int(limits['context'] * TOKEN_BUDGET_FRACTION) - base_tokens
+    output_budget = int(limits['output'] * TOKEN_BUDGET_FRACTION)
+    budget = min(input_budget // taxon_tokens, output_budget // output_tokens_per_taxon, GROUPING_MAX_CHUNK_SIZE)
+    return max(GROUPING_MIN_CHUNK_SIZE, budget)
+
+class AdaptiveChunkSizer:
+    """Chunk size that halves when a response cannot be parsed or skips taxa, and grows after clean responses.
+
+    A size that failed once is not tried again, so the size settles instead of oscillating.
+    """
+
+    def __init__(self, initial_size=GROUPING_INITIAL_CHUNK_SIZE):
+        self.size = initial_size
+        self.ceiling = GROUPING_MAX_CHUNK_SIZE
+        self._lock = threading.Lock()
+
+    def current(self, budget):
+        with self._lock:
+            return max(GROUPING_MIN_CHUNK_SIZE, min(self.size, budget))
+
+    def record(self, success, budget):
+        with self._lock:
+            if success:
+                self.size = min(budget, self.ceiling, max(self.size + 1, int(self.size * 1.5)))
+            else:
+                self.ceiling = max(GROUPING_MIN_CHUNK_SIZE, min(self.ceiling, self.size - 1))
+                self.size = max(GROUPING_MIN_CHUNK_SIZE, self.size // 2)
+
+# One sizer per model, so what is learned at one rank carries over to the next
+_chunk_sizers = {}
+_chunk_sizers_lock = threading.Lock()
+
+def get_chunk_sizer(ai_model):
+    with _chunk_sizers_lock:
+        if ai_model not in _chunk_sizers:
+            _chunk_sizers[ai_model] = AdaptiveChunkSizer()
+        return _chunk_sizers[ai_model]
+
+# Opt-in memo of earlier assignments, shared by all runs ('assignmentMemo' in ai_config.json):
+# 'always' reuses every answer, 'non_resolve' asks again for taxa that were RESOLVE, 'never' disables it
+ASSIGNMENT_MEMO_FILE = get_cache_path('assignment_memo.json')
+ASSIGNMENT_MEMO_POLICIES = ('always', 'non_resolve', 'never')
+
+_assignment_memo_cache = None
+_assignment_memo_lock = threading.Lock()
+
+class AssignmentMemo:
+    """Assignments keyed by (taxon, rank, reference group set, research focus, model)"""
+
+    def __init__(self, policy, reference_group_dict, research_focus, ai_model):
+        global _assignment_memo_cache
+        if policy not in ASSIGNMENT_MEMO_POLICIES:
+            raise ValueError(f"Unknown assignment memo policy '{policy}', expected one of {ASSIGNMENT_MEMO_POLICIES}")
+        self.policy = policy
+        self.research_focus = research_focus or ''
+        self.ai_model = ai_model
+        # Groups added during a run change the hash, so their answers are kept apart
+        self.groups_key = make_cache_key(sorted(reference_group_dict.items()))
+        with _assignment_memo_lock:
+            if _assignment_memo_cache is None and policy != 'never':
+                _assignment_memo_cache = JsonCache(ASSIGNMENT_MEMO_FILE)
+        self._cache = _assignment_memo_cache
+
+    @property
+    def enabled(self):
+        return self.policy != 'never'
+
+    def _key(self, taxon, rank):
+        return make_cache_key(str(taxon), rank, self.groups_key, self.research_focus, self.ai_model)
+
+    def lookup(self, taxon, rank):
+        if not self.enabled:
+            return None
+        assignment = self._cache.get(self._key(taxon, rank))
+        if assignment == 'RESOLVE' and self.policy == 'non_resolve':
+            return None
+        return assignment
+
+    def store(self, assignments, rank):
+        if self.enabled and assignments:
+            self._cache.update({self._key(taxon, rank): group for taxon, group in assignments.items()})
+
+    def save(self):
+        if self.enabled:
+            self._cache.save()
+
+def filter_valid_taxa(taxa):
+    """Filter out None and NaN values"""
     filtered_taxa = [t for t in taxa if t is not None and str(t).lower() != 'nan']
     if len(filtered_taxa) != len(taxa):
         logging.info(f"Filtered out {len(taxa) - len(filtered_taxa)} invalid taxa entries")
-    
-    if not filtered_taxa:
+    return filtered_taxa
+
+def dispatch_taxa_chunks(chunks, rank, reference_group_dict, research_focus, ai_model, max_workers=GROUPING_MAX_WORKERS, on_result=None):
+    """Run process_taxa_chunk for every chunk on a bounded worker pool.
+
+    Returns one (assignments, error) pair per chunk, in the order of chunks, so callers
+    merge results deterministically regardless of which request finishes first.
+    on_result(position, assignments) is called as soon as each chunk succeeds.
+    """
+    if not chunks:
+        return []
+    warm_taxonomic_cache(reference_group_dict, ai_model)
+
+    outcomes = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        futures = {executor.submit(process_taxa_chunk, chunk, rank, reference_group_dict, research_focus, ai_model): position
+                   for position, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            position = futures[future]
+            try:
+                chunk_assignments = future.result()
+                logging.info(f"Successfully processed chunk {position + 1} of {len(chunks)} with {len(chunk_assignments)} assignments")
+                outcomes[position] = (chunk_assignments, None)
+            except Exception as e:
+                logging.error(f"Error processing chunk {position + 1}: {str(e)}")
+                logging.error(f"Chunk content: {chunks[position]}")
+                outcomes[position] = (None, e)
+                continue
+            if on_result is not None:
+                on_result(position, chunk_assignments)
+    return outcomes
+
+def assign_taxa_lists(taxa_lists, rank, reference_group_dict, research_focus, ai_model, max_workers=GROUPING_MAX_WORKERS, memo=None, progress=None):
+    """Assign independent lists of taxa at one rank, with chunk sizes adapted to the model.
+
+    Chunks are dispatched in waves of a few per worker; the chunk size is adjusted after
+    each wave. Chunks never span two lists, and taxa a response skipped, or of a response
+    that could not be parsed, are queued again (up to GROUPING_MAX_ATTEMPTS times). Taxa found in the assignment memo are not sent.
+    progress (e.g. a WorkLogBatch) is told about every chunk sent and every answer kept.
+    Returns (assignments, errors), one entry per list in input order; errors holds the
+    exception of a list whose chunk failed.
+    """
+    taxa_lists = [filter_valid_taxa(taxa) for taxa in taxa_lists]
+    results = [{} for _ in taxa_lists]
+    errors = [None] * len(taxa_lists)
+    all_taxa = [taxon for taxa in taxa_lists for taxon in taxa]
+    if not all_taxa:
+        return results, errors
+
+    sizer = get_chunk_sizer(ai_model)
+    budget = get_chunk_token_budget(all_taxa, rank, reference_group_dict, research_focus, ai_model)
+    pending = [deque(taxa) for taxa in taxa_lists]
+    if memo is not None and memo.enabled:
+        memo_hits = 0
+        for index, taxa in enumerate(taxa_lists):
+            for taxon in taxa:
+                assignment = memo.lookup(taxon, rank)
+                if assignment is not None:
+                    results[index][taxon] = assignment
+                    memo_hits += 1
+            pending[index] = deque(taxon for taxon in taxa if taxon not in results[index])
+            if progress is not None:
+                progress.answered(index, dict(results[index]))
+        logging.info(f"Level {rank}: {memo_hits} of {len(all_taxa)} taxa answered from the assignment memo")
+    attempts = {}
+    total_calls = 0
+    unassigned = 0
+
+    while True:
+        chunk_size = sizer.current(budget)
+        chunk_owners = []
+        chunks = []
+        for index, queue in enumerate(pending):
+            if errors[index] is not None:
+                queue.clear()
+            while queue and len(chunks) < max_workers * GROUPING_CHUNKS_PER_WORKER:
+                chunk_owners.append(index)
+                chunks.append([queue.popleft() for _ in range(min(chunk_size, len(queue)))])
+        if not chunks:
+            break
+
+        logging.info(f"Level {rank}: dispatching {sum(len(c) for c in chunks)} taxa in {len(chunks)} calls "
+                     f"(chunk size {chunk_size}, token budget {budget})")
+        total_calls += len(chunks)
+        skipped = 0
+        parse_failures = 0
+        on_result = None
+        if progress is not None:
+            for index, chunk in zip(chunk_owners, chunks):
+                progress.dispatched(index, chunk)
+
+            # Logged as each response arrives, so a crash mid-wave keeps the chunks already answered
+            def on_result(position, chunk_assignments, chunks=chunks, chunk_owners=chunk_owners):
+                chunk = chunks[position]
+                progress.answered(chunk_owners[position], {t: chunk_assignments[t] for t in chunk if t in chunk_assignments})
+        outcomes = dispatch_taxa_chunks(chunks, rank, reference_group_dict, research_focus, ai_model, max_workers, on_result)
+        for index, chunk, (chunk_assignments, error) in zip(chunk_owners, chunks, outcomes):
+            if isinstance(error, json.JSONDecodeError):
+                # Ask again first, split at the smaller chunk size of the next wave
+                parse_failures += 1
+                requeued = []
+                for taxon in chunk:
+                    attempts[(index, taxon)] = attempts.get((index, taxon), 1) + 1
+                    if attempts[(index, taxon)] <= GROUPING_MAX_ATTEMPTS:
+                        requeued.append(taxon)
+                    else:
+                        unassigned += 1
+                pending[index].extendleft(reversed(requeued))
+                continue
+            if error is not None:
+                errors[index] = error
+                continue
+            # Only keep answers for taxa that were asked about
+            answers = {taxon: chunk_assignments[taxon] for taxon in chunk if taxon in chunk_assignments}
+            results[index].update(answers)
+            if memo is not None:
+                memo.store(answers, rank)
+            for taxon in chunk:
+                if taxon in chunk_assignments:
+                    continue
+                skipped += 1
+                attempts[(index, taxon)] = attempts.get((index, taxon), 1) + 1
+                if attempts[(index, taxon)] <= GROUPING_MAX_ATTEMPTS:
+                    pending[index].append(taxon)
+                else:
+                    unassigned += 1
+        if skipped:
+            logging.warning(f"Responses skipped {skipped} taxa; asking again with smaller chunks")
+        if parse_failures:
+            logging.warning(f"{parse_failures} responses could not be parsed; asking again with smaller chunks")
+        sizer.record(skipped == 0 and parse_failures == 0, budget)
+
+    if unassigned:
+        logging.warning(f"{unassigned} taxa at level {rank} left unassigned after {GROUPING_MAX_ATTEMPTS} attempts")
+    if memo is not None:
+        memo.save()
+    logging.info(f"Level {rank}: {len(all_taxa)} taxa processed with {total_calls} AI calls")
+    return results, errors
+
+@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=2, min=4, max=60), 
+       retry=retry_if_exception_type((requests.exceptions.RequestException, json.JSONDecodeError, TypeError)))
+def assign_groups_with_retry(taxa, rank, reference_group_dict, is_leaf_level, research_focus=None, ai_model='claude', max_workers=GROUPING_MAX_WORKERS):
+    """Process taxa in chunks sized from the model's token budget, dispatched concurrently"""
+    if not filter_valid_taxa(taxa):
         logging.warning("No valid taxa to process after filtering")
         return {}
     
-    chunk_size = 5
-    all_assignments = {}
-    
-    total_chunks = (len(filtered_taxa) + chunk_size - 1) // chunk_size
-    logging.info(f"Starting to process {len(filtered_taxa)} taxa in {total_chunks} chunks")
-    
-    # Process taxa in chunks
-    for i in range(0, len(filtered_taxa), chunk_size):
-        chunk = filtered_taxa[i:i + chunk_size]
-        chunk_num = i//chunk_size + 1
-        logging.info(f"Processing chunk {chunk_num} of {total_chunks} ({len(chunk)} taxa)")
-        
-        try:
-            chunk_assignments = process_taxa_chunk(chunk, rank, reference_group_dict, research_focus, ai_model)
-            logging.info(f"Successfully processed chunk {chunk_num} with {len(chunk_assignments)} assignments")
-            all_assignments.update(chunk_assignments)
-        except Exception as e:
-            logging.error(f"Error processing chunk {chunk_num}: {str(e)}")
-            logging.error(f"Chunk content: {chunk}")
-            raise
-    
-    return all_assignments
+    (assignments,), (error,) = assign_taxa_lists([taxa], rank, reference_group_dict, research_focus, ai_model, max_workers)
+    if error is not None:
+        raise error
+    return assignments
+
+def assign_groups_batch(taxa_lists, rank, reference_group_dict, is_leaf_level, research_focus=None, ai_model='claude', max_workers=GROUPING_MAX_WORKERS, memo=None, progress=None):
+    """Assign several independent lists of taxa at the same rank (e.g. sibling RESOLVE subtrees).
+
+    All chunks of all lists share one worker pool. Returns one assignment dict per list,
+    in input order, or None for a list with a failed chunk.
+    """
+    results, errors = assign_taxa_lists(taxa_lists, rank, reference_group_dict, research_focus, ai_model, max_workers, memo, progress)
+    return [None if error is not None else result for result, error in zip(results, errors)]
 
 # Replace the original assign_groups function with this new one
 assign_groups = assign_groups_with_retry
 
-def save_assignments(assignments, file_path):
+def save_assignments(assignments, file_path, species_data=None):
+    """Write assignments enriched with the complete species records.
+
+    Pass the already loaded species data to avoid re-reading 02_species_data.json.
+    """
     # Get the directory path to locate species data file
     output_dir = os.path.dirname(file_path)
     species_data_file = os.path.join(output_dir, "02_species_data.json")
     
     try:
         # Load the complete species data
-        with open(species_data_file, 'r') as f:
-            all_species_data = json.load(f)
+        if species_data is not None:
+            all_species_data = species_data
+        else:
+            with open(species_data_file, 'r') as f:
+                all_species_data = json.load(f)
         
         # Create new assignments with complete species data
         complete_assignments = {}
@@ -597,6 +924,121 @@ def save_assignments(assignments, file_path):
         with open(file_path, 'w') as f:
             json.dump(assignments, f, indent=2)
 
+# Compact record of step 3 progress: {'assignments'|'extra_groups': {group: {taxon: taxonomic path}}}
+ASSIGNMENT_INDEX_FILE = '03_assignment_index.json'
+
+def load_assignment_index(file_path):
+    index = {'assignments': {}, 'extra_groups': {}}
+    try:
+        with open(file_path, 'r') as f:
+            index.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    return index
+
+def save_assignment_index(index, file_path):
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, file_path)
+
+# Append-only log of step 3 work, one JSON event per line, that a restart replays
+WORK_LOG_FILE = '03_work_log.jsonl'
+
+class GroupingWorkLog:
+    """Step 3 work log: what was queued, sent and answered for each subtree.
+
+    Subtrees are identified by their taxon path. Events are 'pending' (taxa queued
+    under a path), 'in_flight' (a chunk of them sent), 'answered' (the validated
+    response for that chunk) and 'done' (the subtree's answers merged). Replaying
+    the log gives back every answer, so a restart only asks about taxa that were
+    never answered. A last line cut off by a crash is ignored.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.pending = {}
+        self.in_flight = {}
+        self.answers = {}
+        self.done = set()
+        self._file = None
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, start=1):
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning(f"Ignoring incomplete line {line_number} of {file_path}")
+                        continue
+                    self._apply(event)
+
+    def _apply(self, event):
+        path = tuple(event['path'])
+        if event['event'] == 'pending':
+            self.pending[path] = event['taxa']
+        elif event['event'] == 'in_flight':
+            self.in_flight.setdefault(path, set()).update(event['taxa'])
+        elif event['event'] == 'answered':
+            self.answers.setdefault(path, {}).update(event['response'])
+            self.in_flight.get(path, set()).difference_update(event['response'])
+        elif event['event'] == 'done':
+            self.done.add(path)
+
+    def _write(self, event):
+        self._apply(event)
+        if self._file is None:
+            self._file = open(self.file_path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(event, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def __len__(self):
+        return len(self.pending) + len(self.answers) + len(self.done)
+
+    def mark_pending(self, path, taxa):
+        # Replaying a subtree that is already logged must not grow the log
+        if tuple(path) not in self.done and self.pending.get(tuple(path)) != list(taxa):
+            self._write({'event': 'pending', 'path': list(path), 'taxa': list(taxa)})
+
+    def mark_in_flight(self, path, taxa):
+        self._write({'event': 'in_flight', 'path': list(path), 'taxa': list(taxa)})
+
+    def record_answers(self, path, answers):
+        if answers:
+            self._write({'event': 'answered', 'path': list(path), 'response': answers})
+
+    def mark_done(self, path):
+        if tuple(path) not in self.done:
+            self._write({'event': 'done', 'path': list(path)})
+
+    def answers_for(self, path):
+        return dict(self.answers.get(tuple(path), {}))
+
+    def summary(self):
+        unfinished = [path for path in self.pending if path not in self.done]
+        lost = sum(len(taxa) for taxa in self.in_flight.values())
+        return (f"{len(self.done)} subtrees done, {len(unfinished)} unfinished, "
+                f"{sum(len(a) for a in self.answers.values())} answers logged, {lost} taxa were in flight")
+
+    def batch(self, paths):
+        """Progress callbacks for assign_taxa_lists, mapping list positions to subtree paths"""
+        return WorkLogBatch(self, paths)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class WorkLogBatch:
+    def __init__(self, work_log, paths):
+        self.work_log = work_log
+        self.paths = paths
+
+    def dispatched(self, index, chunk):
+        self.work_log.mark_in_flight(self.paths[index], chunk)
+
+    def answered(self, index, answers):
+        self.work_log.record_answers(self.paths[index], answers)
+
 def load_assignments(file_path):
     try:
         with open(file_path, 'r') as f:
@@ -0,0 +1,51 @@
+import logging
+import threading
+from collections import Counter
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Command-line switch of the step scripts that turns on per-record detail
+VERBOSE_FLAG = '--verbose'
+
+# Occurrences of each per-record event that are logged before they are only counted
+DEFAULT_SAMPLE = 20
+
+def configure_logging(verbose=False):
+    """Root logging of a step script: INFO, or DEBUG for per-record detail"""
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format=LOG_FORMAT, force=True)
+
+def pop_verbose_flag(args):
+    """(args without --verbose, whether it was given)"""
+    return [arg for arg in args if arg != VERBOSE_FLAG], VERBOSE_FLAG in args
+
+class SampledEvents:
+    """Counts per-record events (a species, an interaction, an API response) and logs a sample.
+
+    The first `sample` occurrences of each event are logged at `level`, DEBUG by default so
+    they only appear with --verbose; later ones are only counted. summary() logs the counts
+    once at INFO. Messages use %-style arguments, so large payloads are never formatted
+    unless they are logged. Safe to share between threads.
+    """
+
+    def __init__(self, logger=None, sample=DEFAULT_SAMPLE, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger()
+        self.sample = sample
+        self.level = level
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, event, message=None, *args):
+        with self._lock:
+            self.counts[event] += 1
+            count = self.counts[event]
+        if message is None or count > self.sample or not self.logger.isEnabledFor(self.level):
+            return
+        self.logger.log(self.level, message, *args)
+        if count == self.sample:
+            self.logger.log(self.level, "Further '%s' events are only counted", event)
+
+    def summary(self, title):
+        with self._lock:
+            counts = list(self.counts.items())
+        if counts:
+            self.logger.info("%s: %s", title, ", ".join(f"{count} {event}" for event, count in counts))
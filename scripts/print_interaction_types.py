@@ -1,20 +1,19 @@
 import json
 from collections import Counter
+from globi_store import has_globi_dataset, read_globi_interactions, inline_interactions_frame
 
-# Load the species data
-with open('MODELS/Saleh_Bay/02_species_data.json', 'r') as f:
-    species_data = json.load(f)
+MODEL_DIR = 'MODELS/Saleh_Bay'
 
-# Collect all interaction types
-interaction_types = Counter()
+# GLOBI interactions live in the Parquet dataset; older models keep them inline in the species data
+if has_globi_dataset(MODEL_DIR):
+    interactions = read_globi_interactions(MODEL_DIR, columns=['interactionTypeName'])
+else:
+    with open(f'{MODEL_DIR}/02_species_data.json', 'r') as f:
+        species_data = json.load(f)
+    interactions = inline_interactions_frame(species_data, columns=['interactionTypeName'])
 
-# Go through each species
-for species, data in species_data.items():
-    if 'diet' in data and 'GLOBI' in data['diet']:
-        if 'interactions' in data['diet']['GLOBI']:
-            for interaction in data['diet']['GLOBI']['interactions']:
-                if 'interactionTypeName' in interaction:
-                    interaction_types[interaction['interactionTypeName']] += 1
+# Collect all interaction types
+interaction_types = Counter(interactions['interactionTypeName'].dropna().astype(str))
 
 # Print results
 print("\nInteraction types and their counts:")
@@ -0,0 +1,69 @@
+import os
+import json
+from diet_data_utils import species_names_in, get_group_index
+from group_index import GroupIndex, load_group_index, ASSIGNMENTS_FILE
+
+class RunContext:
+    """Grouped species data of one model, loaded once and shared by everything in a step.
+
+    Replaces passing the assignments around and re-deriving things from them, such as
+    extract_species_names(json.dumps(group)), which serialized and parsed every group
+    subtree. Species lists, spec codes and taxonomy paths are worked out in one walk per
+    group on first use and kept; the group index is loaded once. The grouped species data
+    must not be modified after the context is created.
+    """
+
+    def __init__(self, grouped_species_data, output_dir=None, group_index=None):
+        self.grouped_species_data = grouped_species_data
+        self.output_dir = output_dir
+        self._group_index = group_index
+        self._species = {}
+        self._spec_codes = {}
+        self._paths = {}
+
+    @classmethod
+    def load(cls, output_dir, assignments_file=None):
+        """Context of a model directory, from 03_grouped_species_assignments.json (or assignments_file)"""
+        assignments_file = assignments_file or os.path.join(output_dir, ASSIGNMENTS_FILE)
+        with open(assignments_file, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), output_dir)
+
+    @property
+    def groups(self):
+        return list(self.grouped_species_data.keys())
+
+    def _walk(self, group):
+        if group not in self._species:
+            spec_codes, paths = {}, {}
+            self._species[group] = species_names_in(self.grouped_species_data[group], spec_codes, paths)
+            self._spec_codes[group] = spec_codes
+            self._paths[group] = paths
+
+    def species(self, group):
+        """Species names of a group, as extract_species_names returns them"""
+        self._walk(group)
+        return self._species[group]
+
+    def spec_codes(self, group):
+        """{species: specCode} of the species records of a group"""
+        self._walk(group)
+        return self._spec_codes[group]
+
+    def spec_code(self, group, species_name):
+        return self.spec_codes(group).get(species_name)
+
+    def taxon_path(self, group, species_name):
+        """Keys from the group down to a species record, or None"""
+        self._walk(group)
+        return self._paths[group].get(species_name)
+
+    @property
+    def group_index(self):
+        """GroupIndex of the assignments (the step 3 sidecar when current), also used by find_functional_group"""
+        if self._group_index is None:
+            if self.output_dir is not None:
+                self._group_index = load_group_index(self.output_dir, self.grouped_species_data)
+            else:
+                self._group_index = GroupIndex.from_assignments(self.grouped_species_data)
+        get_group_index(self.grouped_species_data, self._group_index)
+        return self._group_index
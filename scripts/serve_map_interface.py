@@ -1,6 +1,7 @@
 import http.server
 import socketserver
 import os
+import sys
 import json
 import cgi
 import shutil
@@ -10,16 +11,34 @@ import tempfile
 import zipfile
 import requests
 
+# Importable both as scripts.serve_map_interface (from main.py) and as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.geometry_utils import cache_region, simplify_geojson
+
 PORT = 8000
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def shapefile_to_geojson(shapefile_path, geojson_path):
+def shapefile_to_geojson(shapefile_path, geojson_path, simplify_tolerance=None):
+    """Convert a shapefile to WGS84 GeoJSON and cache its bounds and simplified copy.
+
+    With simplify_tolerance (degrees) the stored GeoJSON itself is simplified.
+    """
     try:
         gdf = gpd.read_file(shapefile_path)
+        if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+            gdf = gdf.to_crs(epsg=4326)
         gdf.to_file(geojson_path, driver='GeoJSON')
-        logger.info(f"Converted shapefile to GeoJSON: {geojson_path}")
+        if simplify_tolerance:
+            with open(geojson_path, 'r', encoding='utf-8') as f:
+                geojson = json.load(f)
+            with open(geojson_path, 'w', encoding='utf-8') as f:
+                json.dump(simplify_geojson(geojson, simplify_tolerance), f)
+        summary = cache_region(geojson_path)
+        logger.info(f"Converted shapefile to GeoJSON: {geojson_path} "
+                    f"({summary['vertices']} vertices, {summary.get('simplified_vertices', summary['vertices'])} after simplification)")
         return True
     except Exception as e:
         logger.error(f"Error converting shapefile to GeoJSON: {str(e)}")
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+# Taxonomic ranks from most specific to most general, as columns of the OBIS species list
+RANK_COLUMNS = ['scientificName', 'genus', 'family', 'order', 'class', 'phylum', 'kingdom']
+
+SPECIES_RANK = 1
+GENUS_RANK = 2
+UNKNOWN_RANK = len(RANK_COLUMNS) + 1
+
+def _filled(values):
+    return values.notna() & (values.astype('string') != '')
+
+def resolve_ranks(species_df):
+    """Return the most specific rank of every record as a 1-based position in RANK_COLUMNS.
+
+    A scientificName equal to one of the higher ranks takes that rank; otherwise
+    two-word names are species and one-word names are genera. Records without a
+    usable name fall back to their most specific filled rank column. Missing
+    taxonomy columns are treated as empty.
+    """
+    columns = {
+        rank: species_df[rank] if rank in species_df.columns else pd.Series(pd.NA, index=species_df.index, dtype='object')
+        for rank in RANK_COLUMNS
+    }
+    names = columns['scientificName'].astype('string')
+    has_name = _filled(names).fillna(False).to_numpy(dtype=bool)
+    word_count = (names.str.count(' ') + 1).fillna(0).to_numpy()
+
+    # np.select picks the first matching condition, mirroring the order of the checks
+    conditions = []
+    choices = []
+    for position, rank in enumerate(RANK_COLUMNS[1:], start=2):
+        matches = (names == columns[rank].astype('string')).fillna(False).to_numpy(dtype=bool)
+        conditions.append(has_name & matches)
+        choices.append(position)
+    conditions += [has_name & (word_count == 2), has_name & (word_count == 1)]
+    choices += [SPECIES_RANK, GENUS_RANK]
+    for position, rank in enumerate(RANK_COLUMNS, start=1):
+        conditions.append(_filled(columns[rank]).fillna(False).to_numpy(dtype=bool))
+        choices.append(position)
+
+    return pd.Series(np.select(conditions, choices, default=UNKNOWN_RANK), index=species_df.index)
+
+def species_level_mask(species_df):
+    """Boolean mask of species-level records"""
+    return resolve_ranks(species_df) == SPECIES_RANK
+
+def species_or_orphan_genus_mask(species_df):
+    """Keep species-level records, plus higher-level records of genera with no species in the list"""
+    species_level = species_level_mask(species_df)
+    genera = species_df['scientificName'].astype('string').str.split(' ', n=1).str[0]
+    genera_with_species = genera[species_level].unique()
+    return species_level | ~genera.isin(genera_with_species)
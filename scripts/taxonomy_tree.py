@@ -0,0 +1,181 @@
+from array import array
+
+TAXONOMIC_RANKS = ['Kingdom', 'Phylum', 'Class', 'Order', 'Family', 'Genus', 'Species']
+
+# Keys create_hierarchical_json stores on the node a species record ends at
+PAYLOAD_KEYS = ['specCode', 'ecology', 'diet']
+
+ROOT = 0
+
+class TaxonomyTree:
+    """Taxonomy hierarchy stored as flat arrays instead of nested dicts.
+
+    Node names are interned, each node keeps its parent, rank and payload id in
+    parallel arrays, and species payloads (specCode, ecology, diet) are stored
+    out-of-line. Nodes are identified by integer ids; node 0 is the root.
+    Subtree queries use a preorder numbering, so they cost O(subtree).
+    """
+
+    def __init__(self):
+        self._names = ['']
+        self._name_ids = {'': 0}
+        self.name_ids = array('l', [0])
+        self.parents = array('l', [-1])
+        self.ranks = array('b', [-1])
+        self.payload_ids = array('l', [-1])
+        self._payloads = []
+        self._children = [[]]
+        self._child_lookup = {}
+        self._nodes_by_name = {}
+        self.nodes_by_rank = [[] for _ in TAXONOMIC_RANKS]
+        self._preorder = None
+        self._preorder_position = None
+        self._subtree_end = None
+
+    @classmethod
+    def from_records(cls, records):
+        """Build the tree from preprocess_data records ({rank: name, ..., 'Ecology', 'diet'})"""
+        tree = cls()
+        for record in records:
+            tree.add_record(record)
+        return tree
+
+    def __len__(self):
+        return len(self.parents) - 1
+
+    def _intern(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = name_id
+        return name_id
+
+    def add_child(self, parent, name, rank):
+        """Return the child of parent called name, creating it at rank if needed"""
+        name_id = self._intern(name)
+        node = self._child_lookup.get((parent, name_id))
+        if node is not None:
+            return node
+        node = len(self.parents)
+        self.name_ids.append(name_id)
+        self.parents.append(parent)
+        self.ranks.append(TAXONOMIC_RANKS.index(rank))
+        self.payload_ids.append(-1)
+        self._children.append([])
+        self._children[parent].append(node)
+        self._child_lookup[(parent, name_id)] = node
+        self._nodes_by_name.setdefault(name_id, []).append(node)
+        self.nodes_by_rank[self.ranks[node]].append(node)
+        self._preorder = None
+        return node
+
+    def add_record(self, record):
+        """Add one species record, skipping missing ranks as create_hierarchical_json does"""
+        node = ROOT
+        for rank in TAXONOMIC_RANKS:
+            value = record.get(rank)
+            if value is None or str(value).lower() == 'nan':
+                continue
+            value = str(value).strip()
+            if value:
+                node = self.add_child(node, value, rank)
+
+        payload = {'specCode': record.get('SpecCode', 'Unknown')}
+        if 'Ecology' in record:
+            payload['ecology'] = record['Ecology']
+        if 'diet' in record:
+            payload['diet'] = record['diet']
+        self.set_payload(node, payload)
+        return node
+
+    def set_payload(self, node, payload):
+        payload_id = self.payload_ids[node]
+        if payload_id < 0:
+            self.payload_ids[node] = len(self._payloads)
+            self._payloads.append(dict(payload))
+        else:
+            self._payloads[payload_id].update(payload)
+
+    def payload(self, node):
+        payload_id = self.payload_ids[node]
+        return self._payloads[payload_id] if payload_id >= 0 else None
+
+    def name(self, node):
+        return self._names[self.name_ids[node]]
+
+    def rank(self, node):
+        return TAXONOMIC_RANKS[self.ranks[node]] if node != ROOT else None
+
+    def children(self, node=ROOT):
+        return list(self._children[node])
+
+    def find(self, name, rank=None):
+        """All nodes called name, optionally only those at rank"""
+        nodes = self._nodes_by_name.get(self._name_ids.get(name), [])
+        if rank is None:
+            return list(nodes)
+        rank_index = TAXONOMIC_RANKS.index(rank)
+        return [node for node in nodes if self.ranks[node] == rank_index]
+
+    def node_at(self, path):
+        """Node reached by following path (names from the top rank down), or None"""
+        node = ROOT
+        for name in path:
+            node = self._child_lookup.get((node, self._name_ids.get(name)))
+            if node is None:
+                return None
+        return node
+
+    def path_to_root(self, node):
+        """Names from the top rank down to node, i.e. the keys leading to it in the JSON shape"""
+        path = []
+        while node != ROOT:
+            path.append(self.name(node))
+            node = self.parents[node]
+        return path[::-1]
+
+    def _ensure_preorder(self):
+        if self._preorder is not None:
+            return
+        preorder = array('l')
+        position = array('l', [0]) * len(self.parents)
+        subtree_end = array('l', [0]) * len(self.parents)
+        # Iterative DFS; a node's subtree ends once its last descendant has been numbered
+        stack = [(ROOT, False)]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                subtree_end[node] = len(preorder)
+                continue
+            position[node] = len(preorder)
+            preorder.append(node)
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(self._children[node]))
+        self._preorder = preorder
+        self._preorder_position = position
+        self._subtree_end = subtree_end
+
+    def descendants(self, node=ROOT):
+        """Nodes below node in preorder"""
+        self._ensure_preorder()
+        return self._preorder[self._preorder_position[node] + 1:self._subtree_end[node]]
+
+    def children_at_rank(self, node, rank):
+        """Descendants of node at rank, skipping over ranks missing in between"""
+        rank_index = TAXONOMIC_RANKS.index(rank)
+        return [descendant for descendant in self.descendants(node) if self.ranks[descendant] == rank_index]
+
+    def species_under(self, node=ROOT):
+        """Names of all species below (or at) node"""
+        species_rank = TAXONOMIC_RANKS.index('Species')
+        nodes = ([node] if node != ROOT and self.ranks[node] == species_rank else []) + list(self.descendants(node))
+        return [self.name(n) for n in nodes if self.ranks[n] == species_rank]
+
+    def to_json(self, node=ROOT):
+        """Nested dict in the shape create_hierarchical_json has always produced"""
+        result = {self.name(child): self.to_json(child) for child in self._children[node]}
+        payload = self.payload(node)
+        if payload:
+            result.update(payload)
+        return result
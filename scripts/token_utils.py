@@ -0,0 +1,40 @@
+import functools
+
+# Rough size of a token for English text and tables, used when tiktoken is not available
+CHARS_PER_TOKEN = 4
+
+# Appended to text cut short by truncate_to_tokens
+TRUNCATED = ' [...]'
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def count_tokens(text):
+    """Approximate token count (cl100k encoding, or ~4 characters per token without tiktoken)"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        try:
+            return len(encoding.encode(text))
+        except Exception:
+            pass
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def truncate_to_tokens(text, max_tokens):
+    """text cut at a word boundary so that it fits max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    while True:
+        cut = text[:max(0, max_chars - len(TRUNCATED))]
+        if ' ' in cut:
+            cut = cut[:cut.rfind(' ')]
+        tokens = count_tokens(cut + TRUNCATED)
+        if tokens <= max_tokens or not cut:
+            return cut + TRUNCATED
+        # Shrink in proportion to the overshoot; always by at least one character
+        max_chars = min(len(cut) - 1, len(cut) * max_tokens // tokens) + len(TRUNCATED)
@@ -9,13 +9,19 @@ import matplotlib.pyplot as plt
 import geopandas as gpd
 import tempfile
 import zipfile
-from group_species_utils import get_ai_reference_groups
+from concurrent.futures import ThreadPoolExecutor
+from group_species_utils import generate_ai_reference_groups
+from geometry_utils import cache_region
 
 def shapefile_to_geojson(shapefile_path, geojson_path):
     """Convert shapefile to GeoJSON format."""
     try:
         gdf = gpd.read_file(shapefile_path)
+        if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+            gdf = gdf.to_crs(epsg=4326)
         gdf.to_file(geojson_path, driver='GeoJSON')
+        # Every iteration reads the extents; compute them once for all models
+        cache_region(geojson_path)
         return True
     except Exception as e:
         print(f"Error converting shapefile to GeoJSON: {str(e)}")
@@ -59,28 +65,41 @@ def run_iterations(zip_path, output_dir, research_focus, n_iterations=5, ai_mode
         print("Failed to convert shapefile to GeoJSON")
         return None, None, None
     
-    # Run iterations for each AI model
-    for ai_model in ai_models:
+    def run_model_iterations(ai_model):
+        model_results = []
+        model_descriptions = []
         print(f"\nRunning {n_iterations} iterations with {ai_model}...")
         for i in range(n_iterations):
-            print(f"Iteration {i+1}/{n_iterations}")
+            print(f"Iteration {i+1}/{n_iterations} ({ai_model})")
             try:
-                group_names, group_dict = get_ai_reference_groups(geojson_path, ai_model, research_focus)
+                # Each iteration is an independent run, so it must not reuse another's proposals
+                group_names, group_dict, description = generate_ai_reference_groups(
+                    geojson_path, ai_model, research_focus, run_id=f"{timestamp}-{ai_model}-{i+1}")
                 
                 # Save the ecosystem description from the AI's first response
-                if hasattr(get_ai_reference_groups, 'last_description'):
-                    ecosystem_descriptions[ai_model].append({
-                        'iteration': i+1,
-                        'description': get_ai_reference_groups.last_description
-                    })
+                model_descriptions.append({
+                    'iteration': i+1,
+                    'description': description
+                })
                 
-                results[ai_model].append({
+                model_results.append({
                     'iteration': i+1,
                     'groups': group_dict
                 })
             except Exception as e:
                 print(f"Error in iteration {i+1} with {ai_model}: {e}")
                 continue
+        return model_results, model_descriptions
+    
+    # Run the models concurrently; results are collected in model order
+    with ThreadPoolExecutor(max_workers=len(ai_models)) as executor:
+        futures = [(ai_model, executor.submit(run_model_iterations, ai_model)) for ai_model in ai_models]
+        for ai_model, future in futures:
+            model_results, model_descriptions = future.result()
+            if model_results:
+                results[ai_model].extend(model_results)
+            if model_descriptions:
+                ecosystem_descriptions[ai_model].extend(model_descriptions)
     
     return results, ecosystem_descriptions, report_dir
 